@@ -0,0 +1,111 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: common.py
+
+"""
+Helpers shared by the benchmarks
+"""
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+import time
+
+from spotifylib import Token, TokenStore
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+
+class StaticTokenStore(TokenStore):
+    """
+    Token store always holding a valid token so no login takes place
+    """
+
+    def load(self, key):
+        """
+        Returns a token issued now
+
+        :param key: string
+        :return: Token namedtuple
+        """
+        return Token('token', 'Bearer', 3600, 'refresh', 'scope', time.time())
+
+    def save(self, key, token):
+        """
+        Ignores the token
+
+        :param key: string
+        :param token: Token namedtuple
+        :return: True
+        """
+        return True
+
+    def delete(self, key):
+        """
+        Keeps the token
+
+        :param key: string
+        :return: True
+        """
+        return True
+
+
+class CannedAdapter(BaseAdapter):
+    """
+    Transport adapter answering every request with the same document
+
+    Nothing leaves the process, so whatever time a request takes is spent in
+    the library and in requests.
+    """
+
+    def send(self, request, **kwargs):
+        """
+        Answers a request with the document
+
+        :param request: PreparedRequest instance
+        :param kwargs: transport arguments of requests, ignored
+        :return: Response instance
+        """
+        response = Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        response._content = '{"id": "user"}'
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        """
+        Holds no connections to close
+
+        :return: None
+        """
+        pass
+
+
+def summarize(samples):
+    """
+    Summarizes timings in milliseconds
+
+    :param samples: list of floats with seconds
+    :return: dictionary with the count, mean, minimum, median, 95th percentile
+    and maximum
+    """
+    ordered = sorted(samples)
+    count = len(ordered)
+
+    def percentile(value):
+        return ordered[min(count - 1, int(round(value / 100.0 * (count - 1))))] * 1000
+
+    return {'count': count,
+            'mean_ms': round(sum(ordered) / count * 1000, 3),
+            'min_ms': round(ordered[0] * 1000, 3),
+            'p50_ms': round(percentile(50), 3),
+            'p95_ms': round(percentile(95), 3),
+            'max_ms': round(ordered[-1] * 1000, 3)}
@@ -0,0 +1,92 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: compare.py
+
+"""
+Compares two result files of benchmarks.suite
+
+The medians, 95th percentiles and throughputs of both runs are printed side
+by side with their change, and the ones worse than the threshold are flagged
+as regressions, making the command fail so it can gate a release.
+
+Usage:
+    python -m benchmarks.compare baseline.json results.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# Measurements compared, with whether a higher value is better
+MEASUREMENTS = {'p50_ms': False, 'p95_ms': False, 'requests_per_second': True}
+
+
+def flatten(results, prefix=''):
+    """
+    Lists the compared measurements of a result file by their path
+
+    :param results: dictionary with the results of the suite
+    :param prefix: string with the path of the results
+    :return: dictionary with the values of the measurements by their path
+    """
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, '{}{}.'.format(prefix, key)))
+        elif isinstance(value, list):
+            for entry in value:
+                values.update(flatten(entry, '{}{}[threads={}].'.format(prefix, key, entry['threads'])))
+        elif key in MEASUREMENTS:
+            values['{}{}'.format(prefix, key)] = value
+    return values
+
+
+def compare(baseline, results, threshold):
+    """
+    Compares the measurements present in both results
+
+    :param baseline: dictionary with the results of the suite to compare to
+    :param results: dictionary with the results of the suite
+    :param threshold: float with the percentage a measurement can get worse
+    :return: list of tuples with the path, both values, the change as a
+    percentage and whether it is a regression
+    """
+    old, new = flatten(baseline), flatten(results)
+    rows = []
+    for path in sorted(set(old) & set(new)):
+        change = (new[path] - old[path]) * 100.0 / old[path] if old[path] else 0.0
+        worse = -change if MEASUREMENTS[path.rpartition('.')[2]] else change
+        rows.append((path, old[path], new[path], change, worse > threshold))
+    return rows
+
+
+def main():
+    """
+    Prints the changes between two result files
+
+    Exits with 1 when a measurement regressed over the threshold, 0 otherwise.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Compares two result files of the benchmark suite')
+    parser.add_argument('baseline')
+    parser.add_argument('results')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='percentage a measurement can get worse before being a regression')
+    arguments = parser.parse_args()
+    with open(arguments.baseline) as baseline, open(arguments.results) as results:
+        baseline, results = json.load(baseline), json.load(results)
+    print('{} {} -> {} {}'.format(baseline['version'], baseline['timestamp'], results['version'], results['timestamp']))
+    rows = compare(baseline['results'], results['results'], arguments.threshold)
+    for path, old, new, change, regression in rows:
+        print('{:<52}{:>12}{:>12}{:>+9.1f}%{}'.format(path, old, new, change, '  REGRESSION' if regression else ''))
+    sys.exit(1 if any(row[-1] for row in rows) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: overhead.py
+
+"""
+Per request overhead of the request pipeline of the authenticated session
+
+Requests are answered in process by a canned adapter, so the time measured is
+the cost of the session alone: a plain requests session first, then the
+authenticated session with its default middleware and with the optional
+layers stacked on it.
+
+Usage:
+    python -m benchmarks.overhead --requests 2000 --rounds 10
+"""
+
+import argparse
+import logging
+import time
+
+from spotifylib import Spotify, ResponseCache, AdaptiveLimiter, API_SITE
+from requests import Session
+from benchmarks.common import StaticTokenStore, CannedAdapter
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+
+def measure(session, requests, rounds):
+    """
+    Sends the requests one after the other through a session, several times
+
+    Every request has its own URL so none is coalesced or served from cache.
+    As with timeit, the fastest round is the one telling the cost, the others
+    being slowed down by whatever else ran on the machine.
+
+    :param session: Session instance
+    :param requests: integer with the requests to send per round
+    :param rounds: integer with the rounds to run
+    :return: float with the microseconds per request of the fastest round
+    """
+    headers = {'Authorization': 'Bearer token'}
+    best = None
+    for round_ in range(rounds):
+        urls = ['{site}/v1/tracks/{round}/{index}'.format(site=API_SITE, round=round_, index=index)
+                for index in range(requests)]
+        start = time.time()
+        for url in urls:
+            session.request('GET', url, headers=dict(headers))
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000000 / requests
+
+
+def create_session(**options):
+    """
+    Creates the session of a new client answering through a canned adapter
+
+    :param options: keyword arguments of SpotifyAuthenticator
+    :return: SpotifySession instance
+    """
+    spotify = Spotify('client', 'secret', 'user', 'password', 'http://localhost/callback', 'scope',
+                      token_store=StaticTokenStore(), **options)
+    session = spotify.authenticator.session
+    session.mount('{}/'.format(API_SITE), CannedAdapter())
+    return session
+
+
+def main():
+    """
+    Measures every session setting and prints its cost over a plain session
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Per request overhead of the authenticated session')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=10)
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    plain = Session()
+    plain.mount(API_SITE, CannedAdapter())
+    scenarios = [('requests session', plain),
+                 ('authenticated session', create_session()),
+                 ('with response cache', create_session(response_cache=ResponseCache())),
+                 ('with adaptive limiter', create_session(concurrency_limiter=AdaptiveLimiter()))]
+    baseline = None
+    print('{:<24}{:>14}{:>14}'.format('scenario', 'us/request', 'overhead us'))
+    for name, session in scenarios:
+        cost = measure(session, arguments.requests, arguments.rounds)
+        baseline = cost if baseline is None else baseline
+        print('{:<24}{:>14.1f}{:>14.1f}'.format(name, cost, cost - baseline))
+
+
+if __name__ == '__main__':
+    main()
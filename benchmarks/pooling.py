@@ -0,0 +1,211 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: pooling.py
+
+"""
+Connection reuse of the authenticated session under concurrency
+
+Many threads send distinct API requests, so none of them are coalesced,
+through a single client to a local TLS stub, once for every pool setting, and
+the stub counts the TLS connections it accepted. Without keep-alive every
+request pays for a handshake and with non blocking pools the requests above
+the pool size do, while a blocking pool sized to the threads serves them all
+with as many connections as threads.
+
+Usage:
+    python -m benchmarks.pooling --threads 32 --requests 2000
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+from spotifylib import Spotify, map_concurrently
+from benchmarks.common import StaticTokenStore
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with the same small document over HTTP/1.1
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        """
+        Keeps the requests out of the output of the benchmark
+
+        :param args: format and its arguments
+        :return: None
+        """
+        pass
+
+    def do_GET(self):
+        """
+        Answers with the document, keeping the connection open
+
+        :return: None
+        """
+        content = json.dumps({'id': 'user'})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class TLSStubServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTPS server counting the connections it accepts
+
+    The handshake runs in the thread of the connection so slow handshakes do
+    not hold back the accepting loop.
+    """
+    daemon_threads = True
+
+    def __init__(self, certificate, key):
+        """
+        Initialises the server on a free port of localhost
+
+        :param certificate: string with the path of the certificate
+        :param key: string with the path of the key
+        """
+        HTTPServer.__init__(self, ('localhost', 0), StubHandler)
+        self.context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        self.context.load_cert_chain(certificate, key)
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def get_request(self):
+        """
+        Accepts and counts a connection, leaving its handshake to its thread
+
+        :return: tuple with the wrapped socket and the address of the client
+        """
+        connection, address = self.socket.accept()
+        with self.lock:
+            self.connections += 1
+        return self.context.wrap_socket(connection, server_side=True, do_handshake_on_connect=False), address
+
+    def finish_request(self, request, client_address):
+        """
+        Completes the handshake and serves the connection
+
+        Connections failing the handshake are closed without a reply.
+
+        :param request: SSLSocket instance
+        :param client_address: tuple with the host and port of the client
+        :return: None
+        """
+        try:
+            request.do_handshake()
+        except (ssl.SSLError, IOError):
+            return
+        HTTPServer.finish_request(self, request, client_address)
+
+    def handle_error(self, request, client_address):
+        """
+        Ignores the connections the clients drop
+
+        :param request: SSLSocket instance
+        :param client_address: tuple with the host and port of the client
+        :return: None
+        """
+        pass
+
+
+def create_certificate(directory):
+    """
+    Creates a self signed certificate for localhost with openssl
+
+    :param directory: string with the directory to write the files to
+    :return: tuple with the paths of the certificate and the key
+    """
+    certificate = os.path.join(directory, 'certificate.pem')
+    key = os.path.join(directory, 'key.pem')
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                               '-keyout', key, '-out', certificate, '-days', '1',
+                               '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost'],
+                              stdout=devnull, stderr=devnull)
+    return certificate, key
+
+
+def run(server, certificate, threads, requests, **options):
+    """
+    Sends the requests through a new client with the given pool options
+
+    :param server: TLSStubServer instance
+    :param certificate: string with the path of the certificate to trust
+    :param threads: integer with the threads sending requests
+    :param requests: integer with the requests to send
+    :param options: pool arguments of SpotifyAuthenticator
+    :return: dictionary with the connections opened and the throughput
+    """
+    spotify = Spotify('client', 'secret', 'user', 'password', 'http://localhost/callback', 'scope',
+                      token_store=StaticTokenStore(),
+                      api_site='https://localhost:{}'.format(server.server_address[1]),
+                      **options)
+    spotify.authenticator.session.trust_env = False
+    spotify.authenticator.session.verify = certificate
+    with server.lock:
+        server.connections = 0
+    start = time.time()
+    map_concurrently(lambda index: spotify._get('items/{}'.format(index)), range(requests), max_workers=threads)
+    elapsed = time.time() - start
+    spotify.authenticator.close()
+    return {'requests': requests,
+            'connections': server.connections,
+            'seconds': round(elapsed, 3),
+            'requests_per_second': round(requests / elapsed, 1)}
+
+
+def main():
+    """
+    Runs every pool setting against a TLS stub and prints a table of results
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Connection reuse of the session under concurrency')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    scenarios = [('no keep-alive', {'keep_alive': False}),
+                 ('requests defaults', {'pool_size': 10, 'pool_block': False}),
+                 ('pool of {}, blocking'.format(arguments.threads / 4), {'pool_size': arguments.threads / 4}),
+                 ('pool of {}, blocking'.format(arguments.threads), {'pool_size': arguments.threads})]
+    directory = tempfile.mkdtemp()
+    try:
+        certificate, key = create_certificate(directory)
+        server = TLSStubServer(certificate, key)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        print('{:<24}{:>10}{:>13}{:>10}{:>12}'.format('scenario', 'requests', 'connections', 'seconds', 'req/s'))
+        for name, options in scenarios:
+            result = run(server, certificate, arguments.threads, arguments.requests, **options)
+            print('{:<24}{requests:>10}{connections:>13}{seconds:>10}{requests_per_second:>12}'
+                  .format(name, **result))
+        server.shutdown()
+        server.server_close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: suite.py
+
+"""
+Authentication, refresh and request throughput against the local stub server
+
+Every scenario runs against a StubServer in the same process:
+
+* cold start, the full login flow of a new authenticator without any stored
+  token
+* steady state, requests per second of a single thread through the whole
+  request pipeline with a valid token
+* refresh, the latency of the request finding the token expired, either
+  ahead by the authenticator or with a 401 from the API, next to a plain one
+* thread scaling, requests per second and latency sending from more and more
+  threads through a single client
+
+The stub shares the interpreter with the client, so absolute numbers are a
+lower bound of what a real deployment does. They are meant to be compared
+between versions of the library run on the same machine, the results are
+written as JSON for benchmarks.compare.
+
+Usage:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --rounds 3 --requests 200 --threads 1 2 4
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import platform
+import sys
+import time
+
+from spotifylib import Spotify, StubServer, map_concurrently, __version__
+from benchmarks.common import summarize
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+
+def create_spotify(stub, username='user', **options):
+    """
+    Creates a client logged in to the stub
+
+    :param stub: StubServer instance
+    :param username: string
+    :param options: keyword arguments of SpotifyAuthenticator
+    :return: SpotifyClient instance
+    """
+    return Spotify('client', 'secret', username, 'password', 'http://localhost/callback', 'scope',
+                   accounts_site=stub.accounts_site, api_site=stub.api_site, **options)
+
+
+def time_call(function, *args):
+    """
+    Times a call
+
+    :param function: callable
+    :param args: arguments of the callable
+    :return: float with the seconds it took
+    """
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def run_cold_start(stub, rounds):
+    """
+    Logs a new authenticator in from scratch every round
+
+    :param stub: StubServer instance
+    :param rounds: integer
+    :return: dictionary with the summary of the latency
+    """
+    samples = []
+    for round_ in range(rounds):
+        start = time.time()
+        spotify = create_spotify(stub, 'cold-{}'.format(round_))
+        samples.append(time.time() - start)
+        spotify.authenticator.close()
+    return summarize(samples)
+
+
+def run_steady_state(stub, requests, rounds):
+    """
+    Sends distinct requests one after the other with a valid token
+
+    As with timeit, the fastest round is the one telling the cost.
+
+    :param stub: StubServer instance
+    :param requests: integer with the requests per round
+    :param rounds: integer
+    :return: dictionary with the throughput of the fastest round and the
+    summary of the latency of all the requests
+    """
+    spotify = create_spotify(stub)
+    samples = []
+    best = None
+    for round_ in range(rounds):
+        start = time.time()
+        for index in range(requests):
+            samples.append(time_call(spotify.track, 'steady-{}-{}'.format(round_, index)))
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    spotify.authenticator.close()
+    return dict(summarize(samples), requests_per_second=round(requests / best, 1))
+
+
+def run_refresh(stub, rounds):
+    """
+    Times the requests refreshing the token against plain ones
+
+    Ahead, the authenticator finds the token about to expire and refreshes it
+    before sending the request. On 401, the API rejects the token, expired on
+    its side, and the request is sent again after the refresh.
+
+    :param stub: StubServer instance
+    :param rounds: integer
+    :return: dictionary with the summaries of the plain requests and of both
+    kinds of refresh, and their median overhead
+    """
+    spotify = create_spotify(stub)
+    authenticator = spotify.authenticator
+    plain, ahead, rejected = [], [], []
+    for round_ in range(rounds):
+        plain.append(time_call(spotify.track, 'plain-{}'.format(round_)))
+        authenticator._update_token(authenticator.token._replace(issued_at=0))
+        ahead.append(time_call(spotify.track, 'ahead-{}'.format(round_)))
+        stub.expire_tokens()
+        rejected.append(time_call(spotify.track, 'rejected-{}'.format(round_)))
+    authenticator.close()
+    results = {'plain': summarize(plain), 'ahead': summarize(ahead), 'on_401': summarize(rejected)}
+    for name in ('ahead', 'on_401'):
+        results[name]['overhead_p50_ms'] = round(results[name]['p50_ms'] - results['plain']['p50_ms'], 3)
+    return results
+
+
+def run_thread_scaling(stub, requests, thread_counts):
+    """
+    Sends distinct requests from a growing number of threads through a client
+
+    :param stub: StubServer instance
+    :param requests: integer with the requests per thread count
+    :param thread_counts: list of integers
+    :return: list of dictionaries with the threads, the throughput and the
+    summary of the latency
+    """
+    spotify = create_spotify(stub)
+    results = []
+    for threads in thread_counts:
+        start = time.time()
+        samples = map_concurrently(lambda index: time_call(spotify.track, 'scaling-{}-{}'.format(threads, index)),
+                                   range(requests), max_workers=threads)
+        elapsed = time.time() - start
+        results.append(dict(summarize(samples), threads=threads, requests_per_second=round(requests / elapsed, 1)))
+    spotify.authenticator.close()
+    return results
+
+
+def main():
+    """
+    Runs every benchmark against a local stub and writes the results as JSON
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks of the library against the local stub server')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds the stub delays every request')
+    parser.add_argument('--output', help='file to write the results to, the standard output if not given')
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    with StubServer(latency=arguments.latency) as stub:
+        results = {'cold_start': run_cold_start(stub, arguments.rounds),
+                   'steady_state': run_steady_state(stub, arguments.requests, max(1, arguments.rounds / 4)),
+                   'refresh': run_refresh(stub, arguments.rounds),
+                   'thread_scaling': run_thread_scaling(stub, arguments.requests, arguments.threads)}
+    report = {'version': __version__.strip(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+              'options': vars(arguments),
+              'results': results}
+    content = json.dumps(report, indent=2, sort_keys=True)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            output.write(content + '\n')
+    else:
+        sys.stdout.write(content + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -26,7 +26,7 @@ setup(
     author='''Oriol Fabregas''',
     author_email='''fabregas.oriol@gmail.com''',
     url='''https://github.com/wefner/spotifylib''',
-    packages=find_packages(where='.', exclude=('tests', 'hooks')),
+    packages=find_packages(where='.', exclude=('tests', 'hooks', 'benchmarks')),
     package_dir={'''spotifylib''':
                  '''spotifylib'''},
     include_package_data=True,
@@ -6,8 +6,20 @@ Imports all parts from spotifylib here
 """
 from ._version import __version__
 from .constants import *
-from spotifylib import Spotify
-from spotifylibexceptions import SpotifyError
+from spotifylib import Spotify, Token
+from spotifylibexceptions import SpotifyError, SpotifyServerError, SpotifyGrantError, RespError
+from tokenstore import TokenStore, FileTokenStore, MemoryTokenStore, RedisTokenStore
+from adapters import PoolAdapter
+from concurrency import HostLimiter, RequestCoalescer, map_concurrently
+from pool import SpotifyPool, authenticate_concurrently
+from client import SpotifyClient
+from ratelimit import RateLimiter, AdaptiveLimiter
+from retry import RetryPolicy
+from cache import ResponseCache, CatalogCache
+from transport import Middleware, SpotifySession
+from metrics import MetricsRegistry
+from tracing import Tracer, CollectingTracer, OTLPTracer
+from stubserver import StubServer
 
 __author__ = '''Oriol Fabregas'''
 __email__ = '''fabregas.oriol@gmail.com'''
@@ -18,4 +30,31 @@ assert __version__
 
 # assert objects
 assert Spotify
+assert Token
 assert SpotifyError
+assert SpotifyServerError
+assert SpotifyGrantError
+assert RespError
+assert TokenStore
+assert FileTokenStore
+assert MemoryTokenStore
+assert RedisTokenStore
+assert PoolAdapter
+assert HostLimiter
+assert RequestCoalescer
+assert map_concurrently
+assert SpotifyPool
+assert authenticate_concurrently
+assert SpotifyClient
+assert RateLimiter
+assert AdaptiveLimiter
+assert RetryPolicy
+assert ResponseCache
+assert CatalogCache
+assert Middleware
+assert SpotifySession
+assert MetricsRegistry
+assert Tracer
+assert CollectingTracer
+assert OTLPTracer
+assert StubServer
@@ -0,0 +1,83 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: adapters.py
+
+"""
+Transport adapters of the authenticated session
+
+Requests keeps ten connections per host by default and opens, and then
+throws away, a new connection every time more threads than that talk to the
+same host. The adapter here sizes the pool explicitly, can make requests wait
+for a pooled connection instead and keeps idle connections alive.
+"""
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection
+from constants import *
+
+import logging
+import socket
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+class PoolAdapter(HTTPAdapter):
+    """
+    HTTP adapter with an explicit connection pool and keep-alive settings
+
+    With keep-alive, connections are reused across requests and TCP
+    keep-alive probes stop idle pooled connections from being dropped by
+    firewalls and NATs. Without it, every connection is closed after its
+    response, which only makes sense to compare against.
+
+    An adapter is mounted per site, so the login flow and the API get their
+    own pools and a burst of API requests cannot starve a refresh.
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ['keep_alive']
+
+    def __init__(self, pool_size=API_POOL_SIZE, pool_block=POOL_BLOCK, keep_alive=True, **kwargs):
+        """
+        Initialises the adapter
+
+        :param pool_size: integer with the maximum connections kept per host
+        :param pool_block: boolean to make requests wait for a free connection
+        when all of them are in use instead of opening a throwaway one
+        :param keep_alive: boolean to reuse connections across requests
+        :param kwargs: other keyword arguments of HTTPAdapter
+        """
+        self.keep_alive = keep_alive
+        super(PoolAdapter, self).__init__(pool_maxsize=pool_size, pool_block=pool_block, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=POOL_BLOCK, **pool_kwargs):
+        """
+        Initialises the pool manager enabling TCP keep-alive on its sockets
+
+        :param connections: integer with the host pools to cache
+        :param maxsize: integer with the maximum connections kept per host
+        :param block: boolean to wait for a free connection
+        :param pool_kwargs: extra keyword arguments of the pool manager
+        :return: None
+        """
+        if self.keep_alive:
+            pool_kwargs.setdefault('socket_options', HTTPConnection.default_socket_options +
+                                   [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+        super(PoolAdapter, self).init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+
+    def add_headers(self, request, **kwargs):
+        """
+        Asks the server to close the connection when keep-alive is disabled
+
+        :param request: PreparedRequest instance
+        :param kwargs: keyword arguments of send
+        :return: None
+        """
+        if not self.keep_alive:
+            request.headers['Connection'] = 'close'
@@ -0,0 +1,535 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: cache.py
+
+"""
+HTTP response cache for the API
+
+Spotify sends an ETag and Cache-Control headers along most of its responses.
+The cache keeps those responses, serves them while they are fresh and
+revalidates them afterwards with If-None-Match, so an unchanged resource costs
+a 304 without body instead of the whole document.
+
+Catalog objects are cached by ID instead, so a bulk lookup only asks for the
+IDs it has not seen yet whatever the combination of IDs it is made of.
+"""
+
+from collections import OrderedDict, namedtuple
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from urllib import urlencode
+from constants import *
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+def parse_cache_control(value):
+    """
+    Parses a Cache-Control header into a dictionary
+
+    Directives without value, like no-store, are mapped to True.
+
+    :param value: string with the header value or None
+    :return: dictionary
+    """
+    directives = {}
+    for directive in (value or '').split(','):
+        name, _, argument = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or True
+    return directives
+
+
+class CacheEntry(namedtuple('CacheEntry', ['url',
+                                           'status_code',
+                                           'headers',
+                                           'content',
+                                           'encoding',
+                                           'etag',
+                                           'expires_at'])):
+    """
+    Cached response
+
+    Keeps what is needed to rebuild the response and to revalidate it.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        Creates an entry from a response if its headers allow caching it
+
+        :param response: Response instance
+        :return: CacheEntry namedtuple or None if it must not be cached
+        """
+        directives = parse_cache_control(response.headers.get('Cache-Control'))
+        etag = response.headers.get('ETag')
+        if 'no-store' in directives:
+            return None
+        try:
+            max_age = 0 if 'no-cache' in directives else int(directives.get('max-age', 0))
+        except ValueError:
+            max_age = 0
+        if not etag and not max_age:
+            return None
+        return cls(response.url,
+                   response.status_code,
+                   dict(response.headers),
+                   response.content,
+                   response.encoding,
+                   etag,
+                   time.time() + max_age)
+
+    @property
+    def size(self):
+        """
+        Bytes taken by the body of the response
+
+        :return: integer
+        """
+        return len(self.content)
+
+    def is_fresh(self):
+        """
+        Tells if the entry can be served without asking Spotify
+
+        :return: boolean
+        """
+        return time.time() < self.expires_at
+
+    def revalidated(self, response):
+        """
+        Creates a copy of the entry renewed by a 304 response
+
+        :param response: Response instance with status 304
+        :return: CacheEntry namedtuple
+        """
+        directives = parse_cache_control(response.headers.get('Cache-Control'))
+        try:
+            max_age = int(directives.get('max-age', 0))
+        except ValueError:
+            max_age = 0
+        return self._replace(etag=response.headers.get('ETag', self.etag),
+                             expires_at=time.time() + max_age)
+
+    def to_response(self):
+        """
+        Rebuilds the response out of the entry
+
+        :return: Response instance
+        """
+        response = Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response.encoding = self.encoding
+        response.url = self.url
+        response.reason = 'OK'
+        response.from_cache = True
+        return response
+
+
+class SQLiteCacheTier(object):
+    """
+    Persistent tier of the response cache in a SQLite database
+    """
+
+    def __init__(self, path):
+        """
+        Opens or creates the database
+
+        :param path: string with the path of the database file
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.text_factory = str
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS responses '
+                                     '(key TEXT PRIMARY KEY, entry TEXT, content BLOB)')
+
+    def get(self, key):
+        """
+        Retrieves an entry
+
+        :param key: string
+        :return: CacheEntry namedtuple or None
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT entry, content FROM responses WHERE key = ?',
+                                           (key,)).fetchone()
+        if not row:
+            return None
+        values = json.loads(row[0])
+        values['content'] = str(row[1])
+        return CacheEntry(**values)
+
+    def set(self, key, entry):
+        """
+        Stores an entry
+
+        :param key: string
+        :param entry: CacheEntry namedtuple
+        :return: None
+        """
+        values = entry._asdict()
+        content = values.pop('content')
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)',
+                                     (key, json.dumps(values), sqlite3.Binary(content)))
+
+    def delete(self, key):
+        """
+        Removes an entry
+
+        :param key: string
+        :return: None
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+
+class ResponseCache(object):
+    """
+    LRU cache of API responses bounded by the size of their bodies
+
+    Entries are kept per user as the same URL returns different documents for
+    different users, so a single cache can be shared between clients. With a
+    path, entries are also written to a SQLite database and the cache
+    survives restarts.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, path=None):
+        """
+        Initialises the cache
+
+        :param max_bytes: integer with the maximum bytes of bodies kept in
+        memory
+        :param path: string with the path of a SQLite database for the
+        persistent tier, None to keep everything in memory
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._persistent = SQLiteCacheTier(path) if path else None
+
+    @staticmethod
+    def get_key(username, url, params=None):
+        """
+        Builds the key of a request
+
+        :param username: string with the user the request is made for
+        :param url: string
+        :param params: dictionary with the query parameters
+        :return: string
+        """
+        query = urlencode(sorted((params or {}).items()))
+        return '{username} {url}?{query}'.format(username=username, url=url, query=query)
+
+    def get(self, key):
+        """
+        Retrieves an entry, fresh or not, from memory or the persistent tier
+
+        :param key: string
+        :return: CacheEntry namedtuple or None
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self._entries[key] = entry
+                return entry
+        if not self._persistent:
+            return None
+        entry = self._persistent.get(key)
+        if entry:
+            self._add(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        """
+        Stores an entry in memory and in the persistent tier
+
+        :param key: string
+        :param entry: CacheEntry namedtuple
+        :return: None
+        """
+        self._add(key, entry)
+        if self._persistent:
+            self._persistent.set(key, entry)
+
+    def _add(self, key, entry):
+        """
+        Adds an entry in memory evicting the least recently used ones
+
+        Entries bigger than the whole cache are not kept in memory.
+
+        :param key: string
+        :param entry: CacheEntry namedtuple
+        :return: None
+        """
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self.size -= previous.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def delete(self, key):
+        """
+        Removes an entry
+
+        :param key: string
+        :return: None
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self.size -= entry.size
+        if self._persistent:
+            self._persistent.delete(key)
+
+    def _count(self, attribute):
+        """
+        Increments one of the counters of the cache
+
+        :param attribute: string with the name of the counter
+        :return: None
+        """
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def request(self, send, key, headers):
+        """
+        Serves a request from the cache or sends it, conditionally if possible
+
+        :param send: callable sending the request and returning the response
+        :param key: string with the key of the request
+        :param headers: dictionary with the headers of the request, the
+        If-None-Match header is added to it when revalidating
+        :return: Response instance
+        """
+        entry = self.get(key)
+        if entry and entry.is_fresh():
+            self._count('hits')
+            return entry.to_response()
+        if entry and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        response = send()
+        headers.pop('If-None-Match', None)
+        if response.status_code == 304 and entry:
+            self._count('revalidations')
+            self.set(key, entry.revalidated(response))
+            return entry.to_response()
+        self._count('misses')
+        if response.status_code == 200:
+            new_entry = CacheEntry.from_response(response)
+            if new_entry:
+                self.set(key, new_entry)
+        return response
+
+
+class SQLiteCatalogTier(object):
+    """
+    Persistent tier of the catalog cache in a SQLite database
+    """
+
+    def __init__(self, path):
+        """
+        Opens or creates the database
+
+        :param path: string with the path of the database file
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS catalog '
+                                     '(key TEXT PRIMARY KEY, object TEXT, expires_at REAL)')
+
+    def get_many(self, keys):
+        """
+        Retrieves the objects of the keys that did not expire
+
+        :param keys: list of strings
+        :return: dictionary of tuples with the epoch of expiry and the object
+        keyed by key
+        """
+        found = {}
+        now = time.time()
+        for index in range(0, len(keys), CATALOG_QUERY_CHUNK):
+            chunk = keys[index:index + CATALOG_QUERY_CHUNK]
+            query = ('SELECT key, object, expires_at FROM catalog '
+                     'WHERE expires_at > ? AND key IN ({})'.format(', '.join('?' * len(chunk))))
+            with self._lock:
+                rows = self._connection.execute(query, [now] + chunk).fetchall()
+            for key, value, expires_at in rows:
+                found[key] = (expires_at, json.loads(value))
+        return found
+
+    def set_many(self, entries):
+        """
+        Stores objects
+
+        :param entries: dictionary of tuples with the epoch of expiry and the
+        object keyed by key
+        :return: None
+        """
+        rows = [(key, json.dumps(value), expires_at) for key, (expires_at, value) in entries.items()]
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO catalog VALUES (?, ?, ?)', rows)
+
+    def purge(self):
+        """
+        Removes the expired objects
+
+        :return: integer with the number of objects removed
+        """
+        with self._lock, self._connection:
+            return self._connection.execute('DELETE FROM catalog WHERE expires_at <= ?',
+                                            (time.time(),)).rowcount
+
+
+class CatalogCache(object):
+    """
+    LRU cache of catalog objects keyed by Spotify ID
+
+    Tracks, albums and artists hardly ever change, so once retrieved they are
+    served from here until their TTL passes. Objects are kept per namespace,
+    as the same ID gives a different object for different endpoints or
+    markets. With a path, objects are also written to a SQLite database
+    shared across restarts and processes.
+    """
+
+    def __init__(self, max_items=CATALOG_MAX_ITEMS, ttl=CATALOG_TTL, path=None):
+        """
+        Initialises the cache
+
+        :param max_items: integer with the maximum objects kept in memory
+        :param ttl: seconds an object is served from the cache
+        :param path: string with the path of a SQLite database for the
+        persistent tier, None to keep everything in memory
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._persistent = SQLiteCatalogTier(path) if path else None
+        if self._persistent:
+            self._persistent.purge()
+
+    def __len__(self):
+        """
+        Number of objects kept in memory
+
+        :return: integer
+        """
+        with self._lock:
+            return len(self._entries)
+
+    @staticmethod
+    def _get_key(namespace, identifier):
+        """
+        Builds the key of an object
+
+        :param namespace: string
+        :param identifier: string with the Spotify ID
+        :return: string
+        """
+        return '{namespace} {identifier}'.format(namespace=namespace, identifier=identifier)
+
+    def get_many(self, namespace, ids):
+        """
+        Retrieves the cached objects of some IDs
+
+        Example:
+        --------
+            >>> cache.get_many('tracks', ['6rqhFgbbKwnb9MLmUQDhG6'])
+            {'6rqhFgbbKwnb9MLmUQDhG6': {...}}
+
+        :param namespace: string telling the kind of objects apart
+        :param ids: list of strings
+        :return: dictionary of objects keyed by ID, missing the IDs not cached
+        """
+        keys = dict((self._get_key(namespace, identifier), identifier) for identifier in ids)
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key, identifier in keys.items():
+                entry = self._entries.pop(key, None)
+                if entry and entry[0] > now:
+                    self._entries[key] = entry
+                    found[identifier] = entry[1]
+        missing = [key for key, identifier in keys.items() if identifier not in found]
+        if self._persistent and missing:
+            stored = self._persistent.get_many(missing)
+            self._add(stored)
+            for key, (_, value) in stored.items():
+                found[keys[key]] = value
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, namespace, objects):
+        """
+        Stores objects in memory and in the persistent tier
+
+        :param namespace: string telling the kind of objects apart
+        :param objects: dictionary of objects keyed by ID
+        :return: None
+        """
+        expires_at = time.time() + self.ttl
+        entries = dict((self._get_key(namespace, identifier), (expires_at, value))
+                       for identifier, value in objects.items())
+        self._add(entries)
+        if self._persistent and entries:
+            self._persistent.set_many(entries)
+
+    def _add(self, entries):
+        """
+        Adds objects in memory evicting the least recently used ones
+
+        :param entries: dictionary of tuples with the epoch of expiry and the
+        object keyed by key
+        :return: None
+        """
+        with self._lock:
+            for key, entry in entries.items():
+                self._entries.pop(key, None)
+                self._entries[key] = entry
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
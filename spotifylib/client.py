@@ -0,0 +1,345 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: client.py
+
+"""
+Spotipy client extended with helpers for large collections
+
+The object returned by Spotify is a SpotifyClient, so all of Spotipy's methods
+are available along with the helpers defined here.
+"""
+
+from Queue import Queue, Full
+from collections import OrderedDict
+from urllib import urlencode
+from urlparse import urlparse, urlunparse, parse_qsl
+from spotipy import Spotify as OriginalSpotify
+from constants import *
+from concurrency import map_concurrently, DEFAULT_WORKERS
+
+import logging
+import threading
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+def get_paging(result):
+    """
+    Retrieves the paging object of a result
+
+    Most endpoints return a paging object directly, others like search or the
+    followed artists wrap it under a single key.
+
+    :param result: dictionary as returned by Spotipy
+    :return: dictionary with the paging object or None
+    """
+    if not result:
+        return None
+    if 'items' in result:
+        return result
+    for value in result.values():
+        if isinstance(value, dict) and 'items' in value:
+            return value
+    return None
+
+
+def get_page_urls(page):
+    """
+    Builds the URLs of all the pages following an offset based paging object
+
+    The URL of the next page is used as template so any other parameter of
+    the original request is kept.
+
+    :param page: dictionary with the paging object
+    :return: list of strings, empty if there are no more pages
+    """
+    if not page.get('next'):
+        return []
+    url = urlparse(page['next'])
+    query = dict(parse_qsl(url.query))
+    limit = page['limit']
+    urls = []
+    for offset in range(page['offset'] + limit, page['total'], limit):
+        query.update({'offset': offset, 'limit': limit})
+        urls.append(urlunparse(url._replace(query=urlencode(sorted(query.items())))))
+    return urls
+
+
+class PageReader(threading.Thread):
+    """
+    Reads the following pages of a paging object ahead of the consumer
+
+    Pages are put in a bounded queue, so at most a fixed number of pages are
+    held in memory whatever the size of the collection.
+    """
+    def __init__(self, client, page, prefetch):
+        """
+        Initialises the reader as a daemon thread
+
+        :param client: SpotifyClient instance
+        :param page: dictionary with the paging object already retrieved
+        :param prefetch: integer with the maximum pages read ahead
+        """
+        super(PageReader, self).__init__(name='PageReader')
+        self.daemon = True
+        self._client = client
+        self._page = page
+        self.pages = Queue(maxsize=prefetch)
+        self._stopped = threading.Event()
+
+    def run(self):
+        """
+        Fetches pages until the last one, an error or a stop
+
+        The end of the collection is signaled with None and errors are put in
+        the queue to be raised by the consumer.
+
+        :return: None
+        """
+        page = self._page
+        while page and page.get('next'):
+            try:
+                page = get_paging(self._client.next(page))
+            except Exception as error:  # pylint: disable=broad-except
+                self._put(error)
+                return
+            if not self._put(page):
+                return
+        self._put(None)
+
+    def _put(self, value):
+        """
+        Waits for room in the queue unless the consumer went away
+
+        :param value: paging object, exception or None
+        :return: boolean, False if the reader was stopped
+        """
+        while not self._stopped.is_set():
+            try:
+                self.pages.put(value, timeout=PAGINATION_POLL_INTERVAL)
+                return True
+            except Full:
+                continue
+        return False
+
+    def stop(self):
+        """
+        Signals the thread to finish
+
+        :return: None
+        """
+        self._stopped.set()
+
+
+class SpotifyClient(OriginalSpotify):
+    """
+    Spotipy client working through an authenticator
+
+    The session of the authenticator takes care of the token so every method
+    of Spotipy can be used as is.
+    """
+    def __init__(self, authenticator, catalog_cache=None):
+        """
+        Initialises Spotipy with the session and token of the authenticator
+
+        :param authenticator: SpotifyAuthenticator instance
+        :param catalog_cache: CatalogCache instance for the bulk lookups, None
+        to always ask Spotify
+        """
+        token = authenticator.token
+        super(SpotifyClient, self).__init__(auth=token.access_token if token else None,
+                                            requests_session=authenticator.session)
+        self.authenticator = authenticator
+        self.catalog_cache = catalog_cache
+        self.prefix = '{}/v1/'.format(authenticator.api_site)
+        self._session.parent = self
+
+    def iterate(self, result, prefetch=PAGINATION_PREFETCH):
+        """
+        Streams the items of a paging object across all its pages
+
+        The following pages are requested on demand, or read ahead in the
+        background when prefetch is positive, so the next page is usually
+        already there when the consumer gets to it.
+
+        Example:
+        --------
+            >>> for item in spotify.iterate(spotify.current_user_saved_tracks()):
+            ...     print(item['track']['name'])
+
+        :param result: dictionary as returned by Spotipy's paged methods
+        :param prefetch: integer with the maximum pages read ahead, 0 disables
+        the background reader
+        :return: generator of items
+        """
+        page = get_paging(result)
+        if not page:
+            return
+        for item in page['items']:
+            yield item
+        if not prefetch:
+            while page.get('next'):
+                page = get_paging(self.next(page))
+                for item in page['items']:
+                    yield item
+            return
+        reader = PageReader(self, page, prefetch)
+        reader.start()
+        try:
+            while True:
+                page = reader.pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                for item in page['items']:
+                    yield item
+        finally:
+            reader.stop()
+
+    def fetch_all(self, result, max_workers=DEFAULT_WORKERS):
+        """
+        Retrieves all the items of a paging object requesting pages in parallel
+
+        The first page tells the total and the page size, so the offsets of
+        all the remaining pages are known upfront and requested concurrently.
+        Items are returned in the order of the collection. Cursor based
+        paging objects, which have no offsets, are read page after page.
+
+        Example:
+        --------
+            >>> tracks = spotify.fetch_all(spotify.user_playlist_tracks(user, playlist_id))
+
+        :param result: dictionary as returned by Spotipy's paged methods
+        :param max_workers: integer with the maximum requests in flight
+        :return: list of items
+        """
+        page = get_paging(result)
+        if not page:
+            return []
+        if page.get('offset') is None or page.get('total') is None:
+            return list(self.iterate(result, prefetch=0))
+        pages = map_concurrently(self._get, get_page_urls(page), max_workers)
+        items = list(page['items'])
+        for following in pages:
+            items.extend(get_paging(following)['items'])
+        return items
+
+    def _fetch_in_chunks(self, method, kind, items, limit, key, max_workers, **kwargs):
+        """
+        Retrieves the objects of any number of IDs from a bulk endpoint
+
+        IDs, URIs and URLs are normalised and deduplicated, split in chunks of
+        the endpoint limit and the chunks requested concurrently. The result
+        follows the order of the input, duplicates included, with None for
+        unknown IDs as Spotify does.
+
+        With a catalog cache only the IDs missing from it are requested, and
+        the objects retrieved are added to it. Unknown IDs are not cached.
+
+        :param method: Spotipy's bound method of the bulk endpoint
+        :param kind: string with the type of the objects, like track
+        :param items: list of IDs, URIs or URLs
+        :param limit: integer with the maximum IDs per request
+        :param key: string with the key holding the objects in the response,
+        None if the response is the list of objects
+        :param max_workers: integer with the maximum requests in flight
+        :param kwargs: extra keyword arguments of the endpoint
+        :return: list of objects
+        """
+        ids = [self._get_id(kind, item) for item in items]
+        unique = list(OrderedDict.fromkeys(ids))
+        objects = {}
+        if self.catalog_cache is not None:
+            namespace = ' '.join([method.__name__] + ['{}={}'.format(name, value)
+                                                      for name, value in sorted(kwargs.items())
+                                                      if value is not None])
+            objects = self.catalog_cache.get_many(namespace, unique)
+            unique = [identifier for identifier in unique if identifier not in objects]
+        chunks = [unique[index:index + limit] for index in range(0, len(unique), limit)]
+        results = map_concurrently(lambda chunk: method(chunk, **kwargs), chunks, max_workers)
+        retrieved = {}
+        for chunk, result in zip(chunks, results):
+            retrieved.update((identifier, value)
+                             for identifier, value in zip(chunk, result[key] if key else result)
+                             if value is not None)
+        if self.catalog_cache is not None and retrieved:
+            self.catalog_cache.set_many(namespace, retrieved)
+        objects.update(retrieved)
+        return [objects.get(identifier) for identifier in ids]
+
+    def bulk_tracks(self, tracks, market=None, max_workers=DEFAULT_WORKERS):
+        """
+        Retrieves any number of tracks
+
+        :param tracks: list of track IDs, URIs or URLs
+        :param market: string with an ISO 3166-1 alpha-2 country code
+        :param max_workers: integer with the maximum requests in flight
+        :return: list of tracks in the order of the input
+        """
+        return self._fetch_in_chunks(self.tracks, 'track', tracks, TRACKS_LIMIT,
+                                     'tracks', max_workers, market=market)
+
+    def bulk_artists(self, artists, max_workers=DEFAULT_WORKERS):
+        """
+        Retrieves any number of artists
+
+        :param artists: list of artist IDs, URIs or URLs
+        :param max_workers: integer with the maximum requests in flight
+        :return: list of artists in the order of the input
+        """
+        return self._fetch_in_chunks(self.artists, 'artist', artists, ARTISTS_LIMIT,
+                                     'artists', max_workers)
+
+    def bulk_albums(self, albums, max_workers=DEFAULT_WORKERS):
+        """
+        Retrieves any number of albums
+
+        :param albums: list of album IDs, URIs or URLs
+        :param max_workers: integer with the maximum requests in flight
+        :return: list of albums in the order of the input
+        """
+        return self._fetch_in_chunks(self.albums, 'album', albums, ALBUMS_LIMIT,
+                                     'albums', max_workers)
+
+    def bulk_audio_features(self, tracks, max_workers=DEFAULT_WORKERS):
+        """
+        Retrieves the audio features of any number of tracks
+
+        :param tracks: list of track IDs, URIs or URLs
+        :param max_workers: integer with the maximum requests in flight
+        :return: list of audio features in the order of the input
+        """
+        return self._fetch_in_chunks(self.audio_features, 'track', tracks, AUDIO_FEATURES_LIMIT,
+                                     None, max_workers)
+
+    def bulk_user_playlist_add_tracks(self, user, playlist_id, tracks, position=None):
+        """
+        Adds any number of tracks to a playlist
+
+        Unlike the lookups, chunks are sent one after the other as concurrent
+        additions would land in the playlist in any order, and duplicates are
+        kept as adding a track twice is a valid operation.
+
+        :param user: string with the id of the user
+        :param playlist_id: string with the ID, URI or URL of the playlist
+        :param tracks: list of track IDs, URIs or URLs
+        :param position: integer with the position to add the tracks at
+        :return: list of the responses of every chunk with the snapshot ids
+        """
+        results = []
+        for index in range(0, len(tracks), PLAYLIST_TRACKS_LIMIT):
+            chunk_position = position + index if position is not None else None
+            results.append(self.user_playlist_add_tracks(user,
+                                                         playlist_id,
+                                                         tracks[index:index + PLAYLIST_TRACKS_LIMIT],
+                                                         position=chunk_position))
+        return results
@@ -0,0 +1,173 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: concurrency.py
+
+"""
+Helpers to run many API calls concurrently
+
+The authenticated session is safe to share between threads, so concurrency is
+achieved with a bounded pool of threads issuing the calls. The number of
+requests in flight towards a host can be capped independently of the number
+of threads. Identical reads issued at the same time are coalesced into one.
+"""
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urlparse import urlparse
+
+import copy
+import logging
+import sys
+import threading
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+# Number of threads used when none is specified
+DEFAULT_WORKERS = 8
+
+
+class HostLimiter(object):
+    """
+    Caps the number of concurrent requests per host
+
+    Every host gets its own semaphore so a slow host does not hold back the
+    requests to the others.
+    """
+
+    def __init__(self, limit):
+        """
+        Initialises the limiter
+
+        :param limit: integer with the maximum requests in flight per host
+        """
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._semaphores = defaultdict(lambda: threading.BoundedSemaphore(self.limit))
+
+    def _get_semaphore(self, url):
+        """
+        Retrieves the semaphore of the host of a URL
+
+        :param url: string
+        :return: BoundedSemaphore instance
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            return self._semaphores[host]
+
+    @contextmanager
+    def hold(self, url):
+        """
+        Blocks until a slot for the host of the URL is free and holds it
+
+        :param url: string
+        :return: None
+        """
+        semaphore = self._get_semaphore(url)
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+def map_concurrently(function, iterable, max_workers=DEFAULT_WORKERS):
+    """
+    Applies a function to every item using a bounded pool of threads
+
+    Results are returned in the same order as the items. If any of the calls
+    raises, the exception is raised once all the calls are done.
+
+    Example:
+    --------
+        >>> map_concurrently(spotify.artist, artist_ids, max_workers=16)
+
+    :param function: callable receiving an item
+    :param iterable: items to call the function with
+    :param max_workers: integer with the number of threads
+    :return: list of results
+    """
+    items = list(iterable)
+    if not items:
+        return []
+    workers = max(1, min(max_workers, len(items)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(function, item) for item in items]
+        return [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=True)
+
+
+class RequestCoalescer(object):
+    """
+    Shares a single call between concurrent callers asking for the same key
+
+    The first caller of a key runs the call, callers arriving while it is in
+    flight wait for it and get a copy of its result, or its exception, instead
+    of running their own. Nothing is kept once the call is done, so results
+    are never stale.
+
+    The calls run and the calls coalesced into another are counted, the
+    latter being the calls saved.
+    """
+
+    def __init__(self):
+        """
+        Initialises the coalescer
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def call(self, key, function):
+        """
+        Runs the function unless a call for the same key is already in flight
+
+        Example:
+        --------
+            >>> coalescer.call('me', spotify.me)
+
+        :param key: hashable identifying the call
+        :param function: callable without arguments
+        :return: the result of the function, a shallow copy of it for the
+        callers that did not run it
+        """
+        with self._lock:
+            pending = self._in_flight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._in_flight[key] = {'done': threading.Event()}
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            pending['done'].wait()
+            if 'error' in pending:
+                error = pending['error']
+                raise error[0], error[1], error[2]
+            return copy.copy(pending['result'])
+        try:
+            pending['result'] = function()
+            return pending['result']
+        except Exception:  # pylint: disable=broad-except
+            pending['error'] = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            pending['done'].set()
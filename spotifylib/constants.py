@@ -6,7 +6,11 @@ Static URL's and variables
 
 from urlparse import urlparse
 
-SITE = 'https://accounts.spotify.com'
+import os
+
+# Both sites can be pointed elsewhere, like a local stub server, from the
+# environment or per authenticator
+SITE = os.environ.get('SPOTIFYLIB_ACCOUNTS_SITE', 'https://accounts.spotify.com').rstrip('/')
 AUTH_API_URL = '{SITE}/authorize'.format(SITE=SITE)
 API_LOGIN_URL = '{SITE}/api/login'.format(SITE=SITE)
 LOGIN_WEB_URL = '{SITE}/en/login'.format(SITE=SITE)
@@ -14,6 +18,9 @@ AUTH_WEB_URL = '{SITE}/en/authorize'.format(SITE=SITE)
 ACCEPT_URL = '{AUTH_URL}/accept'.format(AUTH_URL=AUTH_WEB_URL)
 TOKEN_URL = '{SITE}/api/token'.format(SITE=SITE)
 
+API_SITE = os.environ.get('SPOTIFYLIB_API_SITE', 'https://api.spotify.com').rstrip('/')
+API_URL = '{API_SITE}/v1/'.format(API_SITE=API_SITE)
+
 HEADERS = {'Host': urlparse(SITE).netloc,
            'Accept': 'application/json, text/plain, */*',
            'Content-Type': 'application/x-www-form-urlencoded'}
@@ -21,3 +28,151 @@ HEADERS = {'Host': urlparse(SITE).netloc,
 INVALID_TOKEN_MSG = {'error':
                          {'status': 401, 'message': 'The access token expired'}}
 
+# Cookie of the accounts site holding the session of a logged in user
+LOGIN_COOKIE = 'sp_dc'
+
+
+# Seconds before the expiry of a token to refresh it
+REFRESH_MARGIN = 60
+
+# Seconds a process waits for another one logging in or refreshing a token
+TOKEN_LOCK_TIMEOUT = 60
+
+# Seconds between attempts to take the lock of a token
+TOKEN_LOCK_POLL_INTERVAL = 0.05
+
+# Milliseconds a lock of a token store lives in Redis if its holder dies
+TOKEN_LOCK_TTL = 30000
+
+# Prefix of the keys of the tokens in Redis
+REDIS_KEY_PREFIX = 'spotifylib:token:'
+
+# Seconds to wait for a Redis server to connect or answer
+REDIS_TIMEOUT = 5
+
+# Seconds to wait before retrying a failed background refresh
+REFRESH_RETRY_DELAY = 10
+
+# Maximum authenticated clients kept alive by a pool
+POOL_MAX_CLIENTS = 100
+
+# Seconds a client of a pool is kept alive without being used
+POOL_IDLE_TIMEOUT = 3600
+
+# Maximum logins a pool runs at the same time
+POOL_MAX_LOGINS = 4
+
+# Connections to the API shared by all the clients of a pool
+POOL_API_CONNECTIONS = 32
+
+# Connections to the API kept open by a single client
+API_POOL_SIZE = 32
+
+# Connections to the accounts site kept open by a single client
+ACCOUNTS_POOL_SIZE = 2
+
+# Whether requests wait for a free pooled connection instead of opening one
+POOL_BLOCK = True
+
+# Pages read ahead in the background when iterating over a collection
+PAGINATION_PREFETCH = 1
+
+# Seconds between checks for a stopped consumer while waiting to enqueue a page
+PAGINATION_POLL_INTERVAL = 0.5
+
+# Maximum IDs accepted per request by the bulk endpoints
+TRACKS_LIMIT = 50
+ARTISTS_LIMIT = 50
+ALBUMS_LIMIT = 20
+AUDIO_FEATURES_LIMIT = 100
+PLAYLIST_TRACKS_LIMIT = 100
+
+# Times a throttled request is held and sent again before giving up
+THROTTLE_RETRIES = 5
+
+# Seconds to hold a throttled host when the response has no Retry-After
+THROTTLE_DEFAULT_DELAY = 1
+
+# Requests in flight allowed by the adaptive limiter when starting
+ADAPTIVE_INITIAL_LIMIT = 4
+
+# Bounds of the requests in flight allowed by the adaptive limiter
+ADAPTIVE_MINIMUM_LIMIT = 1
+ADAPTIVE_MAXIMUM_LIMIT = 64
+
+# Factor the adaptive limit is multiplied by when the API struggles
+ADAPTIVE_DECREASE_FACTOR = 0.5
+
+# Seconds above which a response counts as a latency spike
+ADAPTIVE_LATENCY_THRESHOLD = 5
+
+# Minimum seconds between two decreases of the adaptive limit
+ADAPTIVE_COOLDOWN = 1
+
+# Defaults of the retry policies
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10
+RETRY_DEADLINE = 60
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# HTTP methods that can be sent again without side effects
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Maximum bytes of response bodies kept in memory by the response cache
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Maximum catalog objects kept in memory by the catalog cache
+CATALOG_MAX_ITEMS = 100000
+
+# Seconds a catalog object is served from the catalog cache
+CATALOG_TTL = 7 * 24 * 60 * 60
+
+# Maximum IDs per query to the persistent tier of the catalog cache
+CATALOG_QUERY_CHUNK = 500
+
+# Upper bounds in seconds of the buckets of the latency histograms
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Path segments of the API naming resources, any other segment is an ID
+METRICS_ENDPOINT_WORDS = frozenset(['v1', 'me', 'users', 'playlists', 'tracks', 'albums', 'artists',
+                                    'audio-features', 'audio-analysis', 'browse', 'categories',
+                                    'featured-playlists', 'new-releases', 'recommendations',
+                                    'available-genre-seeds', 'search', 'following', 'contains',
+                                    'followers', 'player', 'currently-playing', 'recently-played',
+                                    'devices', 'play', 'pause', 'next', 'previous', 'seek', 'repeat',
+                                    'volume', 'shuffle', 'top', 'related-artists', 'top-tracks',
+                                    'images', 'shows', 'episodes', 'markets'])
+
+# Maximum finished spans kept in memory by the collecting tracer
+TRACING_MAX_SPANS = 10000
+
+# Name of the service the spans sent to an OpenTelemetry collector belong to
+TRACING_SERVICE_NAME = 'spotifylib'
+
+# Maximum spans sent to an OpenTelemetry collector per request
+TRACING_BATCH_SIZE = 100
+
+# Maximum seconds a span waits to be sent to an OpenTelemetry collector
+TRACING_FLUSH_INTERVAL = 5
+
+# Batches of spans queued for an OpenTelemetry collector before dropping spans
+TRACING_QUEUED_BATCHES = 10
+
+# Seconds to wait for an OpenTelemetry collector to answer
+TRACING_TIMEOUT = 10
+
+# Address the stub server listens on
+STUB_HOST = '127.0.0.1'
+
+# Seconds the tokens issued by the stub server are valid for
+STUB_TOKEN_TTL = 3600
+
+# Requests kept by the stub server for inspection
+STUB_REQUEST_LOG = 10000
+
+# Scope of the tokens registered directly in the stub server
+STUB_SCOPE = 'user-read-private'
+
+# Maximum items per page served by the stub server
+STUB_PAGE_LIMIT = 50
@@ -0,0 +1,337 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: metrics.py
+
+"""
+Instrumentation of the authenticator and its requests
+
+A metrics registry keeps counters and latency histograms labelled by
+endpoint, status code, login step and so on, and passes every measurement to
+the listeners registered on it, so they can be forwarded to any monitoring
+system. Recording a value is a dictionary lookup and a bisect under a lock,
+cheap enough to leave it enabled in production.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from urlparse import urlparse
+from constants import *
+from transport import Middleware
+
+import logging
+import threading
+import time
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+def get_endpoint(url):
+    """
+    Turns the URL of an API request into its endpoint
+
+    Path segments other than the known resource names are IDs, user names
+    and the like, and are replaced by a placeholder so that all the requests
+    to an endpoint are measured together.
+
+    Example:
+    --------
+        >>> get_endpoint('https://api.spotify.com/v1/users/wizzler/playlists?limit=50')
+        '/v1/users/{id}/playlists'
+
+    :param url: string
+    :return: string
+    """
+    segments = [segment if segment in METRICS_ENDPOINT_WORDS else '{id}'
+                for segment in urlparse(url).path.split('/') if segment]
+    return '/{}'.format('/'.join(segments))
+
+
+class Histogram(object):
+    """
+    Counts of observations in fixed buckets along with their count and sum
+
+    Not thread safe on its own, the registry holding it guards it.
+    """
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        """
+        Initialises the histogram
+
+        :param buckets: sorted tuple with the upper bounds of the buckets, an
+        extra bucket holds the observations above the last one
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Adds an observation
+
+        :param value: float
+        :return: None
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_percentile(self, percentile):
+        """
+        Estimates a percentile as the upper bound of the bucket holding it
+
+        :param percentile: float between 0 and 100
+        :return: float, None without observations or above the last bucket
+        """
+        if not self.count:
+            return None
+        rank = self.count * percentile / 100.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        """
+        Exports the histogram
+
+        :return: dictionary
+        """
+        return {'buckets': zip(self.buckets + ('+Inf',), self.counts),
+                'count': self.count,
+                'sum': self.sum}
+
+
+class MetricsRegistry(object):
+    """
+    Thread safe registry of counters and histograms
+
+    Metrics are identified by a name and labels given as keyword arguments.
+    Listeners are called with the kind of metric, counter or histogram, its
+    name, the value recorded and the labels, outside the lock of the
+    registry. A listener raising is logged and otherwise ignored.
+
+    Example:
+    --------
+        >>> metrics = MetricsRegistry()
+        >>> metrics.add_listener(lambda kind, name, value, labels: statsd.send(name, value, labels))
+        >>> spotify = Spotify(..., metrics=metrics)
+        >>> metrics.get_histogram('api_request_seconds', endpoint='/v1/me', method='GET').get_percentile(99)
+    """
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        """
+        Initialises the registry
+
+        :param buckets: sorted tuple with the upper bounds of the buckets of
+        the histograms
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """
+        Registers a callable to be called with every measurement
+
+        :param listener: callable receiving kind, name, value and labels
+        :return: None
+        """
+        with self._lock:
+            self._listeners = self._listeners + [listener]
+
+    def _notify(self, kind, name, value, labels):
+        """
+        Passes a measurement to the listeners
+
+        :param kind: string, counter or histogram
+        :param name: string
+        :param value: number
+        :param labels: dictionary
+        :return: None
+        """
+        for listener in self._listeners:
+            try:
+                listener(kind, name, value, labels)
+            except Exception:  # pylint: disable=broad-except
+                self._logger.exception('Metrics listener failed')
+
+    def increment(self, name, value=1, **labels):
+        """
+        Adds a value to a counter
+
+        :param name: string
+        :param value: number
+        :param labels: labels of the counter
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        if self._listeners:
+            self._notify('counter', name, value, labels)
+
+    def observe(self, name, value, **labels):
+        """
+        Adds an observation to a histogram
+
+        :param name: string
+        :param value: float
+        :param labels: labels of the histogram
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+        if self._listeners:
+            self._notify('histogram', name, value, labels)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the seconds the block takes in a histogram
+
+        :param name: string
+        :param labels: labels of the histogram
+        :return: None
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def get_counter(self, name, **labels):
+        """
+        Retrieves the value of a counter
+
+        :param name: string
+        :param labels: labels of the counter
+        :return: number, 0 if never incremented
+        """
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def get_histogram(self, name, **labels):
+        """
+        Retrieves a histogram
+
+        :param name: string
+        :param labels: labels of the histogram
+        :return: Histogram instance or None if never observed
+        """
+        with self._lock:
+            return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def snapshot(self):
+        """
+        Exports all the metrics
+
+        :return: dictionary with the counters and the histograms, every one a
+        list of dictionaries with name, labels and values
+        """
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = [dict(histogram.to_dict(), name=name, labels=dict(labels))
+                          for (name, labels), histogram in sorted(self._histograms.items())]
+        return {'counters': counters, 'histograms': histograms}
+
+
+class NullMetrics(object):
+    """
+    Registry that records nothing, used when no metrics are wanted
+    """
+
+    def increment(self, name, value=1, **labels):
+        """
+        Ignores the increment of a counter
+
+        :param name: string
+        :param value: number
+        :param labels: labels of the counter
+        :return: None
+        """
+        pass
+
+    def observe(self, name, value, **labels):
+        """
+        Ignores an observation of a histogram
+
+        :param name: string
+        :param value: number
+        :param labels: labels of the histogram
+        :return: None
+        """
+        pass
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Runs the block without timing it
+
+        :param name: string
+        :param labels: labels of the histogram
+        :return: None
+        """
+        yield
+
+
+class MetricsMiddleware(Middleware):
+    """
+    Measures every request actually sent to the API
+
+    It is the innermost layer, so every attempt of a retried request is
+    measured and responses served by the cache or coalesced are not. It
+    records the latency per endpoint and method, the responses per endpoint
+    and status, and the bytes received per endpoint.
+    """
+
+    def __init__(self, metrics):
+        """
+        Initialises the layer
+
+        :param metrics: MetricsRegistry instance
+        """
+        self.metrics = metrics
+
+    def handle(self, send, method, url, **kwargs):
+        """
+        Sends a request measuring its latency, status and size
+
+        :param send: callable sending the request through the layers below
+        :param method: HTTP verb as upper case string
+        :param url: string
+        :param kwargs: keyword arguments of the request
+        :return: Response instance
+        """
+        endpoint = get_endpoint(url)
+        start = time.time()
+        status = 'error'
+        try:
+            response = send(method, url, **kwargs)
+            status = response.status_code
+            self.metrics.increment('api_received_bytes', len(response.content), endpoint=endpoint)
+            return response
+        finally:
+            self.metrics.observe('api_request_seconds', time.time() - start, endpoint=endpoint, method=method)
+            self.metrics.increment('api_responses', endpoint=endpoint, status=status)
@@ -0,0 +1,329 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: pool.py
+
+"""
+Registry of authenticated clients for many accounts
+
+A single process acting on behalf of many users registers their credentials
+once and asks for a client by username when needed. Clients are authenticated
+on first use, share the connections to the API and are dropped when they have
+not been used for a while.
+"""
+
+from collections import OrderedDict
+from constants import *
+from spotifylib import Spotify, User
+from spotifylibexceptions import SpotifyError
+from concurrency import map_concurrently
+from adapters import PoolAdapter
+
+import logging
+import sys
+import threading
+import time
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+def authenticate_concurrently(accounts, max_workers=POOL_MAX_LOGINS, **kwargs):
+    """
+    Authenticates many accounts at once on a bounded pool of threads
+
+    Every account is a dictionary with the arguments of Spotify, that is
+    client_id, client_secret, username, password, callback and scope.
+
+    If any login fails, the clients already authenticated are closed and a
+    SpotifyError naming the account of the first failure is raised.
+
+    Example:
+    --------
+        >>> clients = authenticate_concurrently(accounts, max_workers=8)
+        >>> clients['some_username'].me()
+
+    :param accounts: iterable of dictionaries
+    :param max_workers: integer with the maximum logins running at once
+    :param kwargs: optional arguments of SpotifyAuthenticator for every client
+    :return: dictionary of Spotipy objects keyed by username
+    :raises: SpotifyError if any of the logins fails
+    """
+    accounts = list(accounts)
+
+    def authenticate(account):
+        arguments = dict(kwargs)
+        arguments.update(account)
+        try:
+            return Spotify(**arguments), None
+        except Exception:  # pylint: disable=broad-except
+            return None, sys.exc_info()
+
+    results = map_concurrently(authenticate, accounts, max_workers)
+    failures = [(account['username'], error) for account, (_, error) in zip(accounts, results) if error]
+    if failures:
+        for client, _ in results:
+            if client:
+                client.authenticator.close()
+        username, error = failures[0]
+        LOGGER.error('Failed to authenticate {count} of {total} accounts'.format(count=len(failures),
+                                                                                 total=len(accounts)))
+        raise SpotifyError, SpotifyError('Failed to authenticate {username}: {error!r}'
+                                         .format(username=username, error=error[1])), error[2]
+    return dict(zip([account['username'] for account in accounts], [client for client, _ in results]))
+
+
+class SpotifyPool(object):
+    """
+    Keeps authenticated clients for many accounts keyed by username
+
+    At most max_clients clients are kept alive, the least recently used one
+    is closed when a new one is needed. Clients not used for idle_timeout
+    seconds are closed as well, whenever a client is requested or evict_idle
+    is called. All clients use the same adapter for
+    the API so the connections to it are reused across accounts, while the
+    login flow keeps its cookies and connections per account. Using a token
+    store makes recreating an evicted client cheap.
+    """
+
+    def __init__(self,
+                 max_clients=POOL_MAX_CLIENTS,
+                 idle_timeout=POOL_IDLE_TIMEOUT,
+                 max_logins=POOL_MAX_LOGINS,
+                 api_pool_size=POOL_API_CONNECTIONS,
+                 **kwargs):
+        """
+        Initialises the pool
+
+        :param max_clients: integer with the maximum clients kept alive
+        :param idle_timeout: seconds a client is kept alive without being
+        used, None to keep them until max_clients is reached
+        :param max_logins: integer with the maximum logins running at once
+        :param api_pool_size: integer with the connections to the API kept
+        open for all the accounts
+        :param kwargs: optional arguments of SpotifyAuthenticator applied to
+        every client, but lazy since clients are authenticated on first use
+        already and lazy logins would escape max_logins
+        """
+        if kwargs.get('lazy'):
+            raise ValueError('Lazy clients are not supported, the pool authenticates them on first use')
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self._options = kwargs
+        self._accounts = {}
+        self._clients = OrderedDict()
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._account_locks = {}
+        self._max_logins = max_logins
+        self._logins = threading.BoundedSemaphore(max_logins)
+        self._api_adapter = PoolAdapter(pool_size=api_pool_size,
+                                        pool_block=kwargs.get('pool_block', POOL_BLOCK),
+                                        keep_alive=kwargs.get('keep_alive', True))
+
+    def __contains__(self, username):
+        """
+        Tells whether an account has a client alive
+
+        :param username: string
+        :return: boolean
+        """
+        with self._lock:
+            return username in self._clients
+
+    def __len__(self):
+        """
+        Number of clients alive
+
+        :return: integer
+        """
+        with self._lock:
+            return len(self._clients)
+
+    def register(self,
+                 client_id,
+                 client_secret,
+                 username,
+                 password,
+                 callback,
+                 scope):
+        """
+        Adds the credentials of an account without authenticating it
+
+        :param client_id: string
+        :param client_secret: string
+        :param username: string
+        :param password: string
+        :param callback: string
+        :param scope: string
+        :return: boolean
+        """
+        with self._lock:
+            self._accounts[username] = (User(client_id, client_secret, username, password),
+                                        callback,
+                                        scope)
+            self._account_locks.setdefault(username, threading.Lock())
+        return True
+
+    def get(self, username):
+        """
+        Retrieves the client of an account, authenticating it if needed
+
+        Concurrent calls for the same account wait for a single login. Idle
+        clients are evicted on the way.
+
+        :param username: string
+        :return: Spotipy object
+        """
+        with self._lock:
+            if username not in self._accounts:
+                raise SpotifyError('Account {} is not registered'.format(username))
+            client = self._use(username)
+            evicted = self._evict_idle()
+            account_lock = self._account_locks[username]
+        for stale in evicted:
+            stale.authenticator.close()
+        if client:
+            return client
+        with account_lock:
+            with self._lock:
+                client = self._use(username)
+                if client:
+                    return client
+                user, callback, scope = self._accounts[username]
+            with self._logins:
+                self._logger.debug('Authenticating {}'.format(username))
+                client = Spotify(user.client_id,
+                                 user.client_secret,
+                                 user.username,
+                                 user.password,
+                                 callback,
+                                 scope,
+                                 api_adapter=self._api_adapter,
+                                 **self._options)
+            with self._lock:
+                self._clients[username] = client
+                self._last_used[username] = time.time()
+                evicted = self._evict_overflow()
+        for stale in evicted:
+            stale.authenticator.close()
+        return client
+
+    def _use(self, username):
+        """
+        Marks the client of an account as the most recently used
+
+        Has to be called holding the lock.
+
+        :param username: string
+        :return: Spotipy object or None if the account has no client
+        """
+        if username not in self._clients:
+            return None
+        self._clients[username] = self._clients.pop(username)
+        self._last_used[username] = time.time()
+        return self._clients[username]
+
+    def _evict_idle(self):
+        """
+        Removes the clients not used for longer than the idle timeout
+
+        Has to be called holding the lock, the returned clients have to be
+        closed afterwards.
+
+        :return: list of Spotipy objects
+        """
+        evicted = []
+        if self.idle_timeout is None:
+            return evicted
+        deadline = time.time() - self.idle_timeout
+        while self._clients:
+            username = next(iter(self._clients))
+            if self._last_used[username] > deadline:
+                break
+            self._logger.debug('Evicting idle client of {}'.format(username))
+            evicted.append(self._clients.pop(username))
+            del self._last_used[username]
+        return evicted
+
+    def evict_idle(self):
+        """
+        Closes and drops the clients not used for longer than the idle timeout
+
+        :return: integer with the clients evicted
+        """
+        with self._lock:
+            evicted = self._evict_idle()
+        for client in evicted:
+            client.authenticator.close()
+        return len(evicted)
+
+    def _evict_overflow(self):
+        """
+        Removes the least recently used clients above the limit
+
+        Has to be called holding the lock, the returned clients have to be
+        closed afterwards.
+
+        :return: list of Spotipy objects
+        """
+        evicted = []
+        while len(self._clients) > self.max_clients:
+            username, client = self._clients.popitem(last=False)
+            del self._last_used[username]
+            self._logger.debug('Evicting least recently used client of {}'.format(username))
+            evicted.append(client)
+        return evicted
+
+    def authenticate_all(self, max_workers=None):
+        """
+        Authenticates all the registered accounts concurrently
+
+        Logins are still bounded by max_logins of the pool.
+
+        :param max_workers: integer with the threads to use, max_logins if None
+        :return: dictionary of Spotipy objects keyed by username
+        """
+        with self._lock:
+            usernames = list(self._accounts)
+        clients = map_concurrently(self.get, usernames, max_workers or self._max_logins)
+        return dict(zip(usernames, clients))
+
+    def evict(self, username):
+        """
+        Closes and drops the client of an account, keeping its credentials
+
+        :param username: string
+        :return: boolean
+        """
+        with self._lock:
+            client = self._clients.pop(username, None)
+            self._last_used.pop(username, None)
+        if not client:
+            return False
+        client.authenticator.close()
+        return True
+
+    def close(self):
+        """
+        Closes all the clients and the shared API connections
+
+        :return: None
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._last_used.clear()
+        for client in clients:
+            client.authenticator.close()
+        self._api_adapter.close()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: ratelimit.py
+
+"""
+Request scheduling according to Spotify's rate limits
+
+Spotify answers with a 429 and a Retry-After header when an application sends
+too many requests. The limiter here holds the requests towards a throttled
+host for that long instead of failing them, and can also keep the request
+rate of an application under a ceiling to avoid being throttled at all.
+
+The adaptive limiter finds the number of concurrent requests the API copes
+with at any given moment.
+"""
+
+from email.utils import parsedate_tz, mktime_tz
+from urlparse import urlparse
+from constants import *
+
+import logging
+import threading
+import time
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+def parse_retry_after(value, default):
+    """
+    Converts the value of a Retry-After header to seconds
+
+    The header holds either a number of seconds or an HTTP date.
+
+    :param value: string with the header value or None
+    :param default: seconds to use when the value is missing or invalid
+    :return: float with the seconds to wait
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if not date:
+        return default
+    return max(0.0, mktime_tz(date) - time.time())
+
+
+class RateLimiter(object):
+    """
+    Schedules requests honouring throttled hosts and an optional rate
+
+    Requests towards a host that answered with a 429 wait until its
+    Retry-After has passed, requests to other hosts carry on. With a rate,
+    requests also take a token from a bucket refilled at that many tokens per
+    second and holding at most burst tokens.
+
+    A single instance can be shared between clients to apply the rate to the
+    whole application.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        """
+        Initialises the limiter
+
+        :param rate: float with the maximum requests per second, None for no
+        limit
+        :param burst: integer with the maximum requests sent at once after
+        being idle, defaults to one second worth of requests
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._paused = {}
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        """
+        Adds the tokens earned since the last update to the bucket
+
+        :param now: float with the current epoch
+        :return: None
+        """
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, url):
+        """
+        Blocks until a request to the URL can be sent
+
+        :param url: string
+        :return: float with the seconds waited
+        """
+        host = urlparse(url).netloc
+        start = time.time()
+        with self._condition:
+            while True:
+                now = time.time()
+                wait = self._paused.get(host, 0) - now
+                if wait <= 0 and self.rate:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    wait = (1 - self._tokens) / self.rate
+                elif wait <= 0:
+                    break
+                self._condition.wait(wait)
+        return time.time() - start
+
+    def pause(self, url, seconds):
+        """
+        Holds the requests to the host of the URL for some seconds
+
+        :param url: string
+        :param seconds: float
+        :return: float with the epoch the host is paused until
+        """
+        host = urlparse(url).netloc
+        with self._condition:
+            until = max(self._paused.get(host, 0), time.time() + seconds)
+            self._paused[host] = until
+        self._logger.warning('Throttled by {host}, holding requests for {seconds:.1f}s'
+                             .format(host=host, seconds=seconds))
+        return until
+
+    def paused_until(self, url):
+        """
+        Tells until when the host of the URL is paused
+
+        :param url: string
+        :return: float with an epoch, in the past if not paused
+        """
+        with self._condition:
+            return self._paused.get(urlparse(url).netloc, 0)
+
+
+class AdaptiveLimiter(object):
+    """
+    Adapts the number of requests in flight to how the API responds
+
+    The limit grows additively while responses are healthy, by one request
+    every time a whole limit worth of requests succeeded, and is cut
+    multiplicatively on a 429, a 5xx, a connection error or a response slower
+    than the latency threshold. Decreases are spaced by a cooldown so a burst
+    of failures from the same moment counts once.
+    """
+
+    def __init__(self,
+                 initial=ADAPTIVE_INITIAL_LIMIT,
+                 minimum=ADAPTIVE_MINIMUM_LIMIT,
+                 maximum=ADAPTIVE_MAXIMUM_LIMIT,
+                 decrease=ADAPTIVE_DECREASE_FACTOR,
+                 latency_threshold=ADAPTIVE_LATENCY_THRESHOLD,
+                 cooldown=ADAPTIVE_COOLDOWN):
+        """
+        Initialises the limiter
+
+        :param initial: integer with the starting limit
+        :param minimum: integer with the lowest limit
+        :param maximum: integer with the highest limit
+        :param decrease: float the limit is multiplied by on failures
+        :param latency_threshold: seconds above which a response counts as a
+        failure, None to ignore latency
+        :param cooldown: minimum seconds between two decreases
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_threshold = latency_threshold
+        self.cooldown = cooldown
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._last_decrease = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """
+        Current maximum of requests in flight
+
+        :return: integer
+        """
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        """
+        Requests currently in flight
+
+        :return: integer
+        """
+        return self._in_flight
+
+    def acquire(self):
+        """
+        Blocks until the number of requests in flight is under the limit
+
+        :return: None
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, status_code, latency):
+        """
+        Records the outcome of a request and adapts the limit
+
+        :param status_code: integer with the status of the response, None if
+        the request failed without one
+        :param latency: float with the seconds the request took
+        :return: integer with the new limit
+        """
+        failed = (status_code is None or
+                  status_code == 429 or
+                  status_code >= 500 or
+                  (self.latency_threshold is not None and latency > self.latency_threshold))
+        with self._condition:
+            self._in_flight -= 1
+            now = time.time()
+            if not failed:
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            elif now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self._limit = max(self.minimum, self._limit * self.decrease)
+                self._logger.info('Concurrency limit decreased to {limit} after status '
+                                  '{status} in {latency:.2f}s'.format(limit=self.limit,
+                                                                      status=status_code,
+                                                                      latency=latency))
+            self._condition.notify_all()
+            return self.limit
@@ -0,0 +1,136 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: resp.py
+
+"""
+Minimal client of the Redis serialization protocol
+
+Just enough of RESP to keep tokens in Redis, or any server speaking its
+protocol, without depending on a Redis client library: commands are sent as
+arrays of bulk strings and the replies parsed into Python values.
+"""
+
+from spotifylibexceptions import RespError
+
+import logging
+import socket
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+def encode_command(*args):
+    """
+    Encodes a command as an array of bulk strings
+
+    Example:
+    --------
+        >>> encode_command('GET', 'key')
+        '*2\\r\\n$3\\r\\nGET\\r\\n$3\\r\\nkey\\r\\n'
+
+    :param args: command and its arguments
+    :return: string
+    """
+    parts = ['*{}\r\n'.format(len(args))]
+    for arg in args:
+        arg = arg.encode('utf-8') if isinstance(arg, unicode) else str(arg)
+        parts.append('${length}\r\n{arg}\r\n'.format(length=len(arg), arg=arg))
+    return ''.join(parts)
+
+
+class RespConnection(object):
+    """
+    Connection to a server speaking the Redis protocol
+
+    Not thread safe, every thread needs its own connection.
+    """
+
+    def __init__(self, host, port, timeout, password=None, db=0):
+        """
+        Connects and selects the database
+
+        :param host: string
+        :param port: integer
+        :param timeout: seconds to wait to connect and for every reply
+        :param password: string or None
+        :param db: integer with the number of the database
+        """
+        self._socket = socket.create_connection((host, port), timeout)
+        self._file = self._socket.makefile('rb')
+        if password:
+            self.execute('AUTH', password)
+        if db:
+            self.execute('SELECT', db)
+
+    def execute(self, *args):
+        """
+        Sends a command and reads its reply
+
+        :param args: command and its arguments
+        :return: string, integer, list or None
+        """
+        self._socket.sendall(encode_command(*args))
+        return self._read_reply()
+
+    def _read_reply(self):
+        """
+        Reads a reply
+
+        Error replies are raised, except inside arrays, as a transaction does.
+
+        :return: string, integer, list or None
+        """
+        reply = self._read_value()
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def _read_value(self):
+        """
+        Parses the next value sent by the server
+
+        A reply of an unknown type leaves the stream out of step with the
+        commands, so it fails like a broken connection.
+
+        :return: string, integer, list, None or RespError instance
+        """
+        line = self._file.readline()
+        if not line.endswith('\r\n'):
+            raise socket.error('Connection closed by the server')
+        kind, payload = line[0], line[1:-2]
+        if kind == '+':
+            return payload
+        if kind == '-':
+            return RespError(payload)
+        if kind == ':':
+            return int(payload)
+        if kind == '$':
+            length = int(payload)
+            if length < 0:
+                return None
+            return self._file.read(length + 2)[:-2]
+        if kind == '*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_value() for _ in range(length)]
+        raise socket.error('Unknown reply type {!r}'.format(kind))
+
+    def close(self):
+        """
+        Closes the connection
+
+        :return: None
+        """
+        try:
+            self._file.close()
+            self._socket.close()
+        except socket.error:
+            pass
@@ -0,0 +1,150 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: retry.py
+
+"""
+Retries of transient failures
+
+A dropped connection, a timeout or a 5xx from Spotify usually goes away when
+trying again a bit later. A retry policy runs a call again on such failures
+waiting an exponentially growing, randomised delay between attempts, within a
+maximum number of attempts and an overall deadline.
+"""
+
+from requests.exceptions import ConnectionError, Timeout
+from constants import *
+from spotifylibexceptions import SpotifyServerError
+
+import logging
+import random
+import sys
+import threading
+import time
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+class RetryPolicy(object):
+    """
+    Runs calls again on transient failures with jittered exponential backoff
+
+    A call is retried when it raises one of the retryable exceptions or
+    returns a response with a retryable status code. The delay before attempt
+    n + 1 is a random value between 0 and base_delay * 2 ** (n - 1), capped at
+    max_delay, so clients failing at the same time do not retry in lockstep.
+
+    The policy counts the retries and the calls that ran out of attempts, so
+    retry storms can be told apart from plain slowness.
+    """
+
+    def __init__(self,
+                 name='default',
+                 max_attempts=RETRY_MAX_ATTEMPTS,
+                 base_delay=RETRY_BASE_DELAY,
+                 max_delay=RETRY_MAX_DELAY,
+                 deadline=RETRY_DEADLINE,
+                 statuses=RETRY_STATUSES,
+                 exceptions=(ConnectionError, Timeout, SpotifyServerError),
+                 metrics=None):
+        """
+        Initialises the policy
+
+        :param name: string identifying the policy in logs and statistics
+        :param max_attempts: integer with the attempts including the first one
+        :param base_delay: seconds the backoff starts from
+        :param max_delay: maximum seconds between two attempts
+        :param deadline: maximum seconds spent on a call including all its
+        attempts, None for no deadline
+        :param statuses: status codes of the responses to retry
+        :param exceptions: tuple of the exceptions to retry
+        :param metrics: MetricsRegistry instance counting the retries and the
+        calls given up labelled by the name of the policy
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.statuses = frozenset(statuses)
+        self.exceptions = exceptions
+        self.retries = 0
+        self.exhausted = 0
+        self.metrics = metrics
+        self._lock = threading.Lock()
+
+    def get_delay(self, attempt):
+        """
+        Calculates the seconds to wait after a failed attempt
+
+        :param attempt: integer with the number of the failed attempt
+        :return: float
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _count(self, attribute):
+        """
+        Increments one of the counters of the policy
+
+        :param attribute: string with the name of the counter
+        :return: None
+        """
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+        if self.metrics:
+            self.metrics.increment('retries' if attribute == 'retries' else 'retries_exhausted', policy=self.name)
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls the function until it succeeds or the policy gives up
+
+        When giving up, the last exception is raised or the last response
+        returned, just as without retries.
+
+        :param function: callable
+        :param args: positional arguments of the function
+        :param kwargs: keyword arguments of the function
+        :return: the result of the function
+        """
+        start = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            error = None
+            try:
+                result = function(*args, **kwargs)
+                if getattr(result, 'status_code', None) not in self.statuses:
+                    return result
+                reason = 'status {}'.format(result.status_code)
+            except self.exceptions as exception:
+                error = sys.exc_info()
+                result = None
+                reason = repr(exception)
+            delay = self.get_delay(attempt)
+            out_of_time = self.deadline is not None and time.time() - start + delay > self.deadline
+            if attempt >= self.max_attempts or out_of_time:
+                self._count('exhausted')
+                self._logger.warning('Giving up {name} call after {attempt} attempts, '
+                                     'last failure: {reason}'.format(name=self.name,
+                                                                     attempt=attempt,
+                                                                     reason=reason))
+                if error:
+                    raise error[0], error[1], error[2]
+                return result
+            self._count('retries')
+            self._logger.info('Retrying {name} call in {delay:.2f}s after {reason}'
+                              .format(name=self.name, delay=delay, reason=reason))
+            if result is not None and hasattr(result, 'close'):
+                result.close()
+            time.sleep(delay)
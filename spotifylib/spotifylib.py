@@ -11,15 +11,27 @@ page.
 https://developer.spotify.com/web-api/authorization-guide/#authorization_code_flow
 """
 
-from requests import Session
 from urllib import quote
+from urlparse import urlparse, urljoin
 from base64 import b64encode
 from constants import *
 from collections import namedtuple
-from spotipy import Spotify as OriginalSpotify
-from spotifylibexceptions import SpotifyError
+from contextlib import contextmanager
+from spotifylibexceptions import SpotifyError, SpotifyServerError, SpotifyGrantError
+from requests import RequestException
+from concurrency import HostLimiter, RequestCoalescer
+from adapters import PoolAdapter
+from ratelimit import RateLimiter
+from retry import RetryPolicy
+from transport import (Middleware, SpotifySession, CoalescingMiddleware, CacheMiddleware, RetryMiddleware,
+                       ThrottlingMiddleware, ConcurrencyMiddleware)
+from metrics import NullMetrics, MetricsMiddleware
+from tracing import NullTracer
+from client import SpotifyClient
 
 import logging
+import threading
+import time
 
 
 __author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
@@ -33,11 +45,38 @@ LOGGER = logging.getLogger(LOGGER_BASENAME)
 LOGGER.addHandler(logging.NullHandler())
 
 
-Token = namedtuple('Token', ['access_token',
-                             'token_type',
-                             'expires_in',
-                             'refresh_token',
-                             'scope'])
+class Token(namedtuple('Token', ['access_token',
+                                 'token_type',
+                                 'expires_in',
+                                 'refresh_token',
+                                 'scope',
+                                 'issued_at'])):
+    """
+    Token as received from the token endpoint
+
+    Besides the values returned by Spotify it keeps the epoch timestamp the
+    token was issued at, so its expiry can be checked without any request.
+    """
+    __slots__ = ()
+
+    @property
+    def expires_at(self):
+        """
+        Epoch timestamp after which the access token is no longer valid
+
+        :return: float
+        """
+        return self.issued_at + self.expires_in
+
+    def is_expired(self, margin=0):
+        """
+        Checks if the access token is expired or will be within margin seconds
+
+        :param margin: integer
+        :return: boolean
+        """
+        return time.time() + margin >= self.expires_at
+
 
 User = namedtuple('User', ['client_id',
                            'client_secret',
@@ -45,7 +84,50 @@ User = namedtuple('User', ['client_id',
                            'password'])
 
 
-class SpotifyAuthenticator(object):
+class AccountsUrls(namedtuple('AccountsUrls', ['site',
+                                               'login',
+                                               'login_web',
+                                               'authorize_web',
+                                               'accept',
+                                               'token'])):
+    """
+    URLs of the login flow and the token endpoint under an accounts site
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_site(cls, site):
+        """
+        Builds the URLs for an accounts site
+
+        :param site: string with the base URL, like https://accounts.spotify.com
+        :return: AccountsUrls namedtuple
+        """
+        site = site.rstrip('/')
+        authorize_web = '{SITE}/en/authorize'.format(SITE=site)
+        return cls(site,
+                   '{SITE}/api/login'.format(SITE=site),
+                   '{SITE}/en/login'.format(SITE=site),
+                   authorize_web,
+                   '{AUTH_URL}/accept'.format(AUTH_URL=authorize_web),
+                   '{SITE}/api/token'.format(SITE=site))
+
+
+def raise_for_server_error(response):
+    """
+    Raises SpotifyServerError if Spotify failed processing the request
+
+    :param response: Response instance
+    :return: None
+    """
+    if response.status_code >= 500:
+        LOGGER.error(response.content)
+        raise SpotifyServerError("Spotify failed with status {status}. "
+                                 "Got: {content}".format(status=response.status_code,
+                                                         content=response.content))
+
+
+class SpotifyAuthenticator(Middleware):
     """
     Authenticator object
 
@@ -53,6 +135,9 @@ class SpotifyAuthenticator(object):
     all values for this to work, one has to create a new application under
     his/her account.
 
+    It is the outermost layer of the pipeline of its session, injecting the
+    token in every API request and refreshing it when needed.
+
     https://developer.spotify.com/my-applications/#!/applications
     """
     def __init__(self,
@@ -61,7 +146,30 @@ class SpotifyAuthenticator(object):
                  username,
                  password,
                  callback,
-                 scope):
+                 scope,
+                 token_store=None,
+                 refresh_margin=REFRESH_MARGIN,
+                 background_refresh=False,
+                 pool_size=API_POOL_SIZE,
+                 accounts_pool_size=ACCOUNTS_POOL_SIZE,
+                 pool_block=POOL_BLOCK,
+                 keep_alive=True,
+                 per_host_limit=None,
+                 api_adapter=None,
+                 lazy=False,
+                 rate_limiter=None,
+                 throttle_retries=THROTTLE_RETRIES,
+                 concurrency_limiter=None,
+                 api_retry=None,
+                 refresh_retry=None,
+                 login_retry=None,
+                 response_cache=None,
+                 request_coalescer=None,
+                 middleware=None,
+                 metrics=None,
+                 tracer=None,
+                 accounts_site=SITE,
+                 api_site=API_SITE):
         """
         Initialises object with credentials to perform the authentication
 
@@ -71,6 +179,43 @@ class SpotifyAuthenticator(object):
         :param password: string
         :param callback: string
         :param scope: string
+        :param token_store: TokenStore instance to reuse tokens between runs
+        :param refresh_margin: seconds before expiry to refresh the token
+        :param background_refresh: boolean to refresh from a separate thread
+        :param pool_size: integer with the maximum connections to the API kept
+        open, ignored with an api_adapter
+        :param accounts_pool_size: integer with the maximum connections to the
+        accounts site kept open
+        :param pool_block: boolean to make requests wait for a free connection
+        instead of opening throwaway ones when the pool is in use
+        :param keep_alive: boolean to reuse connections across requests
+        :param per_host_limit: integer with the maximum API requests in flight
+        per host
+        :param api_adapter: HTTPAdapter instance for the API shared with other
+        authenticators, it is left open when this one is closed
+        :param lazy: boolean to defer the authentication to the first request
+        :param rate_limiter: RateLimiter instance, share one between clients to
+        apply its rate to all of them
+        :param throttle_retries: integer with the times a throttled request is
+        held and sent again before returning the 429
+        :param concurrency_limiter: AdaptiveLimiter instance adapting the API
+        requests in flight, share one between clients to adapt them together
+        :param api_retry: RetryPolicy instance for idempotent API requests
+        :param refresh_retry: RetryPolicy instance for token refreshes
+        :param login_retry: RetryPolicy instance for every login step
+        :param response_cache: ResponseCache instance for the API responses
+        :param request_coalescer: RequestCoalescer instance sharing identical
+        GET requests in flight, share one between clients to count them
+        together
+        :param middleware: list of Middleware instances stacked right below
+        the authentication, so they see every API request with its token
+        :param metrics: MetricsRegistry instance recording the latency, status
+        and size of the API responses, the login steps, the refreshes and the
+        retries of the default retry policies
+        :param tracer: Tracer instance receiving a span for the authentication
+        with a child span for every step, and one for every token refresh
+        :param accounts_site: string with the base URL of the accounts site
+        :param api_site: string with the base URL of the API
         """
         self._logger = logging.getLogger('{base}.{suffix}'
                                          .format(base=LOGGER_BASENAME,
@@ -80,9 +225,42 @@ class SpotifyAuthenticator(object):
         self._callback = callback
         self._scope = scope
         self._token = None
-        self.session = Session()
-        HEADERS.update({'Referer': self._get_referer()})
-        self.__authenticate()
+        self._token_store = token_store
+        self._restored_cookies = set()
+        self._refresh_margin = refresh_margin
+        self._refresh_lock = threading.Lock()
+        self._authentication_lock = threading.Lock()
+        self._background_refresh = background_refresh
+        self._refresher = None
+        self._metrics = metrics or NullMetrics()
+        self._tracer = tracer or NullTracer()
+        self._refresh_retry = refresh_retry or RetryPolicy('refresh', metrics=metrics)
+        self._login_retry = login_retry or RetryPolicy('login', metrics=metrics)
+        self.urls = AccountsUrls.from_site(accounts_site)
+        self.api_site = api_site.rstrip('/')
+        layers = [self] + list(middleware or [])
+        layers.append(CoalescingMiddleware(request_coalescer or RequestCoalescer(), username))
+        if response_cache:
+            layers.append(CacheMiddleware(response_cache, username))
+        layers.append(RetryMiddleware(api_retry or RetryPolicy('api', metrics=metrics)))
+        layers.append(ThrottlingMiddleware(rate_limiter or RateLimiter(),
+                                           throttle_retries,
+                                           HostLimiter(per_host_limit) if per_host_limit else None))
+        if concurrency_limiter:
+            layers.append(ConcurrencyMiddleware(concurrency_limiter))
+        if metrics:
+            layers.append(MetricsMiddleware(metrics))
+        self.session = SpotifySession(layers, prefix='{}/'.format(self.api_site))
+        self.session.mount('{}/'.format(self.urls.site), PoolAdapter(pool_size=accounts_pool_size,
+                                             pool_block=pool_block,
+                                             keep_alive=keep_alive))
+        self._api_adapter = api_adapter
+        self.session.mount('{}/'.format(self.api_site), api_adapter or PoolAdapter(pool_size=pool_size,
+                                                                                   pool_block=pool_block,
+                                                                                   keep_alive=keep_alive))
+        self._headers = dict(HEADERS, Host=urlparse(self.urls.site).netloc, Referer=self._get_referer())
+        if not lazy:
+            self._ensure_authenticated()
 
     def _get_referer(self):
         """
@@ -93,37 +271,304 @@ class SpotifyAuthenticator(object):
 
         :return: string
         """
-        params = ('{auth}?scope={scope}&'.format(auth=AUTH_WEB_URL,
+        params = ('{auth}?scope={scope}&'.format(auth=self.urls.authorize_web,
                                                  scope=quote(self._scope)),
                   'redirect_uri={call}?'.format(call=quote(self._callback,
                                                            safe=':')),
                   'response_type=code?',
                   'client_id={client_id}'.format(client_id=self.user.client_id))
-        referer = ('{login_url}?'.format(login_url=LOGIN_WEB_URL),
+        referer = ('{login_url}?'.format(login_url=self.urls.login_web),
                    'continue={params}'.format(params=quote(''.join(params),
                                                            safe=':')))
         return ''.join(referer)
 
     @property
     def token(self):
+        """
+        Current token, None until a lazy authenticator is used for the first time
+
+        :return: Token namedtuple
+        """
+        return self._token
+
+    @property
+    def headers(self):
+        """
+        Headers sent along the login flow requests of this authenticator
+
+        They are built per instance so concurrent logins do not interfere, a
+        copy is returned so they cannot be altered from outside.
+
+        :return: dictionary
+        """
+        return dict(self._headers)
+
+    def stop(self):
+        """
+        Stops the background token refresher if it is running
+
+        :return: boolean
+        """
+        if not self._refresher:
+            return False
+        self._refresher.stop()
+        self._refresher = None
+        return True
+
+    def close(self):
+        """
+        Releases the resources held by the authenticator
+
+        Stops the background refresher and closes the connections of the
+        session, except for the shared API adapter.
+
+        :return: None
+        """
+        self.stop()
+        for adapter in self.session.adapters.values():
+            if adapter is not self._api_adapter:
+                adapter.close()
+
+    def _ensure_authenticated(self):
+        """
+        Authenticates once, no matter how many threads ask for it at once
+
+        Starts the background refresher after authenticating if required.
+
+        :return: Token namedtuple
+        """
+        if self._token:
+            return self._token
+        with self._authentication_lock:
+            if not self._token:
+                self.__authenticate()
+                if self._background_refresh:
+                    self._refresher = TokenRefresher(self)
+                    self._refresher.start()
         return self._token
 
     def __authenticate(self):
         """
         Runs authentication process
 
-        Performs all the steps described in the API documentation and then
-        patches every request to verify if the token is still valid.
+        Performs all the steps described in the API documentation and makes
+        the token available to the session.
+
+        If a token store is configured and holds a token for the user, the
+        login steps are skipped and the stored token is used instead. The lock
+        of the store is held meanwhile, so processes sharing it wait for the
+        one logging in and use its token.
+
+        Otherwise the login starts from the cookies of the previous one kept
+        in the store. With the user still logged in the login step is
+        skipped, and with the application already approved the accounts site
+        redirects to the callback right away, skipping the accept step too.
+
+        :return: boolean
+        """
+        with self._tracer.span('spotify.authenticate', username=self.user.username):
+            with self._lock_token_store():
+                with self._tracer.span('spotify.token.restore'):
+                    token = self._restore_token()
+                if not token:
+                    self._restore_cookies()
+                    with self._metrics.timer('login_seconds'):
+                        response = self._run_login_step('authorize', self._get_authorization)
+                        if self._is_callback(response):
+                            self._logger.debug('Application already approved, skipping login and accept')
+                            self._metrics.increment('login_steps_skipped', step='login')
+                            self._metrics.increment('login_steps_skipped', step='accept')
+                        else:
+                            response = self._log_in_and_accept()
+                        token = self._run_login_step('token', self._get_token, response)
+                    self._metrics.increment('logins')
+                    token = self._publish_token(None, token)
+                    self._save_cookies()
+                self._update_token(token)
+        return True
+
+    def _log_in_and_accept(self):
+        """
+        Runs the login and accept steps, the former only if required
+
+        With the session cookie of a previous login the application is
+        accepted straight away. Any answer of the accounts site not leading
+        to the callback means it does not take the session anymore, the
+        restored cookies are then dropped and the user logs in.
+
+        :return: Response instance of the accept step
+        """
+        if self.session.cookies.get(LOGIN_COOKIE):
+            try:
+                response = self._run_login_step('accept', self._accept_app_to_account)
+            except SpotifyServerError:
+                raise
+            except SpotifyError:
+                response = None
+            if response is not None and self._is_callback(response):
+                self._metrics.increment('login_steps_skipped', step='login')
+                return response
+            self._logger.info('Session of the previous login not valid anymore, logging in')
+            self._clear_restored_cookies()
+        self._run_login_step('login', self._login_to_account)
+        return self._run_login_step('accept', self._accept_app_to_account)
+
+    def _restore_cookies(self):
+        """
+        Loads the cookies of the previous login from the token store
+
+        Cookies already in the session, from a login of this authenticator,
+        are newer and kept.
 
         :return: boolean
         """
-        self._get_authorization()
-        self._login_to_account()
-        response = self._accept_app_to_account()
-        self._token = self._get_token(response)
-        self._monkey_patch_session()
+        if not self._token_store or self.session.cookies.get(LOGIN_COOKIE):
+            return False
+        cookies = self._token_store.load_cookies(self.user.username)
+        if not cookies:
+            return False
+        self._restored_cookies = set((cookie.domain, cookie.path, cookie.name, cookie.value) for cookie in cookies)
+        self.session.cookies.update(cookies)
         return True
 
+    def _clear_restored_cookies(self):
+        """
+        Removes the cookies restored from the token store from the session
+
+        Cookies the accounts site set again since then are kept.
+
+        :return: None
+        """
+        for cookie in list(self.session.cookies):
+            if (cookie.domain, cookie.path, cookie.name, cookie.value) in self._restored_cookies:
+                self.session.cookies.clear(cookie.domain, cookie.path, cookie.name)
+        self._restored_cookies = set()
+
+    def _save_cookies(self):
+        """
+        Keeps the cookies of the session in the token store for the next login
+
+        :return: boolean
+        """
+        if not self._token_store:
+            return False
+        return self._token_store.save_cookies(self.user.username, self.session.cookies)
+
+    @contextmanager
+    def _lock_token_store(self):
+        """
+        Holds the lock of the user in the token store, if one is configured
+
+        :return: None
+        """
+        if not self._token_store:
+            yield
+            return
+        with self._token_store.lock(self.user.username):
+            yield
+
+    def _run_login_step(self, step, function, *args):
+        """
+        Runs a step of the login flow with its retries, measures and traces it
+
+        :param step: string naming the step
+        :param function: callable of the step
+        :param args: positional arguments of the step
+        :return: the result of the step
+        """
+        with self._tracer.span('spotify.login.{}'.format(step)):
+            with self._metrics.timer('login_step_seconds', step=step):
+                return self._login_retry.call(function, *args)
+
+    def _renew(self, token):
+        """
+        Renews a token with its retries, measures and traces it
+
+        :param token: Token namedtuple to renew
+        :return: Token namedtuple
+        """
+        outcome = 'failed'
+        try:
+            with self._tracer.span('spotify.token.refresh', username=self.user.username):
+                with self._metrics.timer('token_refresh_seconds'):
+                    renewed = self._refresh_retry.call(self._renew_token, self.session, self.user, token,
+                                                       self.urls.token)
+            outcome = 'renewed'
+            return renewed
+        finally:
+            self._metrics.increment('token_refreshes', outcome=outcome)
+
+    def _restore_token(self):
+        """
+        Retrieves a usable token from the token store
+
+        A stored token that is still valid is used as is. An expired one is
+        renewed with its refresh token and stored again. The stored token is
+        only discarded when the accounts site rejects its refresh token, a
+        failure to renew it for any other reason, like an outage, leaves it
+        for the other processes sharing the store.
+
+        :return: Token namedtuple or None if a login is required
+        """
+        if not self._token_store:
+            return None
+        token = self._token_store.load(self.user.username)
+        if not token:
+            return None
+        if not token.is_expired():
+            self._logger.debug('Using stored token')
+            return token
+        self._logger.debug('Stored token expired, trying to refresh it')
+        try:
+            return self._publish_token(token, self._renew(token))
+        except SpotifyGrantError:
+            self._logger.warning('Refresh token of the stored token rejected, logging in')
+            self._token_store.delete(self.user.username)
+        except (SpotifyError, ValueError, RequestException):
+            self._logger.warning('Could not refresh stored token, logging in')
+        return None
+
+    def _load_newer_token(self, stale_token):
+        """
+        Retrieves a token renewed by another process from the token store
+
+        :param stale_token: Token namedtuple that needs to be replaced
+        :return: Token namedtuple or None if the stored one is not newer
+        """
+        if not self._token_store:
+            return None
+        token = self._token_store.load(self.user.username)
+        if (not token or token.access_token == stale_token.access_token
+                or token.issued_at < stale_token.issued_at or token.is_expired(self._refresh_margin)):
+            return None
+        return token
+
+    def _publish_token(self, expected, token):
+        """
+        Saves a new token in the token store if one is configured
+
+        The token is only saved if the stored one is still the one it
+        replaces. When another process or host stored its own meanwhile, that
+        one is adopted instead, so all of them use the same token.
+
+        :param expected: Token namedtuple replaced or None after a login
+        :param token: Token namedtuple
+        :return: Token namedtuple to use
+        """
+        if not self._token_store:
+            return token
+        for _ in range(2):
+            if self._token_store.compare_and_set(self.user.username, expected, token):
+                return token
+            stored = self._token_store.load(self.user.username)
+            if stored and not stored.is_expired(self._refresh_margin):
+                self._logger.debug('Another process stored a token first, adopting it')
+                self._metrics.increment('token_refreshes', outcome='adopted')
+                return stored
+            expected = stored
+        self._logger.warning('Could not store token for {}'.format(self.user.username))
+        return token
+
     def _get_authorization(self):
         """
         Retrieves the landing page to request authorization
@@ -134,23 +579,62 @@ class SpotifyAuthenticator(object):
 
         It then adds a "__bon_cookie" in the Session with its value.
 
-        :return: boolean
+        A logged in user who already approved the application is redirected
+        to the callback with the code instead, that redirect is returned as
+        is since the callback is not meant to be reached from here. Any other
+        redirect within the accounts site is followed, relative ones resolved
+        against the page sending them, while redirects leaving it are refused
+        so the login cookies and headers are never sent elsewhere.
+
+        :return: Response instance
         """
         params = {'scope': self._scope,
                   'redirect_uri': self._callback,
                   'response_type': 'code',
                   'client_id': self.user.client_id}
-        response = self.session.get(AUTH_WEB_URL,
-                                    headers=HEADERS,
-                                    params=params)
-        if not response.ok:
+        response = self.session.get(self.urls.authorize_web,
+                                    headers=self._headers,
+                                    params=params,
+                                    allow_redirects=False)
+        for _ in range(self.session.max_redirects):
+            if not response.is_redirect or self._is_callback(response):
+                break
+            location = urljoin(response.url, response.headers['Location'])
+            if not location.startswith('{}/'.format(self.urls.site)):
+                raise SpotifyError('Authorization page redirected outside of the accounts site, to {}'
+                                   .format(location))
+            response = self.session.get(location,
+                                        headers=self._headers,
+                                        allow_redirects=False)
+        if self._is_callback(response):
+            return response
+        raise_for_server_error(response)
+        if not response.ok or response.is_redirect:
             self._logger.exception(response.content)
             raise SpotifyError("Failed to get authorization page. "
                                "Message: {}".format(response.content))
         __bon_cookie = {'name': '__bon',
                         'value': self.__get_bon(response)}
         self.session.cookies.set(**__bon_cookie)
-        return True
+        return response
+
+    def _is_callback(self, response):
+        """
+        Tells whether a response redirects to the callback
+
+        The accounts site redirects with a Location header, or with the
+        redirect of a JSON document when accepting the application.
+
+        :param response: Response instance
+        :return: boolean
+        """
+        if response.is_redirect:
+            return response.headers['Location'].startswith(self._callback)
+        try:
+            redirect = response.json().get('redirect')
+        except (ValueError, AttributeError):
+            return False
+        return isinstance(redirect, basestring) and redirect.startswith(self._callback)
 
     @staticmethod
     def __get_bon(response):
@@ -204,9 +688,10 @@ class SpotifyAuthenticator(object):
                    'username': self.user.username,
                    'password': self.user.password,
                    'csrf_token': self.session.cookies.get('csrf_token')}
-        response = self.session.post(API_LOGIN_URL,
+        response = self.session.post(self.urls.login,
                                      data=payload,
-                                     headers=HEADERS)
+                                     headers=self._headers)
+        raise_for_server_error(response)
         if response.status_code == 400:
             self._logger.exception(response.content)
             raise SpotifyError("Failed to login to API. "
@@ -234,9 +719,11 @@ class SpotifyAuthenticator(object):
                    'response_type': 'code',
                    'client_id': self.user.client_id,
                    'csrf_token': self.session.cookies.get('csrf_token')}
-        response = self.session.post(ACCEPT_URL,
+        response = self.session.post(self.urls.accept,
                                      data=payload,
-                                     headers=HEADERS)
+                                     headers=self._headers,
+                                     allow_redirects=False)
+        raise_for_server_error(response)
         if response.status_code == 400:
             self._logger.exception(response.content)
             raise SpotifyError(response.content)
@@ -249,11 +736,13 @@ class SpotifyAuthenticator(object):
         This is the 4th step in the authorization flow and it exchanges the code
         for a token. The token is the final value to interact with Spotify's API.
 
-        :param response: Response instance
+        :param response: Response instance of the accept step, or the redirect
+        to the callback
         :return: Token namedtuple
         """
         try:
-            code = response.json().get('redirect', '').split('code=')[1]
+            redirect = response.headers['Location'] if response.is_redirect else response.json().get('redirect', '')
+            code = redirect.split('code=')[1]
         except (AttributeError, IndexError):
             self._logger.exception(response.content)
             raise SpotifyError("Error while getting the token. "
@@ -261,10 +750,10 @@ class SpotifyAuthenticator(object):
         payload = {'grant_type': 'authorization_code',
                    'code': code,
                    'redirect_uri': self._callback}
-        return self._retrieve_token(self.session, self.user, payload)
+        return self._retrieve_token(self.session, self.user, payload, self.urls.token)
 
     @staticmethod
-    def _renew_token(session, user, token):
+    def _renew_token(session, user, token, token_url=TOKEN_URL):
         """
         Get a new token from the last known refresh token
 
@@ -279,14 +768,16 @@ class SpotifyAuthenticator(object):
 
         :param session: Session instance
         :param user: User namedtuple
+        :param token: Token namedtuple
+        :param token_url: string with the URL of the token endpoint
         :return: Token namedtuple
         """
         payload = {'grant_type': 'refresh_token',
                    'refresh_token': token.refresh_token}
-        return SpotifyAuthenticator._retrieve_token(session, user, payload)
+        return SpotifyAuthenticator._retrieve_token(session, user, payload, token_url)
 
     @staticmethod
-    def _retrieve_token(session, user, payload):
+    def _retrieve_token(session, user, payload, token_url=TOKEN_URL):
         """
         Helper method to request and get the token
 
@@ -302,24 +793,32 @@ class SpotifyAuthenticator(object):
         :param session: Session object
         :param user: User namedtuple
         :param payload: dictionary
+        :param token_url: string with the URL of the token endpoint
         :return: Token namedtuple
         """
         base64encoded = b64encode('{user_id}:{secret}'.format(user_id=user.client_id,
                                                               secret=user.client_secret))
         headers = {'Authorization': 'Basic {}'.format(base64encoded)}
-        response = session.post(TOKEN_URL,
+        response = session.post(token_url,
                                 data=payload,
                                 headers=headers)
-        if response.status_code == 400:
+        raise_for_server_error(response)
+        if response.status_code in (400, 401):
             LOGGER.exception(response.content)
-            raise SpotifyError("Couldn't get new token from refresh token. "
-                               "Got: {}".format(response.content))
+            try:
+                error = response.json().get('error')
+            except (ValueError, AttributeError):
+                error = None
+            exception = SpotifyGrantError if response.status_code == 401 or error == 'invalid_grant' else SpotifyError
+            raise exception("Couldn't get new token from refresh token. "
+                            "Got: {}".format(response.content))
         tokens = response.json()
         # When requesting a new token from a refresh token, we do not get a
         # new refresh token back so this will update the response with the
         # already known refresh token so that Token namedtuple can be populated.
         if not tokens.get('refresh_token'):
-            tokens.update({'refresh_token': session.token.refresh_token})
+            tokens.update({'refresh_token': payload.get('refresh_token')})
+        tokens.update({'issued_at': time.time()})
         token_values = [tokens.get(key) for key in Token._fields]
         if not all(token_values):
             LOGGER.exception(response.content)
@@ -327,55 +826,158 @@ class SpotifyAuthenticator(object):
                              'Got: {}'.format(response.json()))
         return Token(*token_values)
 
-    def _monkey_patch_session(self):
+    def handle(self, send, method, url, **kwargs):
         """
-        Gets original request method and overrides it with the patched one
+        Sends an API request with the current token, refreshing it if required
 
-        It also sets Token and User namedtuples as well as the renew token
-        method as session attributes.
+        The token is refreshed ahead when it is about to expire, and when
+        Spotify answers that it expired anyway the request is sent again with
+        a new one.
 
-        :return: Response instance
-        """
-        self.session.original_request = self.session.request
-        self.session.token = self.token
-        self.session.user = self.user
-        self.session.renew_token = self._renew_token
-        self.session.request = self._patched_request
-
-    def _patched_request(self, method, url, **kwargs):
-        """
-        Patch the original request from Spotipy library if required.
-
-        This method aims to validate if the session is still valid by first
-        running the former request from Spotipy's and if not, retrieve a new
-        token and try the request again.
-
-        Spotipy's uses the following method to make HTTP requests so this
-        patches it with the updated Session (auth, token, etc).
+        Spotipy builds its requests with the token it was given, which this
+        layer replaces with the current one.
 
         https://github.com/plamere/spotipy/blob/master/spotipy/client.py#L97
 
+        :param send: callable sending the request through the layers below
         :param method: HTTP verb as string
         :param url: string
         :param kwargs: keyword arguments
         :return: Response instance
         """
-        self._logger.debug(('Using patched request for method {method}, '
-                            'url {url}').format(method=method, url=url))
-        response = self.session.original_request(method, url, **kwargs)
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug('Sending request for method {method}, url {url}'.format(method=method,
+                                                                                       url=url))
+        token = self._token or self._ensure_authenticated()
+        if token.is_expired(self._refresh_margin):
+            self._logger.info('Token about to expire, refreshing it ahead')
+            token = self._refresh_token(token)
+        self._set_authorization(kwargs, token)
+        response = send(method, url, **kwargs)
         if response.status_code == 401 and response.json() == INVALID_TOKEN_MSG:
             self._logger.warning('Expired token detected, trying to refresh!')
-            self.session.token = self.session.renew_token(self.session,
-                                                          self.user,
-                                                          self.token)
-            token = self.session.token.access_token
-            self.session.parent._auth = token
-            kwargs['headers'].update({'Authorization': 'Bearer {}'.format(token)
-                                      })
+            token = self._refresh_token(token)
+            self._set_authorization(kwargs, token)
             self._logger.debug('Updated headers, trying again initial request')
-            response = self.session.original_request(method, url, **kwargs)
+            response = send(method, url, **kwargs)
         return response
 
+    def _refresh_token(self, stale_token):
+        """
+        Renews the token and propagates it
+
+        Only one refresh runs at a time. Callers pass the token they found
+        expired and if another thread already replaced it while they were
+        waiting, the current token is returned without refreshing it again.
+        Likewise, a newer token saved in the token store by another process
+        is adopted instead of refreshing.
+
+        :param stale_token: Token namedtuple that needs to be replaced
+        :return: Token namedtuple
+        """
+        with self._refresh_lock:
+            if self._token.access_token != stale_token.access_token:
+                self._logger.debug('Token already refreshed by another thread')
+                return self._token
+            with self._lock_token_store():
+                token = self._load_newer_token(stale_token)
+                if token:
+                    self._logger.debug('Token already refreshed by another process')
+                    self._metrics.increment('token_refreshes', outcome='adopted')
+                else:
+                    token = self._publish_token(stale_token, self._renew(stale_token))
+                self._update_token(token)
+            return token
+
+    def _update_token(self, token):
+        """
+        Replaces the current token and propagates it
+
+        The token is set on the session and on Spotipy's object so that the
+        following requests are built with it.
+
+        :param token: Token namedtuple
+        :return: None
+        """
+        self._token = token
+        parent = self.session.parent
+        if parent:
+            parent._auth = token.access_token
+
+    @staticmethod
+    def _set_authorization(kwargs, token):
+        """
+        Updates the Authorization header of a request with the given token
+
+        Spotipy builds the headers before the request reaches the session, so
+        they may carry a token that another thread has replaced meanwhile.
+
+        :param kwargs: keyword arguments of the request
+        :param token: Token namedtuple
+        :return: dictionary with the headers
+        """
+        headers = kwargs.get('headers') or {}
+        headers.update({'Authorization': 'Bearer {}'.format(token.access_token)})
+        kwargs['headers'] = headers
+        return headers
+
+
+class TokenRefresher(threading.Thread):
+    """
+    Background thread refreshing the token of an authenticator ahead of expiry
+
+    It sleeps until the token is about to expire, taking the refresh margin of
+    the authenticator into account, and then renews it so that requests never
+    have to wait for a refresh.
+    """
+    def __init__(self, authenticator, retry_delay=REFRESH_RETRY_DELAY):
+        """
+        Initialises the thread as a daemon for the given authenticator
+
+        :param authenticator: SpotifyAuthenticator instance
+        :param retry_delay: seconds to wait before retrying a failed refresh
+        """
+        super(TokenRefresher, self).__init__(name='TokenRefresher-{user}'
+                                             .format(user=authenticator.user.username))
+        self.daemon = True
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self._authenticator = authenticator
+        self._retry_delay = retry_delay
+        self._stopped = threading.Event()
+
+    def run(self):
+        """
+        Refreshes the token every time it gets close to its expiry
+
+        :return: None
+        """
+        while not self._stopped.is_set():
+            authenticator = self._authenticator
+            token = authenticator.token
+            wait = (token.expires_at -
+                    authenticator._refresh_margin -
+                    time.time())
+            if wait > 0:
+                self._stopped.wait(wait)
+                continue
+            try:
+                authenticator._refresh_token(token)
+                self._logger.debug('Token refreshed in the background')
+            except Exception:  # pylint: disable=broad-except
+                self._logger.exception('Background refresh failed, retrying')
+                self._stopped.wait(self._retry_delay)
+
+    def stop(self):
+        """
+        Signals the thread to finish
+
+        :return: None
+        """
+        self._stopped.set()
+
 
 class Spotify(object):
     """
@@ -390,7 +992,8 @@ class Spotify(object):
                 username,
                 password,
                 callback,
-                scope):
+                scope,
+                **kwargs):
         """
         Initialises object and returns Spotipy's authenticated
 
@@ -400,15 +1003,16 @@ class Spotify(object):
         :param password: string
         :param callback: string
         :param scope: string
-        :return: Spotipy object
+        :param kwargs: optional arguments of SpotifyAuthenticator and the
+        catalog_cache of SpotifyClient
+        :return: SpotifyClient object
         """
+        catalog_cache = kwargs.pop('catalog_cache', None)
         authenticated = SpotifyAuthenticator(client_id,
                                              client_secret,
                                              username,
                                              password,
                                              callback,
-                                             scope)
-        spotify = OriginalSpotify(auth=authenticated.token.access_token,
-                                  requests_session=authenticated.session)
-        spotify._session.parent = spotify
-        return spotify
+                                             scope,
+                                             **kwargs)
+        return SpotifyClient(authenticated, catalog_cache=catalog_cache)
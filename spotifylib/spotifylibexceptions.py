@@ -37,3 +37,38 @@ class SpotifyError(Exception):
         ``'Illegal redirect_uri'``
     """
     pass
+
+
+class SpotifyServerError(SpotifyError):
+    """
+    Spotify failed to process a request on its side
+
+    Raised on ``5xx`` responses during the login flow or while retrieving a
+    token. These errors are usually transient, so they are retried.
+    """
+    pass
+
+
+class SpotifyGrantError(SpotifyError):
+    """
+    The accounts site rejected the grant exchanged for a token
+
+    Raised on an ``invalid_grant`` error or a ``401`` from the token endpoint,
+    meaning the refresh token or the code will never be accepted again.
+
+    Example:
+    --------
+        ``'{"error":"invalid_grant","error_description":"Invalid refresh token"}'``
+    """
+    pass
+
+
+class RespError(Exception):
+    """
+    Error reply of a server speaking the Redis protocol
+
+    Example:
+    --------
+        ``'WRONGTYPE Operation against a key holding the wrong kind of value'``
+    """
+    pass
@@ -0,0 +1,898 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: stubserver.py
+
+"""
+Local stand-in for the accounts site and the API of Spotify
+
+The stub runs the accounts site and the API on two local ports, so the
+authenticator and everything stacked on it can be exercised and load tested
+without reaching Spotify. The accounts site follows the login flow the
+authenticator scripts: the authorization page with its BON value, the login,
+the approval of the application and the token endpoint, checking the CSRF
+token, the BON cookie, the credentials and the authorization code along the
+way. The API serves the current user, the catalog lookups and the saved
+tracks, and more endpoints can be added as routes.
+
+Latency, throttling and server errors can be injected for any path, and the
+tokens it issues expire after a configurable time, or on demand, answering
+401 as Spotify does.
+
+Example:
+--------
+    >>> with StubServer(users={'wizzler': 'secret'}) as stub:
+    ...     stub.throttle(count=2, retry_after=0.5, path='/v1/me')
+    ...     spotify = Spotify('client', 'secret', 'wizzler', 'secret', 'http://localhost/callback', 'scope',
+    ...                       accounts_site=stub.accounts_site, api_site=stub.api_site)
+    ...     spotify.me()
+
+It can also be run on its own, pointing the library at it with the
+SPOTIFYLIB_ACCOUNTS_SITE and SPOTIFYLIB_API_SITE environment variables:
+
+    python -m spotifylib.stubserver --accounts-port 8001 --api-port 8002
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from base64 import b64encode, b64decode
+from collections import namedtuple, deque, Counter
+from httplib import responses
+from urlparse import urlparse, parse_qsl
+from constants import *
+
+import argparse
+import binascii
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+StubRequest = namedtuple('StubRequest', ['method',
+                                         'path',
+                                         'query',
+                                         'form',
+                                         'headers',
+                                         'cookies',
+                                         'username'])
+
+
+def get_cookies(header):
+    """
+    Parses the Cookie header of a request
+
+    :param header: string or None
+    :return: dictionary
+    """
+    cookies = {}
+    for cookie in (header or '').split(';'):
+        name, _, value = cookie.strip().partition('=')
+        if name:
+            cookies[name] = value
+    return cookies
+
+
+def get_bon_cookie(bon):
+    """
+    Calculates the __bon cookie expected for a BON value
+
+    :param bon: list as served by the authorization page
+    :return: b64encoded string
+    """
+    values = list(bon) + [bon[-1] * 42, 1, 1, 1, 1]
+    return b64encode('|'.join([str(value) for value in values]))
+
+
+def get_error(status):
+    """
+    Builds the error document of the API for a status
+
+    :param status: integer
+    :return: dictionary
+    """
+    return {'error': {'status': status, 'message': responses.get(status, 'Error')}}
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """
+    Passes every request to the stub and writes its answer over HTTP/1.1
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this the body waits
+    # for the delayed acknowledgement of the headers
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        """
+        Keeps the requests out of the standard error, the stub records them
+
+        :param args: format and its arguments
+        :return: None
+        """
+        pass
+
+    def do_GET(self):
+        """
+        Passes the request on to the stub, whatever its method
+
+        :return: None
+        """
+        self.server.stub.dispatch(self)
+
+    do_POST = do_PUT = do_DELETE = do_GET
+
+    def reply(self, status, body=None, headers=None):
+        """
+        Writes a response with a JSON body
+
+        :param status: integer
+        :param body: JSON serializable object or None for an empty body
+        :param headers: dictionary or list of tuples, to repeat a header
+        :return: None
+        """
+        content = '' if body is None else json.dumps(body)
+        self.send_response(status)
+        for name, value in (headers.items() if isinstance(headers, dict) else headers or []):
+            self.send_header(name, value)
+        if content:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StubHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded server for one of the sites of the stub
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, stub, role):
+        """
+        Binds the server
+
+        :param address: tuple with the host and the port, 0 for any
+        :param stub: StubServer instance answering the requests
+        :param role: string, accounts or api
+        """
+        HTTPServer.__init__(self, address, StubRequestHandler)
+        self.stub = stub
+        self.role = role
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def get_request(self):
+        """
+        Accepts a connection and tracks it until it is shut down
+
+        :return: tuple with the socket and the address of the client
+        """
+        connection, address = HTTPServer.get_request(self)
+        with self._lock:
+            self._connections.add(connection)
+        return connection, address
+
+    def shutdown_request(self, request):
+        """
+        Shuts a connection down and stops tracking it
+
+        :param request: socket of the connection
+        :return: None
+        """
+        with self._lock:
+            self._connections.discard(request)
+        HTTPServer.shutdown_request(self, request)
+
+    def close_connections(self):
+        """
+        Hangs up the connections kept alive, ending their threads
+
+        :return: None
+        """
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def handle_error(self, request, client_address):
+        """
+        Ignores the errors of the connections, like clients hanging up
+
+        Errors answering a request are logged by the stub.
+        """
+        pass
+
+    @property
+    def url(self):
+        """
+        Base URL of the server
+
+        :return: string
+        """
+        return 'http://{host}:{port}'.format(host=self.server_address[0], port=self.server_address[1])
+
+
+class StubServer(object):
+    """
+    Accounts site and API of Spotify on local ports
+
+    Users and clients are accepted with any password and secret unless given.
+    All the state is guarded by a lock, so the stub can be driven from tests
+    while it serves many threads. The counters in stats tell how many
+    authorizations, redirects of approved users, logins, approvals, code
+    grants, refreshes, rejected tokens, faults and revalidations it served.
+    """
+    _bulk_limits = {'tracks': TRACKS_LIMIT,
+                    'artists': ARTISTS_LIMIT,
+                    'albums': ALBUMS_LIMIT,
+                    'audio-features': AUDIO_FEATURES_LIMIT}
+    _types = {'tracks': 'track',
+              'artists': 'artist',
+              'albums': 'album',
+              'audio-features': 'audio_features'}
+
+    def __init__(self,
+                 host=STUB_HOST,
+                 accounts_port=0,
+                 api_port=0,
+                 users=None,
+                 clients=None,
+                 token_ttl=STUB_TOKEN_TTL,
+                 latency=0,
+                 saved_tracks=0):
+        """
+        Binds the accounts site and the API
+
+        :param host: string with the address to listen on
+        :param accounts_port: integer with the port of the accounts site, 0 for
+        any free one
+        :param api_port: integer with the port of the API, 0 for any free one
+        :param users: dictionary with the password of every user, None to
+        accept anyone
+        :param clients: dictionary with the secret of every client, None to
+        accept any
+        :param token_ttl: seconds the access tokens issued are valid for
+        :param latency: seconds every request is delayed
+        :param saved_tracks: integer with the tracks saved by every user
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.users = users
+        self.clients = clients
+        self.token_ttl = token_ttl
+        self.saved_tracks = saved_tracks
+        self.missing_ids = set()
+        self.profiles = {}
+        self.approvals = set()
+        self.stats = Counter()
+        self.requests = deque(maxlen=STUB_REQUEST_LOG)
+        self._lock = threading.Lock()
+        self._latency = {'': latency}
+        self._faults = []
+        self._issued = 0
+        self._access_tokens = {}
+        self._refresh_tokens = {}
+        self._csrf_tokens = {}
+        self._sessions = {}
+        self._codes = {}
+        self._accounts_routes = [('GET', re.compile(r'^/en/authorize/?$'), self._authorize),
+                                 ('POST', re.compile(r'^/api/login/?$'), self._login),
+                                 ('POST', re.compile(r'^/en/authorize/accept/?$'), self._accept),
+                                 ('POST', re.compile(r'^/api/token/?$'), self._grant_token)]
+        self._api_routes = [('GET', re.compile(r'^/v1/me/?$'), self._get_current_profile),
+                            ('GET', re.compile(r'^/v1/me/tracks/?$'), self._get_saved_tracks),
+                            ('GET', re.compile(r'^/v1/users/([^/]+)/?$'), self._get_profile),
+                            ('GET', re.compile(r'^/v1/(tracks|artists|albums|audio-features)/?$'), self._get_several),
+                            ('GET', re.compile(r'^/v1/(tracks|artists|albums|audio-features)/([^/]+)$'), self._get_one)]
+        self._servers = [StubHTTPServer((host, accounts_port), self, 'accounts'),
+                         StubHTTPServer((host, api_port), self, 'api')]
+        self._threads = []
+
+    @property
+    def accounts_site(self):
+        """
+        Base URL of the accounts site
+
+        :return: string
+        """
+        return self._servers[0].url
+
+    @property
+    def api_site(self):
+        """
+        Base URL of the API
+
+        :return: string
+        """
+        return self._servers[1].url
+
+    def start(self):
+        """
+        Serves both sites from background threads
+
+        :return: StubServer instance
+        """
+        for server in self._servers:
+            thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05},
+                                      name='StubServer-{}'.format(server.role))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the sockets
+
+        :return: None
+        """
+        for server in self._servers:
+            if self._threads:
+                server.shutdown()
+            server.server_close()
+            server.close_connections()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __enter__(self):
+        """
+        Starts serving
+
+        :return: StubServer instance
+        """
+        return self.start()
+
+    def __exit__(self, *args):
+        """
+        Stops serving
+
+        :param args: exception details if any
+        :return: None
+        """
+        self.stop()
+
+    def add_token(self, username, access_token=None, refresh_token=None, scope=STUB_SCOPE, expires_in=None):
+        """
+        Registers tokens as if they had been issued, like the ones of a store
+
+        :param username: string with the user the tokens belong to
+        :param access_token: string or None
+        :param refresh_token: string or None
+        :param scope: string
+        :param expires_in: seconds the access token is valid for, the token
+        ttl of the stub if None
+        :return: None
+        """
+        with self._lock:
+            if access_token:
+                expires_at = time.time() + (self.token_ttl if expires_in is None else expires_in)
+                self._access_tokens[access_token] = (username, scope, expires_at)
+            if refresh_token:
+                self._refresh_tokens[refresh_token] = (username, scope)
+
+    def expire_tokens(self):
+        """
+        Expires all the access tokens issued so far, refresh tokens stay valid
+
+        :return: None
+        """
+        with self._lock:
+            self._access_tokens.clear()
+
+    def expire_sessions(self):
+        """
+        Logs out all the users, their approvals stay
+
+        :return: None
+        """
+        with self._lock:
+            self._sessions.clear()
+
+    def revoke_refresh_tokens(self):
+        """
+        Revokes all the refresh tokens issued so far, forcing a new login
+
+        :return: None
+        """
+        with self._lock:
+            self._refresh_tokens.clear()
+
+    def set_latency(self, seconds, path=''):
+        """
+        Delays the requests to the paths under a prefix
+
+        The longest prefix set for a path applies.
+
+        :param seconds: float
+        :param path: string with the path prefix, all the paths if empty
+        :return: None
+        """
+        with self._lock:
+            self._latency[path] = seconds
+
+    def inject(self, status, count=1, path='', headers=None, body=None):
+        """
+        Answers the next requests to the paths under a prefix with a status
+
+        Faults are served in the order they were injected, before checking
+        the token.
+
+        Example:
+        --------
+            >>> stub.inject(503, count=2, path='/api/token')
+
+        :param status: integer
+        :param count: integer with the requests to answer
+        :param path: string with the path prefix, all the paths if empty
+        :param headers: dictionary
+        :param body: JSON serializable object, the error document of the
+        status if None
+        :return: None
+        """
+        with self._lock:
+            self._faults.append([path, count, status, get_error(status) if body is None else body, headers])
+
+    def throttle(self, count=1, retry_after=1, path=''):
+        """
+        Answers the next requests to the paths under a prefix with a 429
+
+        :param count: integer with the requests to throttle
+        :param retry_after: seconds sent in the Retry-After header
+        :param path: string with the path prefix, all the paths if empty
+        :return: None
+        """
+        self.inject(429, count, path, {'Retry-After': str(retry_after)})
+
+    def add_route(self, method, pattern, handler):
+        """
+        Adds an API endpoint, taking precedence over the built in ones
+
+        The handler is called with a StubRequest, whose username is the owner
+        of the token, and the groups of the pattern, and returns the status,
+        the body and optionally the headers.
+
+        Example:
+        --------
+            >>> stub.add_route('GET', r'^/v1/playlists/([^/]+)$',
+            ...                lambda request, playlist: (200, {'id': playlist, 'owner': request.username}))
+
+        :param method: HTTP verb as upper case string
+        :param pattern: string with a regular expression matching the path
+        :param handler: callable
+        :return: None
+        """
+        with self._lock:
+            self._api_routes.insert(0, (method, re.compile(pattern), handler))
+
+    def get_requests(self, path=''):
+        """
+        Retrieves the latest requests received for the paths under a prefix
+
+        :param path: string with the path prefix, all the paths if empty
+        :return: list of StubRequest namedtuples
+        """
+        with self._lock:
+            return [request for request in self.requests if request.path.startswith(path)]
+
+    def dispatch(self, handler):
+        """
+        Answers a request received by any of the sites
+
+        :param handler: StubRequestHandler instance
+        :return: None
+        """
+        url = urlparse(handler.path)
+        length = int(handler.headers.getheader('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else ''
+        request = StubRequest(handler.command,
+                              url.path,
+                              dict(parse_qsl(url.query)),
+                              dict(parse_qsl(body)),
+                              handler.headers,
+                              get_cookies(handler.headers.getheader('Cookie')),
+                              None)
+        with self._lock:
+            self.requests.append(request)
+            latency = self._get_latency(url.path)
+            fault = self._take_fault(url.path)
+        if latency:
+            time.sleep(latency)
+        if fault:
+            handler.reply(*fault)
+            return
+        try:
+            response = self._route(handler.server.role, request)
+        except Exception:  # pylint: disable=broad-except
+            self._logger.exception('Stub failed answering {method} {path}'.format(method=request.method,
+                                                                                  path=request.path))
+            response = (500, get_error(500))
+        handler.reply(*response)
+
+    def _get_latency(self, path):
+        """
+        Finds the latency of a path, called with the lock held
+
+        :param path: string
+        :return: float
+        """
+        prefix = max([prefix for prefix in self._latency if path.startswith(prefix)], key=len)
+        return self._latency[prefix]
+
+    def _take_fault(self, path):
+        """
+        Takes the next fault for a path, called with the lock held
+
+        :param path: string
+        :return: tuple with the status, body and headers or None
+        """
+        for fault in self._faults:
+            if path.startswith(fault[0]):
+                fault[1] -= 1
+                if not fault[1]:
+                    self._faults.remove(fault)
+                self.stats['faults'] += 1
+                return tuple(fault[2:])
+        return None
+
+    def _route(self, role, request):
+        """
+        Finds the handler of a request and calls it
+
+        API requests need a valid token and their successful GET responses
+        carry an ETag, answering 304 when it matches If-None-Match.
+
+        :param role: string, accounts or api
+        :param request: StubRequest namedtuple
+        :return: tuple with the status, body and headers
+        """
+        routes = self._accounts_routes
+        if role == 'api':
+            if not request.headers.getheader('Authorization'):
+                return 401, {'error': {'status': 401, 'message': 'No token provided'}}, None
+            username = self._get_token_owner(request.headers.getheader('Authorization'))
+            if username is None:
+                with self._lock:
+                    self.stats['unauthorized'] += 1
+                return 401, INVALID_TOKEN_MSG, None
+            request = request._replace(username=username)
+            routes = self._api_routes
+        for method, pattern, function in routes:
+            match = pattern.match(request.path)
+            if match and method == request.method:
+                response = function(request, *match.groups())
+                break
+        else:
+            return 404, get_error(404), None
+        status, body, headers = (tuple(response) + (None,))[:3]
+        if role == 'api' and request.method == 'GET' and status == 200:
+            etag = '"{}"'.format(hashlib.md5(json.dumps(body, sort_keys=True)).hexdigest())
+            headers = dict(headers or {}, **{'ETag': etag, 'Cache-Control': 'private, max-age=0'})
+            if request.headers.getheader('If-None-Match') == etag:
+                with self._lock:
+                    self.stats['not_modified'] += 1
+                return 304, None, headers
+        return status, body, headers
+
+    def _get_token_owner(self, authorization):
+        """
+        Finds the user of a valid access token
+
+        :param authorization: string with the Authorization header
+        :return: string or None if the token is unknown or expired
+        """
+        access_token = authorization.partition(' ')[2]
+        with self._lock:
+            username, _, expires_at = self._access_tokens.get(access_token, (None, None, 0))
+        return username if expires_at > time.time() else None
+
+    def _issue_token(self, username, scope):
+        """
+        Issues a new access token
+
+        :param username: string
+        :param scope: string
+        :return: dictionary with the token response without refresh token
+        """
+        with self._lock:
+            self._issued += 1
+            access_token = 'token-{}'.format(self._issued)
+            self._access_tokens[access_token] = (username, scope, time.time() + self.token_ttl)
+        return {'access_token': access_token,
+                'token_type': 'Bearer',
+                'expires_in': self.token_ttl,
+                'scope': scope}
+
+    def _is_client(self, client_id, secret=None):
+        """
+        Checks a client and, if given, its secret
+
+        :param client_id: string
+        :param secret: string or None
+        :return: boolean
+        """
+        if not client_id:
+            return False
+        if self.clients is None:
+            return True
+        return client_id in self.clients and secret in (None, self.clients[client_id])
+
+    def _check_csrf(self, request):
+        """
+        Checks the CSRF token of a form against the cookie set with it
+
+        :param request: StubRequest namedtuple
+        :return: string with the token or None if invalid
+        """
+        csrf_token = request.form.get('csrf_token')
+        with self._lock:
+            valid = csrf_token in self._csrf_tokens
+        return csrf_token if valid and csrf_token == request.cookies.get('csrf_token') else None
+
+    def _authorize(self, request):
+        """
+        Serves the authorization page with its BON value
+
+        A logged in user who already approved the client is redirected right
+        away with a code, as the accounts site does.
+
+        :param request: StubRequest namedtuple
+        :return: tuple with the status, body and headers
+        """
+        client_id = request.query.get('client_id')
+        if not self._is_client(client_id) or request.query.get('response_type') != 'code':
+            return 400, {'error': 'invalid_request'}
+        redirect_uri = request.query.get('redirect_uri')
+        with self._lock:
+            username = self._sessions.get(request.cookies.get(LOGIN_COOKIE))
+            approved = redirect_uri and (username, client_id) in self.approvals
+        if approved:
+            code = binascii.hexlify(os.urandom(16))
+            with self._lock:
+                self._codes[code] = (client_id, redirect_uri, username, request.query.get('scope') or STUB_SCOPE)
+                self.stats['authorizations'] += 1
+                self.stats['redirects'] += 1
+            return 302, None, {'Location': '{uri}?code={code}'.format(uri=redirect_uri, code=code)}
+        bon = ['0', '0', -random.randint(1, 2 ** 31)]
+        csrf_token = binascii.hexlify(os.urandom(16))
+        with self._lock:
+            self._csrf_tokens[csrf_token] = get_bon_cookie(bon)
+            self.stats['authorizations'] += 1
+        return (200,
+                {'BON': bon, 'country': 'NL', 'client': {'name': request.query['client_id']}, 'locales': ['*']},
+                [('Set-Cookie', 'csrf_token={}; Path=/'.format(csrf_token))])
+
+    def _login(self, request):
+        """
+        Logs a user in, setting the session cookie
+
+        :param request: StubRequest namedtuple
+        :return: tuple with the status, body and headers
+        """
+        csrf_token = self._check_csrf(request)
+        if not csrf_token:
+            return 400, {'error': 'errorCSRF'}
+        with self._lock:
+            bon = self._csrf_tokens[csrf_token]
+        if request.cookies.get('__bon') != bon:
+            return 400, {'error': 'errorInvalidBon'}
+        username = request.form.get('username')
+        if not username or (self.users is not None and self.users.get(username) != request.form.get('password')):
+            return 400, {'error': 'errorInvalidCredentials'}
+        session = binascii.hexlify(os.urandom(16))
+        with self._lock:
+            self._sessions[session] = username
+            self.stats['logins'] += 1
+        headers = [('Set-Cookie', '{name}={value}; Path=/; HttpOnly'.format(name=LOGIN_COOKIE, value=session))]
+        if request.form.get('remember') == 'true':
+            headers.append(('Set-Cookie', 'remember={}; Path=/'.format(username)))
+        return 200, {'displayName': username}, headers
+
+    def _accept(self, request):
+        """
+        Approves the application for the logged in user and issues a code
+
+        :param request: StubRequest namedtuple
+        :return: tuple with the status and body
+        """
+        if not self._check_csrf(request):
+            return 400, {'error': 'errorCSRF'}
+        with self._lock:
+            username = self._sessions.get(request.cookies.get(LOGIN_COOKIE))
+        if not username:
+            return 400, {'error': 'errorNotLoggedIn'}
+        client_id = request.form.get('client_id')
+        redirect_uri = request.form.get('redirect_uri')
+        if not self._is_client(client_id) or not redirect_uri or request.form.get('response_type') != 'code':
+            return 400, {'error': 'invalid_request'}
+        code = binascii.hexlify(os.urandom(16))
+        with self._lock:
+            self._codes[code] = (client_id, redirect_uri, username, request.form.get('scope') or STUB_SCOPE)
+            self.approvals.add((username, client_id))
+            self.stats['approvals'] += 1
+        return 200, {'redirect': '{uri}?code={code}'.format(uri=redirect_uri, code=code)}
+
+    def _grant_token(self, request):
+        """
+        Exchanges an authorization code or a refresh token for a token
+
+        :param request: StubRequest namedtuple
+        :return: tuple with the status and body
+        """
+        try:
+            client_id, _, secret = b64decode(request.headers.getheader('Authorization', '')
+                                             .partition('Basic ')[2]).partition(':')
+        except TypeError:
+            client_id, secret = None, None
+        if not self._is_client(client_id, secret):
+            return 400, {'error': 'invalid_client'}
+        grant_type = request.form.get('grant_type')
+        if grant_type == 'authorization_code':
+            with self._lock:
+                issued = self._codes.pop(request.form.get('code'), None)
+            if not issued or issued[:2] != (client_id, request.form.get('redirect_uri')):
+                return 400, {'error': 'invalid_grant', 'error_description': 'Invalid authorization code'}
+            token = self._issue_token(*issued[2:])
+            token['refresh_token'] = token['access_token'].replace('token-', 'refresh-')
+            with self._lock:
+                self._refresh_tokens[token['refresh_token']] = issued[2:]
+                self.stats['grants'] += 1
+            return 200, token
+        if grant_type == 'refresh_token':
+            with self._lock:
+                owner = self._refresh_tokens.get(request.form.get('refresh_token'))
+            if not owner:
+                return 400, {'error': 'invalid_grant', 'error_description': 'Invalid refresh token'}
+            with self._lock:
+                self.stats['refreshes'] += 1
+            return 200, self._issue_token(*owner)
+        return 400, {'error': 'unsupported_grant_type'}
+
+    def _get_profile(self, request, username):
+        """
+        Serves the public profile of a user
+
+        :param request: StubRequest namedtuple
+        :param username: string
+        :return: tuple with the status and body
+        """
+        with self._lock:
+            profile = self.profiles.get(username)
+        return 200, profile or {'id': username,
+                                'display_name': username,
+                                'type': 'user',
+                                'uri': 'spotify:user:{}'.format(username)}
+
+    def _get_current_profile(self, request):
+        """
+        Serves the profile of the owner of the token
+
+        :param request: StubRequest namedtuple
+        :return: tuple with the status and body
+        """
+        return self._get_profile(request, request.username)
+
+    def _get_object(self, kind, identifier):
+        """
+        Builds a catalog object, None for the IDs set as missing
+
+        :param kind: string with the collection, like tracks
+        :param identifier: string
+        :return: dictionary or None
+        """
+        if identifier in self.missing_ids:
+            return None
+        catalog_object = {'id': identifier, 'type': self._types[kind]}
+        if kind == 'audio-features':
+            catalog_object['uri'] = 'spotify:track:{}'.format(identifier)
+        else:
+            catalog_object['uri'] = 'spotify:{kind}:{id}'.format(kind=self._types[kind], id=identifier)
+            catalog_object['name'] = '{kind} {id}'.format(kind=self._types[kind].title(), id=identifier)
+        return catalog_object
+
+    def _get_several(self, request, kind):
+        """
+        Serves a bulk lookup, within the limit of IDs of its endpoint
+
+        :param request: StubRequest namedtuple
+        :param kind: string with the collection, like tracks
+        :return: tuple with the status and body
+        """
+        ids = [identifier for identifier in request.query.get('ids', '').split(',') if identifier]
+        if not ids:
+            return 400, {'error': {'status': 400, 'message': 'invalid id'}}
+        if len(ids) > self._bulk_limits[kind]:
+            return 400, {'error': {'status': 400, 'message': 'Too many ids requested'}}
+        return 200, {kind.replace('-', '_'): [self._get_object(kind, identifier) for identifier in ids]}
+
+    def _get_one(self, request, kind, identifier):
+        """
+        Serves a single catalog object
+
+        :param request: StubRequest namedtuple
+        :param kind: string with the collection, like tracks
+        :param identifier: string
+        :return: tuple with the status and body
+        """
+        catalog_object = self._get_object(kind, identifier)
+        if catalog_object is None:
+            return 404, {'error': {'status': 404, 'message': 'non existing id'}}
+        return 200, catalog_object
+
+    def _get_saved_tracks(self, request):
+        """
+        Serves a page of the saved tracks of the user
+
+        :param request: StubRequest namedtuple
+        :return: tuple with the status and body
+        """
+        try:
+            offset = int(request.query.get('offset', 0))
+            limit = int(request.query.get('limit', 20))
+        except ValueError:
+            return 400, {'error': {'status': 400, 'message': 'Invalid offset or limit'}}
+        if not 0 < limit <= STUB_PAGE_LIMIT or offset < 0:
+            return 400, {'error': {'status': 400, 'message': 'Invalid limit'}}
+        total = self.saved_tracks
+        end = min(offset + limit, total)
+        href = '{site}/v1/me/tracks?offset={{offset}}&limit={limit}'.format(site=self.api_site, limit=limit)
+        return 200, {'href': href.format(offset=offset),
+                     'items': [{'added_at': '2017-09-18T00:00:00Z', 'track': self._get_object('tracks', str(index))}
+                               for index in range(offset, end)],
+                     'limit': limit,
+                     'offset': offset,
+                     'total': total,
+                     'next': href.format(offset=end) if end < total else None,
+                     'previous': href.format(offset=max(offset - limit, 0)) if offset else None}
+
+
+def main():
+    """
+    Runs a stub server until interrupted, printing how to point clients to it
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Local stand-in for the accounts site and the API of Spotify')
+    parser.add_argument('--host', default=STUB_HOST)
+    parser.add_argument('--accounts-port', type=int, default=0)
+    parser.add_argument('--api-port', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--token-ttl', type=int, default=STUB_TOKEN_TTL)
+    parser.add_argument('--saved-tracks', type=int, default=100)
+    arguments = parser.parse_args()
+    stub = StubServer(arguments.host, arguments.accounts_port, arguments.api_port,
+                      token_ttl=arguments.token_ttl, latency=arguments.latency,
+                      saved_tracks=arguments.saved_tracks).start()
+    print('export SPOTIFYLIB_ACCOUNTS_SITE={}'.format(stub.accounts_site))
+    print('export SPOTIFYLIB_API_SITE={}'.format(stub.api_site))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,821 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: tokenstore.py
+
+"""
+Token storage backends
+
+A token store keeps the last known Token of an account around so that a new
+SpotifyAuthenticator can pick it up instead of running the whole login flow
+again. Any object implementing the TokenStore interface can be passed to the
+authenticator.
+
+Stores shared between processes, like the workers of a pre-fork server, also
+provide a lock per key. The authenticator holds it while it logs in or
+refreshes, and checks the store for a token renewed by another process before
+doing it itself, so a single process talks to the accounts site for all of
+them.
+
+Stores can also keep the cookies of the accounts site for a key, so that a
+new login reuses the session of the previous one and skips the steps it
+already went through.
+"""
+
+from contextlib import contextmanager
+from tempfile import mkstemp
+from constants import *
+from spotifylib import Token
+from spotifylibexceptions import RespError
+from resp import RespConnection
+from requests.cookies import RequestsCookieJar, create_cookie
+
+import binascii
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover, not available on Windows
+    fcntl = None
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+def is_same_token(token, other):
+    """
+    Compares two tokens, any of them possibly None, by their access token
+
+    :param token: Token namedtuple or None
+    :param other: Token namedtuple or None
+    :return: boolean
+    """
+    if token is None or other is None:
+        return token is other
+    return token.access_token == other.access_token
+
+
+def dump_token(token):
+    """
+    Serializes a token as JSON
+
+    :param token: Token namedtuple
+    :return: string
+    """
+    return json.dumps(dict(token._asdict()))
+
+
+def load_token(content):
+    """
+    Deserializes a token from JSON
+
+    :param content: string
+    :return: Token namedtuple
+    :raises: ValueError, KeyError or TypeError if it is not a token
+    """
+    values = json.loads(content)
+    return Token(*[values[field] for field in Token._fields])
+
+
+def dump_cookie_jar(cookies):
+    """
+    Serializes the cookies of a jar as JSON
+
+    Expired cookies are left out, session cookies are kept as they carry the
+    state of the login.
+
+    :param cookies: CookieJar instance
+    :return: string
+    """
+    now = time.time()
+    return json.dumps([{'name': cookie.name,
+                        'value': cookie.value,
+                        'domain': cookie.domain,
+                        'path': cookie.path,
+                        'secure': cookie.secure,
+                        'expires': cookie.expires,
+                        'rest': {'HttpOnly': None} if cookie.has_nonstandard_attr('HttpOnly') else {}}
+                       for cookie in cookies if not cookie.is_expired(now)])
+
+
+def load_cookie_jar(content):
+    """
+    Deserializes the cookies of a jar from JSON
+
+    :param content: string
+    :return: RequestsCookieJar instance
+    :raises: ValueError, KeyError or TypeError if it is not a list of cookies
+    """
+    jar = RequestsCookieJar()
+    for values in json.loads(content):
+        jar.set_cookie(create_cookie(**values))
+    return jar
+
+
+class TokenStore(object):
+    """
+    Interface of a token store
+
+    Tokens are stored under a key, which is the username of the account the
+    token belongs to.
+    """
+
+    def load(self, key):
+        """
+        Retrieves the stored token for a key
+
+        :param key: string
+        :return: Token namedtuple or None if nothing is stored
+        """
+        raise NotImplementedError
+
+    def save(self, key, token):
+        """
+        Stores a token under a key replacing any previous one
+
+        :param key: string
+        :param token: Token namedtuple
+        :return: boolean
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Removes the stored token for a key if any
+
+        :param key: string
+        :return: boolean
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Holds the exclusive lock of a key across all the users of the store
+
+        Stores only used by a single process need no lock, which is what this
+        default does. The lock is held for as long as a login or a refresh
+        takes, compare_and_set must not need it.
+
+        :param key: string
+        :return: None
+        """
+        yield
+
+    def compare_and_set(self, key, expected, token):
+        """
+        Stores a token under a key only if the stored one is the expected one
+
+        Tokens are compared by their access token. This default is not atomic,
+        stores shared between processes or hosts override it.
+
+        :param key: string
+        :param expected: Token namedtuple or None when nothing is expected to
+        be stored
+        :param token: Token namedtuple
+        :return: boolean, False if another token was stored meanwhile
+        """
+        if not is_same_token(self.load(key), expected):
+            return False
+        return self.save(key, token)
+
+    def load_cookies(self, key):
+        """
+        Retrieves the stored cookies of the accounts site for a key
+
+        Stores keeping no cookies, like this default, make every login start
+        from scratch.
+
+        :param key: string
+        :return: RequestsCookieJar instance or None if nothing is stored
+        """
+        return None
+
+    def save_cookies(self, key, cookies):
+        """
+        Stores the cookies of the accounts site for a key
+
+        They are credentials just like the refresh token, so they deserve the
+        same care.
+
+        :param key: string
+        :param cookies: CookieJar instance
+        :return: boolean
+        """
+        return False
+
+
+class FileTokenStore(TokenStore):
+    """
+    Stores every token as a JSON file in a directory
+
+    Files are written to a temporary file first and then renamed over the
+    previous one so a reader never sees a half written token, even when the
+    process dies in the middle of a write.
+
+    Every key has a lock file next to its token, locked with flock so that
+    the lock is released by the system if its holder dies. The directory can
+    be shared by all the processes of a host.
+    """
+
+    def __init__(self, directory, lock_timeout=TOKEN_LOCK_TIMEOUT):
+        """
+        Initialises the store in the given directory
+
+        The directory is created if it does not exist yet.
+
+        :param directory: string
+        :param lock_timeout: seconds to wait for the lock of a key before going
+        on without it
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.lock_timeout = lock_timeout
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o700)
+
+    def _get_path(self, key, extension='json'):
+        """
+        Constructs the path of the file holding the token of a key
+
+        :param key: string
+        :param extension: string with the extension of the file
+        :return: string
+        """
+        filename = '{key}.{extension}'.format(key=key.replace(os.sep, '_'), extension=extension)
+        return os.path.join(self.directory, filename)
+
+    def load(self, key):
+        """
+        Reads the token for a key from its file
+
+        Unreadable or corrupted files are treated as missing so that the
+        authenticator falls back to a regular login.
+
+        :param key: string
+        :return: Token namedtuple or None
+        """
+        try:
+            with open(self._get_path(key)) as token_file:
+                return load_token(token_file.read())
+        except (IOError, ValueError, KeyError, TypeError):
+            self._logger.debug('No usable token stored for {key}'.format(key=key))
+            return None
+
+    def _write(self, path, content):
+        """
+        Writes a file atomically, readable only by its owner
+
+        :param path: string
+        :param content: string
+        :return: boolean
+        """
+        descriptor, temporary_path = mkstemp(dir=self.directory,
+                                             prefix='.{name}.'.format(name=os.path.basename(path)),
+                                             suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as output_file:
+                output_file.write(content)
+                output_file.flush()
+                os.fsync(output_file.fileno())
+            os.rename(temporary_path, path)
+        except (IOError, OSError):
+            self._logger.exception('Could not write {path}'.format(path=path))
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return False
+        return True
+
+    def save(self, key, token):
+        """
+        Writes the token for a key atomically
+
+        :param key: string
+        :param token: Token namedtuple
+        :return: boolean
+        """
+        return self._write(self._get_path(key), dump_token(token))
+
+    def delete(self, key):
+        """
+        Removes the token file of a key
+
+        :param key: string
+        :return: boolean
+        """
+        try:
+            os.remove(self._get_path(key))
+        except OSError:
+            return False
+        return True
+
+    @contextmanager
+    def _hold(self, path):
+        """
+        Holds an flock on a file
+
+        When the lock cannot be taken within the lock timeout, which means its
+        holder is stuck, the block runs without it.
+
+        :param path: string with the path of the lock file
+        :return: None
+        """
+        if not fcntl:
+            yield
+            return
+        with open(path, 'a') as lock_file:
+            deadline = time.time() + self.lock_timeout
+            locked = False
+            while not locked:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except IOError:
+                    if time.time() >= deadline:
+                        self._logger.warning('Timed out waiting for the lock {path}'.format(path=path))
+                        break
+                    time.sleep(TOKEN_LOCK_POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                if locked:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def lock(self, key):
+        """
+        Holds the lock file of a key
+
+        :param key: string
+        :return: context manager
+        """
+        return self._hold(self._get_path(key, 'lock'))
+
+    def compare_and_set(self, key, expected, token):
+        """
+        Writes the token of a key if the stored one is the expected one
+
+        The check and the write run under a lock file of their own, apart
+        from the one of lock, so it can be called while holding that one.
+
+        :param key: string
+        :param expected: Token namedtuple or None
+        :param token: Token namedtuple
+        :return: boolean
+        """
+        with self._hold(self._get_path(key, 'write.lock')):
+            return super(FileTokenStore, self).compare_and_set(key, expected, token)
+
+    def load_cookies(self, key):
+        """
+        Reads the cookies of a key from the file next to its token
+
+        :param key: string
+        :return: RequestsCookieJar instance or None
+        """
+        try:
+            with open(self._get_path(key, 'cookies')) as cookies_file:
+                return load_cookie_jar(cookies_file.read())
+        except (IOError, ValueError, KeyError, TypeError):
+            self._logger.debug('No usable cookies stored for {key}'.format(key=key))
+            return None
+
+    def save_cookies(self, key, cookies):
+        """
+        Writes the cookies of a key atomically next to its token
+
+        :param key: string
+        :param cookies: CookieJar instance
+        :return: boolean
+        """
+        return self._write(self._get_path(key, 'cookies'), dump_cookie_jar(cookies))
+
+
+class MemoryTokenStore(TokenStore):
+    """
+    Keeps the tokens in memory, shared by all the clients of a process
+
+    Useful for tests and to share tokens between the clients of a pool
+    without writing them anywhere.
+    """
+
+    def __init__(self, lock_timeout=TOKEN_LOCK_TIMEOUT):
+        """
+        Initialises an empty store
+
+        :param lock_timeout: seconds to wait for the lock of a key before going
+        on without it
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.lock_timeout = lock_timeout
+        self._tokens = {}
+        self._cookies = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        """
+        Retrieves the token of a key
+
+        :param key: string
+        :return: Token namedtuple or None
+        """
+        with self._lock:
+            return self._tokens.get(key)
+
+    def save(self, key, token):
+        """
+        Keeps a token under a key
+
+        :param key: string
+        :param token: Token namedtuple
+        :return: boolean
+        """
+        with self._lock:
+            self._tokens[key] = token
+        return True
+
+    def delete(self, key):
+        """
+        Forgets the token of a key
+
+        :param key: string
+        :return: boolean
+        """
+        with self._lock:
+            return self._tokens.pop(key, None) is not None
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Holds the lock of a key
+
+        When the lock cannot be taken within the lock timeout, which means its
+        holder is stuck, the block runs without it.
+
+        :param key: string
+        :return: None
+        """
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        deadline = time.time() + self.lock_timeout
+        locked = key_lock.acquire(False)
+        while not locked:
+            if time.time() >= deadline:
+                self._logger.warning('Timed out waiting for the lock of {key}'.format(key=key))
+                break
+            time.sleep(TOKEN_LOCK_POLL_INTERVAL)
+            locked = key_lock.acquire(False)
+        try:
+            yield
+        finally:
+            if locked:
+                key_lock.release()
+
+    def compare_and_set(self, key, expected, token):
+        """
+        Keeps the token of a key if the kept one is the expected one
+
+        :param key: string
+        :param expected: Token namedtuple or None
+        :param token: Token namedtuple
+        :return: boolean
+        """
+        with self._lock:
+            if not is_same_token(self._tokens.get(key), expected):
+                return False
+            self._tokens[key] = token
+        return True
+
+    def load_cookies(self, key):
+        """
+        Retrieves a copy of the cookies of a key
+
+        :param key: string
+        :return: RequestsCookieJar instance or None
+        """
+        with self._lock:
+            content = self._cookies.get(key)
+        return load_cookie_jar(content) if content else None
+
+    def save_cookies(self, key, cookies):
+        """
+        Keeps a copy of the cookies of a key
+
+        :param key: string
+        :param cookies: CookieJar instance
+        :return: boolean
+        """
+        content = dump_cookie_jar(cookies)
+        with self._lock:
+            self._cookies[key] = content
+        return True
+
+
+class RedisTokenStore(TokenStore):
+    """
+    Keeps the tokens in Redis, shared by all the processes of all the hosts
+
+    Any server speaking the Redis protocol works, no Redis client library is
+    needed. The lock of a key is a Redis key set only if missing, with an
+    expiry so that it is released if its holder dies, and compare_and_set is
+    a transaction watching the token. Failures to reach the server are
+    logged and handled as a missing token, so clients fall back to logging
+    in by themselves.
+
+    Example:
+    --------
+        >>> store = RedisTokenStore('redis.internal', password=os.environ.get('REDIS_PASSWORD'))
+        >>> spotify = Spotify(..., token_store=store)
+    """
+
+    def __init__(self,
+                 host='localhost',
+                 port=6379,
+                 db=0,
+                 password=None,
+                 prefix=REDIS_KEY_PREFIX,
+                 lock_ttl=TOKEN_LOCK_TTL,
+                 lock_timeout=TOKEN_LOCK_TIMEOUT,
+                 timeout=REDIS_TIMEOUT):
+        """
+        Initialises the store, connections are opened on demand per thread
+
+        :param host: string
+        :param port: integer
+        :param db: integer with the number of the database
+        :param password: string or None
+        :param prefix: string prepended to the keys
+        :param lock_ttl: milliseconds a lock lives if it is not released
+        :param lock_timeout: seconds to wait for the lock of a key before going
+        on without it
+        :param timeout: seconds to wait for the server
+        """
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.host = host
+        self.port = port
+        self.db = db
+        self._password = password
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+        self.lock_timeout = lock_timeout
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _execute(self, *args):
+        """
+        Runs a command on the connection of the current thread
+
+        A connection failing with anything but an error reply of the server
+        may be out of step with its replies, so it is dropped and the next
+        command opens a new one.
+
+        :param args: command and its arguments
+        :return: reply of the server
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = RespConnection(self.host, self.port, self.timeout, self._password, self.db)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        try:
+            return connection.execute(*args)
+        except RespError:
+            raise
+        except Exception:
+            self._local.connection = None
+            self._discard(connection)
+            raise
+
+    def _end_transaction(self, queued):
+        """
+        Leaves a transaction an error interrupted
+
+        Sends DISCARD when commands were queued and UNWATCH otherwise, so a
+        later transaction on the connection does not inherit its state.
+
+        :param queued: boolean, True after MULTI
+        :return: None
+        """
+        if getattr(self._local, 'connection', None) is None:
+            return
+        try:
+            self._execute('DISCARD' if queued else 'UNWATCH')
+        except (socket.error, RespError):
+            self._logger.debug('Could not end the transaction')
+
+    def _discard(self, connection):
+        """
+        Closes a connection and forgets it
+
+        :param connection: RespConnection instance
+        :return: None
+        """
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        connection.close()
+
+    def close(self):
+        """
+        Closes the connections of all the threads
+
+        :return: None
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+    def load(self, key):
+        """
+        Reads the token of a key
+
+        :param key: string
+        :return: Token namedtuple or None
+        """
+        try:
+            content = self._execute('GET', self.prefix + key)
+        except (socket.error, RespError):
+            self._logger.exception('Could not load token for {key}'.format(key=key))
+            return None
+        try:
+            return load_token(content) if content else None
+        except (ValueError, KeyError, TypeError):
+            self._logger.debug('No usable token stored for {key}'.format(key=key))
+            return None
+
+    def save(self, key, token):
+        """
+        Writes the token of a key
+
+        :param key: string
+        :param token: Token namedtuple
+        :return: boolean
+        """
+        try:
+            return self._execute('SET', self.prefix + key, dump_token(token)) == 'OK'
+        except (socket.error, RespError):
+            self._logger.exception('Could not store token for {key}'.format(key=key))
+            return False
+
+    def delete(self, key):
+        """
+        Deletes the token of a key
+
+        :param key: string
+        :return: boolean
+        """
+        try:
+            return self._execute('DEL', self.prefix + key) > 0
+        except (socket.error, RespError):
+            self._logger.exception('Could not delete token for {key}'.format(key=key))
+            return False
+
+    def compare_and_set(self, key, expected, token):
+        """
+        Stores the token of a key in a transaction watching the stored one
+
+        :param key: string
+        :param expected: Token namedtuple or None
+        :param token: Token namedtuple
+        :return: boolean
+        """
+        name = self.prefix + key
+        state = None
+        try:
+            self._execute('WATCH', name)
+            state = 'watching'
+            content = self._execute('GET', name)
+            try:
+                current = load_token(content) if content else None
+            except (ValueError, KeyError, TypeError):
+                current = None
+            if not is_same_token(current, expected):
+                return False
+            self._execute('MULTI')
+            state = 'queued'
+            self._execute('SET', name, dump_token(token))
+            result = self._execute('EXEC')
+            state = None
+            return result is not None
+        except (socket.error, RespError):
+            self._logger.exception('Could not store token for {key}'.format(key=key))
+            return False
+        finally:
+            if state:
+                self._end_transaction(state == 'queued')
+
+    def load_cookies(self, key):
+        """
+        Reads the cookies of a key
+
+        :param key: string
+        :return: RequestsCookieJar instance or None
+        """
+        try:
+            content = self._execute('GET', '{prefix}{key}:cookies'.format(prefix=self.prefix, key=key))
+        except (socket.error, RespError):
+            self._logger.exception('Could not load cookies for {key}'.format(key=key))
+            return None
+        try:
+            return load_cookie_jar(content) if content else None
+        except (ValueError, KeyError, TypeError):
+            self._logger.debug('No usable cookies stored for {key}'.format(key=key))
+            return None
+
+    def save_cookies(self, key, cookies):
+        """
+        Writes the cookies of a key
+
+        :param key: string
+        :param cookies: CookieJar instance
+        :return: boolean
+        """
+        name = '{prefix}{key}:cookies'.format(prefix=self.prefix, key=key)
+        try:
+            return self._execute('SET', name, dump_cookie_jar(cookies)) == 'OK'
+        except (socket.error, RespError):
+            self._logger.exception('Could not store cookies for {key}'.format(key=key))
+            return False
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Holds the lock key of a token
+
+        The lock key holds a random value so that only its holder releases it.
+        When it cannot be taken within the lock timeout, or the server cannot
+        be reached, the block runs without it.
+
+        :param key: string
+        :return: None
+        """
+        name = '{prefix}{key}:lock'.format(prefix=self.prefix, key=key)
+        value = binascii.hexlify(os.urandom(16))
+        deadline = time.time() + self.lock_timeout
+        locked = False
+        try:
+            while not locked:
+                locked = self._execute('SET', name, value, 'NX', 'PX', self.lock_ttl) == 'OK'
+                if not locked:
+                    if time.time() >= deadline:
+                        self._logger.warning('Timed out waiting for the lock of {key}'.format(key=key))
+                        break
+                    time.sleep(TOKEN_LOCK_POLL_INTERVAL)
+        except (socket.error, RespError):
+            self._logger.exception('Could not take the lock of {key}'.format(key=key))
+        try:
+            yield
+        finally:
+            if locked:
+                self._release(name, value)
+
+    def _release(self, name, value):
+        """
+        Deletes a lock key if it still holds the value of its holder
+
+        :param name: string with the lock key
+        :param value: string set by the holder
+        :return: boolean
+        """
+        state = None
+        try:
+            self._execute('WATCH', name)
+            state = 'watching'
+            if self._execute('GET', name) != value:
+                return False
+            self._execute('MULTI')
+            state = 'queued'
+            self._execute('DEL', name)
+            result = self._execute('EXEC')
+            state = None
+            return result is not None
+        except (socket.error, RespError):
+            self._logger.exception('Could not release the lock {name}'.format(name=name))
+            return False
+        finally:
+            if state:
+                self._end_transaction(state == 'queued')
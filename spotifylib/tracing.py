@@ -0,0 +1,422 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: tracing.py
+
+"""
+Tracing of the authentication flow
+
+The authenticator opens a span for the whole authentication and a child span
+for every step of the login flow and every token refresh, so a slow start can
+be pinned down to the step causing it. Tracers decide what happens to the
+finished spans: the collecting tracer keeps them in memory and optionally
+writes them to a file as JSON lines, the OTLP tracer sends them to any
+OpenTelemetry collector over OTLP/HTTP with JSON encoding.
+"""
+
+from Queue import Queue, Empty, Full
+from contextlib import contextmanager
+from collections import deque
+from constants import *
+
+import binascii
+import json
+import logging
+import os
+import requests
+import threading
+import time
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+def get_random_id(size):
+    """
+    Creates a random identifier as OpenTelemetry does
+
+    :param size: integer with the bytes of the identifier
+    :return: string with the hexadecimal representation
+    """
+    return binascii.hexlify(os.urandom(size))
+
+
+class Span(object):
+    """
+    Timed operation within a trace
+
+    Spans opened while another one is open in the same thread are its
+    children and share its trace.
+    """
+
+    def __init__(self, name, parent=None, attributes=None):
+        """
+        Starts the span
+
+        :param name: string
+        :param parent: Span instance or None for the root of a new trace
+        :param attributes: dictionary
+        """
+        self.name = name
+        self.trace_id = parent.trace_id if parent else get_random_id(16)
+        self.span_id = get_random_id(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time = None
+        self.error = None
+
+    @property
+    def duration(self):
+        """
+        Seconds the span lasted, or has lasted so far if still open
+
+        :return: float
+        """
+        return (self.end_time or time.time()) - self.start_time
+
+    def set_attribute(self, key, value):
+        """
+        Adds an attribute to the span
+
+        :param key: string
+        :param value: string, number or boolean
+        :return: None
+        """
+        self.attributes[key] = value
+
+    def to_dict(self):
+        """
+        Exports the span
+
+        :return: dictionary
+        """
+        return {'name': self.name,
+                'trace_id': self.trace_id,
+                'span_id': self.span_id,
+                'parent_id': self.parent_id,
+                'attributes': self.attributes,
+                'start_time': self.start_time,
+                'end_time': self.end_time,
+                'duration': self.duration,
+                'error': self.error}
+
+
+class Tracer(object):
+    """
+    Opens spans and exports them once finished
+
+    Subclasses implement export.
+    """
+
+    def __init__(self):
+        """
+        Initialises the tracer
+        """
+        self._local = threading.local()
+
+    @property
+    def current_span(self):
+        """
+        Span open in the current thread
+
+        :return: Span instance or None
+        """
+        return getattr(self._local, 'span', None)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Opens a span for the duration of the block
+
+        An exception raised in the block is recorded in the span and raised
+        again.
+
+        Example:
+        --------
+            >>> with tracer.span('spotify.login.authorize', username='wizzler') as span:
+            ...     span.set_attribute('status', 200)
+
+        :param name: string
+        :param attributes: attributes of the span
+        :return: Span instance
+        """
+        parent = self.current_span
+        span = Span(name, parent, attributes)
+        self._local.span = span
+        try:
+            yield span
+        except Exception as error:
+            span.error = repr(error)
+            raise
+        finally:
+            span.end_time = time.time()
+            self._local.span = parent
+            self.export(span)
+
+    def export(self, span):
+        """
+        Handles a finished span
+
+        :param span: Span instance
+        :return: None
+        """
+        raise NotImplementedError
+
+
+class NullTracer(object):
+    """
+    Tracer that records nothing, used when no tracing is wanted
+    """
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Runs the block without tracing it
+
+        :param name: string
+        :param attributes: attributes of the span
+        :return: None
+        """
+        yield None
+
+
+class CollectingTracer(Tracer):
+    """
+    Keeps the latest finished spans in memory
+
+    With a path, spans are also appended to that file as JSON lines to be
+    collected from every host of a fleet.
+    """
+
+    def __init__(self, max_spans=TRACING_MAX_SPANS, path=None):
+        """
+        Initialises the tracer
+
+        :param max_spans: integer with the maximum spans kept in memory
+        :param path: string with the path of a file to append the spans to
+        """
+        super(CollectingTracer, self).__init__()
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self.path = os.path.abspath(os.path.expanduser(path)) if path else None
+
+    @property
+    def spans(self):
+        """
+        Finished spans in the order they finished
+
+        :return: list of Span instances
+        """
+        with self._lock:
+            return list(self._spans)
+
+    def export(self, span):
+        """
+        Keeps a finished span, appending it to the file if any
+
+        :param span: Span instance
+        :return: None
+        """
+        line = json.dumps(span.to_dict()) if self.path else None
+        with self._lock:
+            self._spans.append(span)
+            if line:
+                with open(self.path, 'a') as spans_file:
+                    spans_file.write(line + '\n')
+
+
+class OTLPTracer(Tracer):
+    """
+    Sends finished spans to an OpenTelemetry collector
+
+    Spans are queued and sent in batches from a background thread, using the
+    JSON encoding of OTLP over HTTP, so the traced code never waits for the
+    collector. Spans are dropped, and counted, when the queue is full or the
+    collector fails.
+    """
+
+    def __init__(self,
+                 endpoint,
+                 service_name=TRACING_SERVICE_NAME,
+                 batch_size=TRACING_BATCH_SIZE,
+                 interval=TRACING_FLUSH_INTERVAL,
+                 headers=None):
+        """
+        Initialises the tracer and starts its sending thread
+
+        :param endpoint: string with the base URL of the collector, like
+        http://localhost:4318
+        :param service_name: string identifying the service in the traces
+        :param batch_size: integer with the maximum spans per request
+        :param interval: maximum seconds a span waits to be sent
+        :param headers: dictionary with extra headers for the collector
+        """
+        super(OTLPTracer, self).__init__()
+        self._logger = logging.getLogger('{base}.{suffix}'
+                                         .format(base=LOGGER_BASENAME,
+                                                 suffix=self.__class__.__name__)
+                                         )
+        self.url = '{}/v1/traces'.format(endpoint.rstrip('/'))
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queue = Queue(maxsize=batch_size * TRACING_QUEUED_BATCHES)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='OTLPTracer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def export(self, span):
+        """
+        Queues a finished span to be sent, dropping it if the queue is full
+
+        :param span: Span instance
+        :return: None
+        """
+        try:
+            self._queue.put_nowait(span)
+        except Full:
+            self._drop(1)
+
+    def _drop(self, count):
+        """
+        Counts spans that could not be sent
+
+        :param count: integer
+        :return: None
+        """
+        with self._lock:
+            self.dropped += count
+
+    @staticmethod
+    def _get_attributes(attributes):
+        """
+        Encodes attributes as OTLP key values
+
+        :param attributes: dictionary
+        :return: list of dictionaries
+        """
+        encoded = []
+        for key, value in sorted(attributes.items()):
+            if isinstance(value, bool):
+                encoded_value = {'boolValue': value}
+            elif isinstance(value, (int, long)):
+                encoded_value = {'intValue': str(value)}
+            elif isinstance(value, float):
+                encoded_value = {'doubleValue': value}
+            else:
+                encoded_value = {'stringValue': unicode(value)}
+            encoded.append({'key': key, 'value': encoded_value})
+        return encoded
+
+    def encode(self, spans):
+        """
+        Builds the OTLP request for some spans
+
+        :param spans: list of Span instances
+        :return: dictionary
+        """
+        encoded = []
+        for span in spans:
+            status = {'code': 2, 'message': span.error} if span.error else {'code': 1}
+            encoded.append({'traceId': span.trace_id,
+                            'spanId': span.span_id,
+                            'parentSpanId': span.parent_id or '',
+                            'name': span.name,
+                            'kind': 1,
+                            'startTimeUnixNano': str(int(span.start_time * 1e9)),
+                            'endTimeUnixNano': str(int(span.end_time * 1e9)),
+                            'attributes': self._get_attributes(span.attributes),
+                            'status': status})
+        resource = {'attributes': self._get_attributes({'service.name': self.service_name})}
+        return {'resourceSpans': [{'resource': resource,
+                                   'scopeSpans': [{'scope': {'name': LOGGER_BASENAME},
+                                                   'spans': encoded}]}]}
+
+    def _take_batch(self):
+        """
+        Waits for spans up to the batch size or the interval
+
+        :return: list of Span instances
+        """
+        batch = []
+        deadline = time.time() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _send(self, batch):
+        """
+        Posts a batch of spans to the collector
+
+        :param batch: list of Span instances
+        :return: boolean
+        """
+        try:
+            response = requests.post(self.url, data=json.dumps(self.encode(batch)),
+                                     headers=self.headers, timeout=TRACING_TIMEOUT)
+        except requests.RequestException:
+            self._logger.warning('Could not reach the collector at {}'.format(self.url))
+            self._drop(len(batch))
+            return False
+        if not response.ok:
+            self._logger.warning('Collector refused {count} spans with status {status}'
+                                 .format(count=len(batch), status=response.status_code))
+            self._drop(len(batch))
+            return False
+        return True
+
+    def _run(self):
+        """
+        Sends batches until stopped
+
+        :return: None
+        """
+        while not self._stopped.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._send(batch)
+
+    def flush(self):
+        """
+        Sends all the queued spans right away
+
+        :return: None
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+            if len(batch) == self.batch_size:
+                self._send(batch)
+                batch = []
+        if batch:
+            self._send(batch)
+
+    def stop(self):
+        """
+        Stops the sending thread after sending the queued spans
+
+        :return: None
+        """
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python2.7
+# -*- coding: UTF-8 -*-
+# File: transport.py
+
+"""
+Request pipeline of the authenticated session
+
+Spotipy sends all its requests through the request method of the session it
+is given. The session here runs the API requests through a stack of
+middleware, every layer getting the request along with the callable sending
+it through the layers below it, down to the plain requests session. The
+authenticator is the top layer injecting and refreshing the token, retries,
+caching, rate limiting and anything else stack below it.
+
+Example:
+--------
+    >>> class Timing(Middleware):
+    ...     def handle(self, send, method, url, **kwargs):
+    ...         start = time.time()
+    ...         try:
+    ...             return send(method, url, **kwargs)
+    ...         finally:
+    ...             print(url, time.time() - start)
+    >>> spotify = Spotify(..., middleware=[Timing()])
+"""
+
+from functools import partial
+from requests import Session
+from constants import *
+from cache import ResponseCache
+from ratelimit import parse_retry_after
+
+import logging
+import time
+
+
+__author__ = '''Oriol Fabregas <fabregas.oriol@gmail.com>'''
+__docformat__ = 'plaintext'
+__date__ = '''18-09-2017'''
+
+# This is the main prefix used for logging
+LOGGER_BASENAME = '''spotifylib'''
+LOGGER = logging.getLogger(LOGGER_BASENAME)
+LOGGER.addHandler(logging.NullHandler())
+
+
+class Middleware(object):
+    """
+    Layer of the request pipeline
+
+    Subclasses implement handle, calling send to pass the request on to the
+    layers below, or not to answer it themselves, and return the response.
+    """
+
+    def handle(self, send, method, url, **kwargs):
+        """
+        Handles a request
+
+        :param send: callable sending the request through the layers below,
+        with the same arguments as this method but send
+        :param method: HTTP verb as upper case string
+        :param url: string
+        :param kwargs: keyword arguments of the request
+        :return: Response instance
+        """
+        raise NotImplementedError
+
+
+class CoalescingMiddleware(Middleware):
+    """
+    Sends identical GET requests in flight at the same time once
+
+    Requests only join one sent with the same token, so a request sent with
+    a refreshed token never gets the 401 of one sent with the previous token.
+    """
+
+    def __init__(self, coalescer, namespace):
+        """
+        Initialises the layer
+
+        :param coalescer: RequestCoalescer instance
+        :param namespace: string telling apart the requests of different users
+        """
+        self.coalescer = coalescer
+        self.namespace = namespace
+
+    def handle(self, send, method, url, **kwargs):
+        """
+        Sends a GET request unless an identical one is in flight
+
+        :param send: callable sending the request through the layers below
+        :param method: HTTP verb as upper case string
+        :param url: string
+        :param kwargs: keyword arguments of the request
+        :return: Response instance
+        """
+        if method != 'GET':
+            return send(method, url, **kwargs)
+        key = (ResponseCache.get_key(self.namespace, url, kwargs.get('params')),
+               (kwargs.get('headers') or {}).get('Authorization'))
+        return self.coalescer.call(key, partial(send, method, url, **kwargs))
+
+
+class CacheMiddleware(Middleware):
+    """
+    Serves GET requests from a response cache or revalidates them
+    """
+
+    def __init__(self, cache, namespace):
+        """
+        Initialises the layer
+
+        :param cache: ResponseCache instance
+        :param namespace: string telling apart the requests of different users
+        """
+        self.cache = cache
+        self.namespace = namespace
+
+    def handle(self, send, method, url, **kwargs):
+        """
+        Serves a GET request from the cache, sending it only when needed
+
+        :param send: callable sending the request through the layers below
+        :param method: HTTP verb as upper case string
+        :param url: string
+        :param kwargs: keyword arguments of the request
+        :return: Response instance
+        """
+        if method != 'GET':
+            return send(method, url, **kwargs)
+        key = ResponseCache.get_key(self.namespace, url, kwargs.get('params'))
+        kwargs['headers'] = kwargs.get('headers') or {}
+        return self.cache.request(partial(send, method, url, **kwargs), key, kwargs['headers'])
+
+
+class RetryMiddleware(Middleware):
+    """
+    Retries transient failures of idempotent requests
+    """
+
+    def __init__(self, policy):
+        """
+        Initialises the layer
+
+        :param policy: RetryPolicy instance
+        """
+        self.policy = policy
+
+    def handle(self, send, method, url, **kwargs):
+        """
+        Sends a request, retrying it if idempotent
+
+        :param send: callable sending the request through the layers below
+        :param method: HTTP verb as upper case string
+        :param url: string
+        :param kwargs: keyword arguments of the request
+        :return: Response instance
+        """
+        if method not in IDEMPOTENT_METHODS:
+            return send(method, url, **kwargs)
+        return self.policy.call(send, method, url, **kwargs)
+
+
+class ThrottlingMiddleware(Middleware):
+    """
+    Sends requests through a rate limiter and holds them when throttled
+
+    A 429 pauses the host for the time given in its Retry-After header and
+    the request waits to be sent again, as any other request to that host.
+    The per host limit is applied too if any.
+    """
+
+    def __init__(self, rate_limiter, retries=THROTTLE_RETRIES, host_limiter=None):
+        """
+        Initialises the layer
+
+        :param rate_limiter: RateLimiter instance
+        :param retries: integer with the times a throttled request is held and
+        sent again before returning the 429
+        :param host_limiter: HostLimiter instance or None
+        """
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.host_limiter = host_limiter
+
+    def handle(self, send, method, url, **kwargs):
+        """
+        Sends a request within the rate limit, holding it when throttled
+
+        :param send: callable sending the request through the layers below
+        :param method: HTTP verb as upper case string
+        :param url: string
+        :param kwargs: keyword arguments of the request
+        :return: Response instance
+        """
+        for _ in range(self.retries + 1):
+            self.rate_limiter.acquire(url)
+            if not self.host_limiter:
+                response = send(method, url, **kwargs)
+            else:
+                with self.host_limiter.hold(url):
+                    response = send(method, url, **kwargs)
+            if response.status_code != 429:
+                break
+            self.rate_limiter.pause(url, parse_retry_after(response.headers.get('Retry-After'),
+                                                           THROTTLE_DEFAULT_DELAY))
+        return response
+
+
+class ConcurrencyMiddleware(Middleware):
+    """
+    Sends requests within the limit of an adaptive concurrency limiter
+    """
+
+    def __init__(self, limiter):
+        """
+        Initialises the layer
+
+        :param limiter: AdaptiveLimiter instance
+        """
+        self.limiter = limiter
+
+    def handle(self, send, method, url, **kwargs):
+        """
+        Sends a request once the limiter lets it, reporting how it went
+
+        :param send: callable sending the request through the layers below
+        :param method: HTTP verb as upper case string
+        :param url: string
+        :param kwargs: keyword arguments of the request
+        :return: Response instance
+        """
+        self.limiter.acquire()
+        start = time.time()
+        status_code = None
+        try:
+            response = send(method, url, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            self.limiter.release(status_code, time.time() - start)
+
+
+class SpotifySession(Session):
+    """
+    Requests session running the API requests through middleware
+
+    Only requests to the URLs under the prefix of the API run through the
+    middleware and get the token. Anything else, the login flow, the token
+    endpoint, redirects or other hosts, is sent as is, so refreshing a token
+    never goes through the layer refreshing it and the token never leaves
+    the API.
+
+    The pipeline is composed once, when the middleware changes, so a request
+    only pays for the layers themselves.
+    """
+
+    def __init__(self, middleware=(), prefix=None):
+        """
+        Initialises the session
+
+        :param middleware: list of Middleware instances, the first one is the
+        outermost layer
+        :param prefix: string with the URL prefix of the requests run through
+        the middleware, all of them if None
+        """
+        super(SpotifySession, self).__init__()
+        self.prefix = prefix
+        self.parent = None
+        self.middleware = list(middleware)
+        self._pipeline = self._compose()
+
+    def _compose(self):
+        """
+        Chains the layers from the innermost, the plain session, outwards
+
+        :return: callable with the arguments of handle but send
+        """
+        send = super(SpotifySession, self).request
+        for layer in reversed(self.middleware):
+            send = partial(layer.handle, send)
+        return send
+
+    def use(self, middleware, index=None):
+        """
+        Adds a layer to the pipeline
+
+        :param middleware: Middleware instance
+        :param index: integer with the position of the layer, the innermost if
+        None
+        :return: None
+        """
+        if index is None:
+            self.middleware.append(middleware)
+        else:
+            self.middleware.insert(index, middleware)
+        self._pipeline = self._compose()
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request through the pipeline if its URL is under the prefix
+
+        :param method: HTTP verb as string
+        :param url: string
+        :param kwargs: keyword arguments of requests
+        :return: Response instance
+        """
+        if self.prefix and not url.startswith(self.prefix):
+            return super(SpotifySession, self).request(method, url, **kwargs)
+        response = self._pipeline(method.upper(), url, **kwargs)
+        response.connection = SharedConnection(getattr(response, 'connection', None))
+        return response
+
+
+class SharedConnection(object):
+    """
+    Wraps the adapter a response was received through
+
+    Spotipy closes the connection of every response once it is done with it,
+    which for requests means closing the adapter and all the pooled
+    connections of the session, including the ones other threads are still
+    using. This wrapper ignores that close so the pool stays usable.
+    """
+    def __init__(self, adapter):
+        """
+        Initialises the wrapper around an adapter
+
+        :param adapter: HTTPAdapter instance, None for cached responses
+        """
+        self._adapter = adapter
+
+    def __getattr__(self, name):
+        """
+        Delegates everything else to the adapter
+
+        :param name: string
+        :return: attribute of the adapter
+        """
+        return getattr(self._adapter, name)
+
+    def close(self):
+        """
+        Leaves the adapter open, it is closed with the session
+
+        :return: None
+        """
+        pass
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+fakes
+----------------------------------
+Fake servers shared by the tests.
+"""
+
+from SocketServer import StreamRequestHandler, ThreadingTCPServer
+
+import threading
+import time
+
+
+class FakeRedisHandler(StreamRequestHandler):
+    """
+    Speaks enough of the Redis protocol for RedisTokenStore
+
+    Every write bumps the version of its key, a transaction fails when a key
+    it watches changed since. Commands listed in the raw replies of the server
+    get that reply as is instead.
+    """
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        arguments = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    def _encode(self, value):
+        if value is None:
+            return '$-1\r\n'
+        if isinstance(value, int):
+            return ':{}\r\n'.format(value)
+        if isinstance(value, list):
+            return '*{}\r\n{}'.format(len(value), ''.join(self._encode(item) for item in value))
+        if value in ('OK', 'QUEUED', 'PONG'):
+            return '+{}\r\n'.format(value)
+        return '${}\r\n{}\r\n'.format(len(value), value)
+
+    def _run(self, name, arguments):
+        server = self.server
+        now = time.time()
+        if name == 'GET':
+            value, expires_at = server.data.get(arguments[0], (None, None))
+            return value if expires_at is None or expires_at > now else None
+        if name == 'SET':
+            key, value, options = arguments[0], arguments[1], [option.upper() for option in arguments[2:]]
+            current = self._run('GET', [key])
+            if 'NX' in options and current is not None:
+                return None
+            expires_at = now + int(options[options.index('PX') + 1]) / 1000.0 if 'PX' in options else None
+            server.data[key] = (value, expires_at)
+            server.versions[key] = server.versions.get(key, 0) + 1
+            return 'OK'
+        if name == 'DEL':
+            deleted = [key for key in arguments if server.data.pop(key, None)]
+            for key in deleted:
+                server.versions[key] = server.versions.get(key, 0) + 1
+            return len(deleted)
+        if name == 'PING':
+            return 'PONG'
+        return 'OK'
+
+    def handle(self):
+        watched, queued = {}, None
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            name, arguments = command[0].upper(), command[1:]
+            if name in self.server.raw_replies:
+                self.wfile.write(self.server.raw_replies[name])
+                continue
+            with self.server.lock:
+                if name == 'WATCH':
+                    watched.update((key, self.server.versions.get(key, 0)) for key in arguments)
+                    reply = 'OK'
+                elif name == 'UNWATCH':
+                    watched, reply = {}, 'OK'
+                elif name == 'MULTI':
+                    queued, reply = [], 'OK'
+                elif name == 'DISCARD':
+                    watched, queued, reply = {}, None, 'OK'
+                elif name == 'EXEC':
+                    changed = any(self.server.versions.get(key, 0) != version for key, version in watched.items())
+                    reply = None if changed else [self._run(*entry) for entry in queued]
+                    watched, queued = {}, None
+                elif queued is not None:
+                    queued.append((name, arguments))
+                    reply = 'QUEUED'
+                else:
+                    reply = self._run(name, arguments)
+            if name == 'EXEC' and reply is None:
+                self.wfile.write('*-1\r\n')
+            else:
+                self.wfile.write(self._encode(reply))
+
+
+class FakeRedisServer(ThreadingTCPServer):
+    """
+    Redis server on a free local port keeping its data in memory
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), FakeRedisHandler)
+        self.data = {}
+        self.versions = {}
+        self.raw_replies = {}
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass
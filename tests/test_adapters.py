@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_adapters
+----------------------------------
+Tests for `adapters` module.
+"""
+
+import pickle
+import socket
+import time
+import unittest
+
+from requests import Request, Session
+
+from spotifylib import Spotify, Token, PoolAdapter, MemoryTokenStore, StubServer, map_concurrently, API_SITE, SITE
+
+
+class TestPoolAdapter(unittest.TestCase):
+
+    def test_pool_settings_are_applied(self):
+        adapter = PoolAdapter(pool_size=16, pool_block=True)
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'], 16)
+        self.assertTrue(adapter.poolmanager.connection_pool_kw['block'])
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+                      adapter.poolmanager.connection_pool_kw['socket_options'])
+
+    def test_connections_are_closed_without_keep_alive(self):
+        adapter = PoolAdapter(keep_alive=False)
+        request = Request('GET', API_SITE).prepare()
+        adapter.add_headers(request)
+        self.assertEqual(request.headers['Connection'], 'close')
+        self.assertNotIn('socket_options', adapter.poolmanager.connection_pool_kw)
+
+    def test_adapter_can_be_pickled(self):
+        adapter = pickle.loads(pickle.dumps(PoolAdapter(pool_size=4, keep_alive=False)))
+        self.assertFalse(adapter.keep_alive)
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'], 4)
+
+    def test_accounts_and_api_have_separate_pools(self):
+        store = MemoryTokenStore()
+        store.save('user', Token('token', 'Bearer', 3600, 'refresh', 'scope', time.time()))
+        spotify = Spotify('client', 'secret', 'user', 'password', 'http://127.0.0.1/callback', 'scope',
+                          token_store=store, pool_size=24, accounts_pool_size=3)
+        session = spotify.authenticator.session
+        api = session.get_adapter('{}/v1/me'.format(API_SITE))
+        accounts = session.get_adapter('{}/api/token'.format(SITE))
+        self.assertIsNot(api, accounts)
+        self.assertEqual(api.poolmanager.connection_pool_kw['maxsize'], 24)
+        self.assertEqual(accounts.poolmanager.connection_pool_kw['maxsize'], 3)
+
+    def test_blocking_pool_waits_for_a_free_connection(self):
+        with StubServer(latency=0.05) as stub:
+            stub.add_token('user', access_token='token')
+            url = '{}/v1/me'.format(stub.api_site)
+            connections = []
+            for block in (True, False):
+                session = Session()
+                adapter = PoolAdapter(pool_size=1, pool_block=block)
+                session.mount('{}/'.format(stub.api_site), adapter)
+                statuses = map_concurrently(lambda _: session.get(url, headers={'Authorization': 'Bearer token'})
+                                            .status_code, range(4), max_workers=4)
+                self.assertEqual(statuses, [200] * 4)
+                connections.append(adapter.poolmanager.connection_from_url(url).num_connections)
+                session.close()
+        self.assertEqual(connections[0], 1)
+        self.assertGreater(connections[1], 1)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cache
+----------------------------------
+Tests for `cache` module.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from spotifylib import ResponseCache, CatalogCache
+from spotifylib.cache import CacheEntry, parse_cache_control
+
+
+def get_entry(content, max_age=60, etag='"1"'):
+    return CacheEntry('https://api.spotify.com/v1/me', 200, {'ETag': etag}, content,
+                      'utf-8', etag, time.time() + max_age)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Test set up
+
+        Creates a directory for the persistent tier.
+        """
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Test tear down
+
+        Removes the directory of the persistent tier.
+        """
+        shutil.rmtree(self.directory)
+
+    def test_parse_cache_control(self):
+        self.assertEqual(parse_cache_control('public, max-age=3600, no-cache'),
+                         {'public': True, 'max-age': '3600', 'no-cache': True})
+        self.assertEqual(parse_cache_control(None), {})
+
+    def test_least_recently_used_are_evicted_over_the_cap(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.set('a', get_entry('12345'))
+        cache.set('b', get_entry('12345'))
+        cache.get('a')
+        cache.set('c', get_entry('12345'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.size, 10)
+
+    def test_persistent_tier_survives_restarts(self):
+        path = os.path.join(self.directory, 'cache.sqlite')
+        ResponseCache(path=path).set('a', get_entry('{"id": 1}'))
+        entry = ResponseCache(path=path).get('a')
+        self.assertEqual(entry.to_response().json(), {'id': 1})
+        self.assertEqual(entry.etag, '"1"')
+
+    def test_fresh_entries_are_served_without_request(self):
+        cache = ResponseCache()
+        cache.set('a', get_entry('{"id": 1}'))
+
+        def send():
+            raise AssertionError('Request sent for a fresh entry')
+
+        self.assertEqual(cache.request(send, 'a', {}).json(), {'id': 1})
+        self.assertEqual(cache.hits, 1)
+
+
+class TestCatalogCache(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Test set up
+
+        Creates a directory for the persistent tier.
+        """
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Test tear down
+
+        Removes the directory of the persistent tier.
+        """
+        shutil.rmtree(self.directory)
+
+    def test_objects_are_kept_per_namespace(self):
+        cache = CatalogCache()
+        cache.set_many('tracks', {'a': {'id': 'a'}})
+        self.assertEqual(cache.get_many('tracks', ['a', 'b']), {'a': {'id': 'a'}})
+        self.assertEqual(cache.get_many('tracks market=ES', ['a']), {})
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_objects_expire_after_ttl(self):
+        cache = CatalogCache(ttl=0.05)
+        cache.set_many('tracks', {'a': {'id': 'a'}})
+        time.sleep(0.1)
+        self.assertEqual(cache.get_many('tracks', ['a']), {})
+
+    def test_least_recently_used_are_evicted_over_the_cap(self):
+        cache = CatalogCache(max_items=2)
+        cache.set_many('tracks', {'a': 1, 'b': 2})
+        cache.get_many('tracks', ['a'])
+        cache.set_many('tracks', {'c': 3})
+        self.assertEqual(cache.get_many('tracks', ['a', 'b', 'c']), {'a': 1, 'c': 3})
+        self.assertEqual(len(cache), 2)
+
+    def test_persistent_tier_survives_restarts(self):
+        path = os.path.join(self.directory, 'catalog.sqlite')
+        CatalogCache(path=path).set_many('tracks', dict(('{}'.format(index), index) for index in range(1200)))
+        cache = CatalogCache(path=path)
+        self.assertEqual(len(cache.get_many('tracks', ['{}'.format(index) for index in range(1201)])), 1200)
+        self.assertEqual(len(cache), 1200)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_concurrency
+----------------------------------
+Tests for `concurrency` module.
+"""
+
+import threading
+import time
+import unittest
+
+from spotifylib import HostLimiter, RequestCoalescer, map_concurrently
+
+
+class TestHostLimiter(unittest.TestCase):
+
+    def test_requests_in_flight_per_host_stay_under_the_limit(self):
+        limiter = HostLimiter(2)
+        lock = threading.Lock()
+        in_flight = {'a': 0, 'b': 0}
+        peaks = {'a': 0, 'b': 0}
+
+        def request(host):
+            with limiter.hold('https://{}.example.com/v1/me'.format(host)):
+                with lock:
+                    in_flight[host] += 1
+                    peaks[host] = max(peaks[host], in_flight[host])
+                time.sleep(0.05)
+                with lock:
+                    in_flight[host] -= 1
+
+        map_concurrently(request, ['a', 'b'] * 6, max_workers=12)
+        self.assertEqual(peaks, {'a': 2, 'b': 2})
+
+
+class TestMapConcurrently(unittest.TestCase):
+
+    def test_results_keep_the_order_of_the_items(self):
+        results = map_concurrently(lambda item: time.sleep(0.01 * (5 - item)) or item * 2, range(5), max_workers=5)
+        self.assertEqual(results, [0, 2, 4, 6, 8])
+
+    def test_first_error_is_raised_once_all_calls_are_done(self):
+        calls = []
+
+        def function(item):
+            time.sleep(0.01 * (5 - item))
+            calls.append(item)
+            if item in (1, 3):
+                raise ValueError(item)
+            return item
+
+        with self.assertRaises(ValueError) as context:
+            map_concurrently(function, range(5), max_workers=5)
+        self.assertEqual(context.exception.args, (1,))
+        self.assertEqual(sorted(calls), range(5))
+
+
+class TestRequestCoalescer(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_call(self):
+        coalescer = RequestCoalescer()
+        calls = []
+
+        def function():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'id': 'user'}
+
+        results = map_concurrently(lambda _: coalescer.call('me', function), range(10), max_workers=10)
+        self.assertEqual(results, [{'id': 'user'}] * 10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((coalescer.calls, coalescer.coalesced), (1, 9))
+
+    def test_errors_are_raised_to_every_caller(self):
+        coalescer = RequestCoalescer()
+        started = threading.Event()
+        errors = []
+
+        def function():
+            started.set()
+            time.sleep(0.2)
+            raise ValueError('boom')
+
+        def call():
+            try:
+                coalescer.call('me', function)
+            except ValueError as error:
+                errors.append(error)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        call()
+        leader.join()
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(coalescer.coalesced, 1)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        coalescer = RequestCoalescer()
+        self.assertEqual([coalescer.call('me', lambda: 1) for _ in range(3)], [1, 1, 1])
+        self.assertEqual((coalescer.calls, coalescer.coalesced), (3, 0))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+----------------------------------
+Tests for `metrics` module.
+"""
+
+import unittest
+
+from spotifylib import MetricsRegistry
+from spotifylib.metrics import Histogram, get_endpoint
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_get_endpoint_replaces_ids(self):
+        self.assertEqual(get_endpoint('https://api.spotify.com/v1/users/wizzler/playlists?limit=50'),
+                         '/v1/users/{id}/playlists')
+        self.assertEqual(get_endpoint('https://api.spotify.com/v1/tracks/6rqhFgbbKwnb9MLmUQDhG6'),
+                         '/v1/tracks/{id}')
+        self.assertEqual(get_endpoint('https://api.spotify.com/v1/me/player/currently-playing'),
+                         '/v1/me/player/currently-playing')
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram(buckets=(0.1, 1, 10))
+        for value in [0.05] * 90 + [0.5] * 9 + [20]:
+            histogram.observe(value)
+        self.assertEqual(histogram.get_percentile(50), 0.1)
+        self.assertEqual(histogram.get_percentile(99), 1)
+        self.assertIsNone(histogram.get_percentile(100))
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.to_dict()['buckets'], [(0.1, 90), (1, 9), (10, 0), ('+Inf', 1)])
+
+    def test_registry_notifies_listeners(self):
+        metrics = MetricsRegistry()
+        events = []
+        metrics.add_listener(lambda *event: events.append(event))
+        metrics.add_listener(lambda *event: 1 / 0)
+        metrics.increment('api_responses', status=200)
+        metrics.increment('api_responses', status=200)
+        with metrics.timer('login_seconds'):
+            pass
+        self.assertEqual(metrics.get_counter('api_responses', status=200), 2)
+        self.assertEqual(metrics.get_counter('api_responses', status=500), 0)
+        self.assertEqual(metrics.get_histogram('login_seconds').count, 1)
+        self.assertEqual(events[0], ('counter', 'api_responses', 1, {'status': 200}))
+        self.assertEqual(events[-1][:2], ('histogram', 'login_seconds'))
+
+    def test_snapshot(self):
+        metrics = MetricsRegistry()
+        metrics.increment('logins')
+        metrics.observe('token_refresh_seconds', 0.2)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters'], [{'name': 'logins', 'labels': {}, 'value': 1}])
+        self.assertEqual(snapshot['histograms'][0]['count'], 1)
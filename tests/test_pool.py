@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_pool
+----------------------------------
+Tests for `pool` module.
+"""
+
+import threading
+import time
+import unittest
+
+from spotifylib import SpotifyPool, SpotifyError, Token, MemoryTokenStore, StubServer, authenticate_concurrently
+
+
+class CountingTokenStore(MemoryTokenStore):
+    """
+    Memory store recording how many tokens are loaded at once
+    """
+
+    def __init__(self):
+        super(CountingTokenStore, self).__init__()
+        self.loading = 0
+        self.peak = 0
+        self._counter_lock = threading.Lock()
+
+    def load(self, key):
+        with self._counter_lock:
+            self.loading += 1
+            self.peak = max(self.peak, self.loading)
+        time.sleep(0.05)
+        with self._counter_lock:
+            self.loading -= 1
+        return super(CountingTokenStore, self).load(key)
+
+
+class TestSpotifyPool(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Test set up
+
+        Registers three accounts with stored tokens so no login is needed.
+        """
+        store = MemoryTokenStore()
+        self.pool = SpotifyPool(max_clients=2, token_store=store)
+        for username in ('first', 'second', 'third'):
+            store.save(username, Token(username, 'Bearer', 3600, 'refresh', 'scope', time.time()))
+            self.pool.register('client', 'secret', username, 'password',
+                               'http://127.0.0.1/callback', 'scope')
+
+    def tearDown(self):
+        """
+        Test tear down
+
+        Closes all the clients of the pool.
+        """
+        self.pool.close()
+
+    def test_clients_are_reused(self):
+        client = self.pool.get('first')
+        self.assertIs(self.pool.get('first'), client)
+        self.assertEqual(client._auth, 'first')
+
+    def test_least_recently_used_is_evicted(self):
+        self.pool.get('first')
+        self.pool.get('second')
+        self.pool.get('first')
+        self.pool.get('third')
+        self.assertEqual(len(self.pool), 2)
+        self.assertIn('first', self.pool)
+        self.assertNotIn('second', self.pool)
+
+    def test_idle_clients_are_evicted(self):
+        self.pool.idle_timeout = 0.1
+        self.pool.get('first')
+        time.sleep(0.15)
+        self.pool.get('second')
+        self.assertNotIn('first', self.pool)
+        self.assertIn('second', self.pool)
+        self.assertEqual(self.pool.evict_idle(), 0)
+        time.sleep(0.15)
+        self.assertEqual(self.pool.evict_idle(), 1)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_api_connections_are_shared(self):
+        first = self.pool.get('first')
+        second = self.pool.get('second')
+        self.assertIs(first._session.get_adapter('https://api.spotify.com/v1/me'),
+                      second._session.get_adapter('https://api.spotify.com/v1/me'))
+        self.assertIsNot(first._session.get_adapter('https://accounts.spotify.com/api/token'),
+                         second._session.get_adapter('https://accounts.spotify.com/api/token'))
+
+    def test_unknown_account(self):
+        self.assertRaises(SpotifyError, self.pool.get, 'unknown')
+
+    def test_authenticate_all(self):
+        clients = self.pool.authenticate_all()
+        self.assertEqual(sorted(clients), ['first', 'second', 'third'])
+        self.assertEqual(clients['third']._auth, 'third')
+        self.assertEqual(clients['first'].authenticator.headers['Referer'],
+                         clients['second'].authenticator.headers['Referer'])
+        self.assertIsNot(clients['first'].authenticator._headers,
+                         clients['second'].authenticator._headers)
+
+    def test_lazy_clients_are_refused(self):
+        self.assertRaises(ValueError, SpotifyPool, lazy=True)
+
+
+class TestAuthenticateConcurrently(unittest.TestCase):
+
+    def test_clients_are_keyed_by_username_within_max_workers(self):
+        store = CountingTokenStore()
+        accounts = []
+        for index in range(6):
+            username = 'user-{}'.format(index)
+            store.save(username, Token(username, 'Bearer', 3600, 'refresh', 'scope', time.time()))
+            accounts.append({'client_id': 'client', 'client_secret': 'secret', 'username': username,
+                             'password': 'password', 'callback': 'http://127.0.0.1/callback', 'scope': 'scope'})
+        clients = authenticate_concurrently(accounts, max_workers=2, token_store=store)
+        self.assertEqual(sorted(clients), ['user-{}'.format(index) for index in range(6)])
+        self.assertEqual(set(username for username, client in clients.items() if client._auth == username),
+                         set(clients))
+        self.assertEqual(store.peak, 2)
+        for client in clients.values():
+            client.authenticator.close()
+
+    def test_clients_are_closed_when_a_login_fails(self):
+        accounts = [{'client_id': 'client', 'client_secret': 'secret', 'username': username,
+                     'password': 'password', 'callback': 'http://127.0.0.1/callback', 'scope': 'scope'}
+                    for username in ('first', 'second', 'bad', 'third')]
+        with StubServer(users={'first': 'password', 'second': 'password', 'third': 'password'}) as stub:
+            with self.assertRaises(SpotifyError) as context:
+                authenticate_concurrently(accounts, max_workers=4, background_refresh=True,
+                                          accounts_site=stub.accounts_site, api_site=stub.api_site)
+            self.assertEqual(stub.stats['grants'], 3)
+        self.assertIn('bad', str(context.exception))
+        deadline = time.time() + 2
+        while time.time() < deadline and any(thread.name.startswith('TokenRefresher')
+                                             for thread in threading.enumerate()):
+            time.sleep(0.05)
+        self.assertEqual([thread.name for thread in threading.enumerate() if thread.name.startswith('TokenRefresher')],
+                         [])
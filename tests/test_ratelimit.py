@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_ratelimit
+----------------------------------
+Tests for `ratelimit` module.
+"""
+
+from email.utils import formatdate
+
+import time
+import unittest
+
+from spotifylib import RateLimiter, AdaptiveLimiter
+from spotifylib.ratelimit import parse_retry_after
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('3', 1), 3)
+        self.assertEqual(parse_retry_after(None, 1), 1)
+        self.assertEqual(parse_retry_after('soon', 1), 1)
+        self.assertAlmostEqual(parse_retry_after(formatdate(time.time() + 10, usegmt=True), 1), 10, delta=1)
+
+    def test_rate_is_honoured(self):
+        limiter = RateLimiter(rate=50, burst=5)
+        start = time.time()
+        for _ in range(15):
+            limiter.acquire('https://api.spotify.com/v1/me')
+        self.assertGreaterEqual(time.time() - start, 0.18)
+
+    def test_pause_only_affects_its_host(self):
+        limiter = RateLimiter()
+        limiter.pause('https://api.spotify.com/v1/me', 10)
+        self.assertLess(limiter.acquire('https://accounts.spotify.com/api/token'), 0.1)
+        self.assertGreater(limiter.paused_until('https://api.spotify.com/v1/tracks'), time.time() + 9)
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_limit_grows_while_healthy(self):
+        limiter = AdaptiveLimiter(initial=2, maximum=4)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(200, 0.1)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_limit_is_cut_on_failures(self):
+        limiter = AdaptiveLimiter(initial=16, latency_threshold=1, cooldown=0)
+        limiter.acquire()
+        self.assertEqual(limiter.release(429, 0.1), 8)
+        limiter.acquire()
+        self.assertEqual(limiter.release(503, 0.1), 4)
+        limiter.acquire()
+        self.assertEqual(limiter.release(200, 2), 2)
+        limiter.acquire()
+        self.assertEqual(limiter.release(None, 0.1), 1)
+        limiter.acquire()
+        self.assertEqual(limiter.release(None, 0.1), 1)
+
+    def test_cooldown_counts_a_burst_once(self):
+        limiter = AdaptiveLimiter(initial=16, cooldown=60)
+        for _ in range(4):
+            limiter.acquire()
+        for _ in range(4):
+            limiter.release(429, 0.1)
+        self.assertEqual(limiter.limit, 8)
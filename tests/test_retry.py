@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_retry
+----------------------------------
+Tests for `retry` module.
+"""
+
+from requests.exceptions import ConnectionError
+
+import time
+import unittest
+
+from spotifylib import RetryPolicy
+
+
+class Response(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Test set up
+
+        Creates a policy with short delays.
+        """
+        self.policy = RetryPolicy('test', max_attempts=3, base_delay=0.01, max_delay=0.02)
+
+    def test_exceptions_are_retried_until_success(self):
+        outcomes = [ConnectionError(), ConnectionError(), 'ok']
+
+        def call():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(self.policy.call(call), 'ok')
+        self.assertEqual(self.policy.retries, 2)
+        self.assertEqual(self.policy.exhausted, 0)
+
+    def test_last_exception_is_raised_when_giving_up(self):
+        def call():
+            raise ConnectionError('down')
+
+        self.assertRaises(ConnectionError, self.policy.call, call)
+        self.assertEqual(self.policy.retries, 2)
+        self.assertEqual(self.policy.exhausted, 1)
+
+    def test_retryable_responses(self):
+        responses = [Response(503), Response(502), Response(503)]
+        result = self.policy.call(lambda: responses.pop(0))
+        self.assertEqual(result.status_code, 503)
+        self.assertEqual(self.policy.exhausted, 1)
+
+    def test_other_errors_are_not_retried(self):
+        self.assertRaises(ValueError, self.policy.call, int, 'not a number')
+        self.assertEqual(self.policy.call(lambda: Response(404)).status_code, 404)
+        self.assertEqual(self.policy.retries, 0)
+
+    def test_deadline(self):
+        policy = RetryPolicy('test', max_attempts=100, base_delay=0.05, max_delay=0.05, deadline=0.2)
+        start = time.time()
+        self.assertEqual(policy.call(lambda: Response(503)).status_code, 503)
+        self.assertLess(time.time() - start, 0.3)
+
+    def test_delay_is_capped(self):
+        for attempt in range(1, 10):
+            self.assertLessEqual(self.policy.get_delay(attempt), 0.02)
@@ -8,6 +8,19 @@ Tests for `spotifylib` module.
 """
 
 from betamax.fixtures import unittest
+from unittest import TestCase
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from tests.fakes import FakeRedisServer
+from spotifylib import (Spotify, Token, FileTokenStore, MemoryTokenStore, RedisTokenStore, AdaptiveLimiter, RetryPolicy,
+                        ResponseCache, CatalogCache, RequestCoalescer, Middleware, MetricsRegistry, CollectingTracer,
+                        StubServer, SpotifyError, map_concurrently)
 
 
 class TestSpotifylib(unittest.BetamaxTestCase):
@@ -27,3 +40,422 @@ class TestSpotifylib(unittest.BetamaxTestCase):
         This is where you should tear down what you've setup in setUp before. This method is called after every test.
         """
         pass
+
+
+def log_in(accounts_site, api_site, directory):
+    spotify = Spotify('client', 'secret', 'shared', 'password', 'http://127.0.0.1/callback', 'scope',
+                      token_store=FileTokenStore(directory), accounts_site=accounts_site, api_site=api_site)
+    spotify.authenticator.close()
+
+
+class TestAuthenticatedClient(TestCase):
+
+    def setUp(self):
+        """
+        Test set up
+
+        Starts a stub server and points the client to it. The stored token is
+        valid locally but unknown to the server, so the first request of every
+        thread gets a 401.
+        """
+        self.stub = StubServer(saved_tracks=25).start()
+        self.stub.add_token('user', refresh_token='refresh')
+        self.stub.set_latency(0.05, path='/api/token')
+        self.spotify = self._create_spotify()
+
+    def _create_spotify(self, username='user', token=None, **kwargs):
+        store = kwargs.pop('token_store', None) or MemoryTokenStore()
+        store.save(username, token or Token('stale', 'Bearer', 3600, 'refresh', 'scope', time.time()))
+        return Spotify('client', 'secret', username, 'password',
+                       'http://127.0.0.1/callback', 'scope',
+                       token_store=store,
+                       accounts_site=self.stub.accounts_site,
+                       api_site=self.stub.api_site,
+                       **kwargs)
+
+    def tearDown(self):
+        """
+        Test tear down
+
+        Stops the stub server.
+        """
+        self.stub.stop()
+
+    def _get_chunks(self):
+        return [len(request.query['ids'].split(',')) for request in self.stub.get_requests('/v1/tracks/')]
+
+    def test_single_refresh_under_load(self):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(self.spotify.me())
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+
+        threads = [threading.Thread(target=call) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 50)
+        self.assertEqual(self.stub.stats['refreshes'], 1)
+        self.assertEqual(self.spotify._auth, 'token-1')
+
+    def test_full_login_flow(self):
+        spotify = Spotify('client', 'secret', 'fresh', 'password',
+                          'http://127.0.0.1/callback', 'scope',
+                          accounts_site=self.stub.accounts_site,
+                          api_site=self.stub.api_site)
+        self.assertEqual(spotify.me()['id'], 'fresh')
+        self.assertEqual((self.stub.stats['authorizations'], self.stub.stats['logins'],
+                          self.stub.stats['approvals'], self.stub.stats['grants']), (1, 1, 1, 1))
+        self.assertIn(('fresh', 'client'), self.stub.approvals)
+        self.assertEqual(spotify.authenticator.token.refresh_token, 'refresh-1')
+
+    def test_wrong_password_is_refused(self):
+        self.stub.users = {'user': 'password'}
+        self.assertRaises(SpotifyError, Spotify, 'client', 'secret', 'user', 'wrong',
+                          'http://127.0.0.1/callback', 'scope',
+                          accounts_site=self.stub.accounts_site,
+                          api_site=self.stub.api_site)
+        self.assertEqual(self.stub.stats['logins'], 0)
+
+    def test_expired_tokens_are_refreshed(self):
+        self.stub.add_token('user', access_token='stale')
+        self.assertEqual(self.spotify.me()['id'], 'user')
+        self.stub.expire_tokens()
+        self.assertEqual(self.spotify.me()['id'], 'user')
+        self.assertEqual(self.stub.stats['unauthorized'], 1)
+        self.assertEqual(self.spotify._auth, 'token-1')
+
+    def test_tokens_about_to_expire_are_refreshed_ahead(self):
+        spotify = self._create_spotify(token=Token('stale', 'Bearer', 3600, 'refresh', 'scope', time.time() - 3590))
+        self.assertEqual(spotify.me()['id'], 'user')
+        self.assertEqual((self.stub.stats['refreshes'], self.stub.stats['unauthorized']), (1, 0))
+        self.assertEqual([request.headers.getheader('Authorization') for request in self.stub.get_requests('/v1/')],
+                         ['Bearer token-1'])
+
+    def test_background_refresher_renews_the_token_before_expiry(self):
+        self.stub.token_ttl = 7200
+        spotify = self._create_spotify(background_refresh=True, refresh_margin=3599.8)
+        deadline = time.time() + 5
+        while spotify.authenticator.token.access_token == 'stale' and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(spotify.authenticator.token.access_token, 'token-1')
+        self.assertEqual(spotify.me()['id'], 'user')
+        self.assertEqual((self.stub.stats['refreshes'], self.stub.stats['unauthorized']), (1, 0))
+        spotify.authenticator.close()
+
+    def test_closing_ends_the_background_refresher(self):
+        spotify = self._create_spotify(background_refresh=True)
+        refresher = spotify.authenticator._refresher
+        self.assertTrue(refresher.is_alive())
+        spotify.authenticator.close()
+        refresher.join(1)
+        self.assertFalse(refresher.is_alive())
+        self.assertFalse(spotify.authenticator.stop())
+
+    def test_processes_sharing_a_store_log_in_once(self):
+        directory = tempfile.mkdtemp()
+        self.stub.set_latency(0.1, path='/api/login')
+        processes = [multiprocessing.Process(target=log_in,
+                                             args=(self.stub.accounts_site, self.stub.api_site, directory))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        shutil.rmtree(directory)
+        self.assertEqual([process.exitcode for process in processes], [0] * 4)
+        self.assertEqual(self.stub.stats['logins'], 1)
+
+    def test_token_refreshed_by_another_process_is_adopted(self):
+        directory = tempfile.mkdtemp()
+        self.stub.add_token('user', access_token='stale')
+        metrics = MetricsRegistry()
+        first = self._create_spotify(token_store=FileTokenStore(directory))
+        second = self._create_spotify(token_store=FileTokenStore(directory), metrics=metrics)
+        self.stub.expire_tokens()
+        first.me()
+        self.assertEqual(second.me()['id'], 'user')
+        shutil.rmtree(directory)
+        self.assertEqual(self.stub.stats['refreshes'], 1)
+        self.assertEqual(second._auth, 'token-1')
+        self.assertEqual(metrics.get_counter('token_refreshes', outcome='adopted'), 1)
+
+    def test_nodes_sharing_a_redis_store_refresh_once(self):
+        server = FakeRedisServer()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.stub.add_token('user', access_token='stale')
+        stores = [RedisTokenStore(port=server.server_address[1]) for _ in range(3)]
+        nodes = [self._create_spotify(token_store=store) for store in stores]
+        self.stub.expire_tokens()
+        self.assertEqual(map_concurrently(lambda node: node.me()['id'], nodes, max_workers=3), ['user'] * 3)
+        for store in stores:
+            store.close()
+        server.shutdown()
+        server.server_close()
+        self.assertEqual(self.stub.stats['refreshes'], 1)
+        self.assertEqual(set(node._auth for node in nodes), set(['token-1']))
+
+    def test_token_stored_first_by_another_node_is_adopted(self):
+        store = MemoryTokenStore()
+        spotify = self._create_spotify(token_store=store)
+        stale = store.load('user')
+        winner = Token('winner', 'Bearer', 3600, 'refresh', 'scope', time.time())
+        store.save('user', winner)
+        renewed = Token('renewed', 'Bearer', 3600, 'refresh', 'scope', time.time())
+        self.assertEqual(spotify.authenticator._publish_token(stale, renewed), winner)
+        store.save('user', winner._replace(issued_at=0))
+        self.assertEqual(spotify.authenticator._publish_token(stale, renewed), renewed)
+        self.assertEqual(store.load('user'), renewed)
+
+    def test_login_reuses_the_session_and_approval_of_the_previous_one(self):
+        directory = tempfile.mkdtemp()
+        metrics = MetricsRegistry()
+        spotify = Spotify('client', 'secret', 'fresh', 'password', 'http://127.0.0.1/callback', 'scope',
+                          token_store=FileTokenStore(directory), metrics=metrics,
+                          accounts_site=self.stub.accounts_site, api_site=self.stub.api_site)
+        spotify.authenticator.close()
+        store = FileTokenStore(directory)
+        store.save('fresh', store.load('fresh')._replace(issued_at=0))
+        self.stub.revoke_refresh_tokens()
+        spotify = Spotify('client', 'secret', 'fresh', 'password', 'http://127.0.0.1/callback', 'scope',
+                          token_store=store, metrics=metrics,
+                          accounts_site=self.stub.accounts_site, api_site=self.stub.api_site)
+        self.assertEqual(spotify.me()['id'], 'fresh')
+        shutil.rmtree(directory)
+        self.assertEqual((self.stub.stats['authorizations'], self.stub.stats['redirects'], self.stub.stats['logins'],
+                          self.stub.stats['approvals'], self.stub.stats['grants']), (2, 1, 1, 1, 2))
+        self.assertEqual(metrics.get_counter('login_steps_skipped', step='accept'), 1)
+
+    def test_redirects_leaving_the_accounts_site_are_refused(self):
+        location = '{}/en/authorize'.format(self.stub.accounts_site.replace('127.0.0.1', 'localhost'))
+        self.stub.inject(302, count=1, path='/en/authorize', headers={'Location': location}, body={})
+        start = time.time()
+        self.assertRaises(SpotifyError, Spotify, 'client', 'secret', 'fresh', 'password',
+                          'http://127.0.0.1/callback', 'scope',
+                          accounts_site=self.stub.accounts_site, api_site=self.stub.api_site)
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(len(self.stub.get_requests('/en/authorize')), 1)
+
+    def test_expired_session_is_dropped_whatever_the_rejection(self):
+        store = MemoryTokenStore()
+        for fault in (None, (302, {'Location': '/en/login'}), (403, None)):
+            store.delete('fresh')
+            self.stub.expire_sessions()
+            if fault:
+                self.stub.inject(fault[0], count=1, path='/en/authorize/accept', headers=fault[1], body={})
+            spotify = Spotify('client', 'secret', 'fresh', 'password', 'http://127.0.0.1/callback', 'scope',
+                              token_store=store, accounts_site=self.stub.accounts_site, api_site=self.stub.api_site)
+            self.assertEqual(spotify.me()['id'], 'fresh')
+            spotify.authenticator.close()
+        self.assertEqual((self.stub.stats['logins'], self.stub.stats['faults']), (3, 2))
+        self.assertEqual([cookie.name for cookie in store.load_cookies('fresh')].count('sp_dc'), 1)
+
+    def test_relative_redirects_of_the_authorization_page_are_followed(self):
+        location = '/en/authorize?client_id=client&response_type=code&redirect_uri=http%3A%2F%2F127.0.0.1%2Fcallback'
+        self.stub.inject(302, count=1, path='/en/authorize', headers={'Location': location}, body={})
+        spotify = Spotify('client', 'secret', 'fresh', 'password', 'http://127.0.0.1/callback', 'scope',
+                          accounts_site=self.stub.accounts_site, api_site=self.stub.api_site)
+        self.assertEqual(spotify.me()['id'], 'fresh')
+        self.assertEqual([request.path for request in self.stub.get_requests('/en/authorize')],
+                         ['/en/authorize', '/en/authorize', '/en/authorize/accept'])
+        self.assertEqual((self.stub.stats['faults'], self.stub.stats['authorizations']), (1, 1))
+
+    def test_login_skips_the_steps_the_session_allows(self):
+        store = MemoryTokenStore()
+        metrics = MetricsRegistry()
+        for reset in (lambda: None, self.stub.approvals.clear, self.stub.expire_sessions):
+            store.delete('fresh')
+            reset()
+            spotify = Spotify('client', 'secret', 'fresh', 'password', 'http://127.0.0.1/callback', 'scope',
+                              token_store=store, metrics=metrics,
+                              accounts_site=self.stub.accounts_site, api_site=self.stub.api_site)
+            spotify.authenticator.close()
+        self.assertEqual((self.stub.stats['redirects'], self.stub.stats['logins'], self.stub.stats['approvals']),
+                         (0, 2, 3))
+        self.assertEqual(metrics.get_counter('login_steps_skipped', step='login'), 1)
+        self.assertEqual(metrics.get_counter('logins'), 3)
+
+    def test_stored_token_is_only_discarded_when_rejected(self):
+        store = MemoryTokenStore()
+        deleted = []
+        store.delete = deleted.append
+        expired = Token('expired', 'Bearer', 3600, 'refresh', 'scope', time.time() - 3600)
+        self.stub.inject(503, count=1, path='/api/token')
+        self._create_spotify(token=expired, token_store=store,
+                             refresh_retry=RetryPolicy('refresh', max_attempts=1)).authenticator.close()
+        self.assertEqual((deleted, self.stub.stats['logins']), ([], 1))
+        self.stub.revoke_refresh_tokens()
+        self._create_spotify(token=expired, token_store=store).authenticator.close()
+        self.assertEqual((deleted, self.stub.stats['logins']), (['user'], 1))
+
+    def test_lazy_authentication_happens_once(self):
+        spotify = self._create_spotify('lazy', Token('expired', 'Bearer', 3600, 'refresh', 'scope', time.time() - 3600),
+                                       lazy=True)
+        self.assertIsNone(spotify.authenticator.token)
+        self.assertEqual(self.stub.stats['refreshes'], 0)
+        threads = [threading.Thread(target=spotify.me) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.stub.stats['refreshes'], 1)
+        self.assertEqual(spotify._auth, 'token-1')
+        self.assertEqual(spotify.authenticator._token_store.load('lazy').access_token, 'token-1')
+
+    def test_iterate_streams_all_pages(self):
+        self.stub.add_token('user', access_token='stale')
+        first_page = self.spotify.current_user_saved_tracks(limit=10)
+        for prefetch in (0, 1, 3):
+            items = [item['track']['id'] for item in self.spotify.iterate(first_page, prefetch=prefetch)]
+            self.assertEqual(items, [str(index) for index in range(25)])
+
+    def test_iterate_wrapped_paging(self):
+        self.stub.add_token('user', access_token='stale')
+        result = {'tracks': self.spotify.current_user_saved_tracks(limit=10)}
+        self.assertEqual(len(list(self.spotify.iterate(result))), 25)
+
+    def test_fetch_all_keeps_order(self):
+        self.stub.add_token('user', access_token='stale')
+        self.stub.saved_tracks = 95
+        first_page = self.spotify.current_user_saved_tracks(limit=10)
+        items = [item['track']['id'] for item in self.spotify.fetch_all(first_page, max_workers=4)]
+        self.assertEqual(items, [str(index) for index in range(95)])
+
+    def test_bulk_tracks_chunks_and_deduplicates(self):
+        self.stub.add_token('user', access_token='stale')
+        self.stub.missing_ids.add('missing')
+        ids = ['{}'.format(index % 120) for index in range(200)]
+        ids.append('spotify:track:missing')
+        tracks = self.spotify.bulk_tracks(ids, max_workers=4)
+        self.assertEqual([track['id'] for track in tracks[:-1]], ids[:-1])
+        self.assertIsNone(tracks[-1])
+        self.assertEqual(sorted(self._get_chunks()), [21, 50, 50])
+
+    def test_bulk_tracks_only_requests_catalog_cache_misses(self):
+        self.stub.add_token('user', access_token='stale')
+        self.stub.missing_ids.add('missing')
+        self.spotify.catalog_cache = CatalogCache()
+        self.spotify.bulk_tracks(['{}'.format(index) for index in range(60)] + ['missing'])
+        tracks = self.spotify.bulk_tracks(['{}'.format(index) for index in range(40, 80)] + ['missing'])
+        self.assertEqual([track['id'] for track in tracks[:-1]], ['{}'.format(index) for index in range(40, 80)])
+        self.assertEqual(sorted(self._get_chunks()), [11, 21, 50])
+        self.assertEqual(self.spotify.catalog_cache.hits, 20)
+
+    def test_throttled_requests_are_held_and_sent_again(self):
+        self.stub.add_token('user', access_token='stale')
+        self.stub.throttle(count=2, retry_after=0.2, path='/v1/me')
+        start = time.time()
+        self.assertEqual(self.spotify.me()['id'], 'user')
+        self.assertGreaterEqual(time.time() - start, 0.4)
+
+    def test_adaptive_limiter_wraps_api_requests(self):
+        self.stub.add_token('user', access_token='stale')
+        self.stub.saved_tracks = 200
+        limiter = AdaptiveLimiter(initial=2)
+        spotify = self._create_spotify(concurrency_limiter=limiter)
+        first_page = spotify.current_user_saved_tracks(limit=10)
+        self.assertEqual(len(spotify.fetch_all(first_page, max_workers=8)), 200)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertGreater(limiter.limit, 2)
+
+    def test_transient_failures_of_reads_are_retried(self):
+        self.stub.add_token('user', access_token='stale')
+        self.stub.inject(503, count=2, path='/v1/me')
+        policy = RetryPolicy('api', max_attempts=3, base_delay=0.01)
+        spotify = self._create_spotify(api_retry=policy)
+        self.assertEqual(spotify.me()['id'], 'user')
+        self.assertEqual(policy.retries, 2)
+
+    def test_transient_failures_of_the_token_endpoint_are_retried(self):
+        self.stub.inject(502, count=1, path='/api/token')
+        spotify = self._create_spotify(refresh_retry=RetryPolicy('refresh', base_delay=0.01))
+        self.assertEqual(spotify.me()['id'], 'user')
+        self.assertEqual(self.stub.stats['refreshes'], 1)
+
+    def test_identical_requests_in_flight_are_coalesced(self):
+        self.stub.add_token('user', access_token='stale')
+        self.stub.set_latency(0.2, path='/v1/me')
+        coalescer = RequestCoalescer()
+        spotify = self._create_spotify(request_coalescer=coalescer)
+        results = map_concurrently(lambda _: spotify.me()['id'], range(10), max_workers=10)
+        self.assertEqual(results, ['user'] * 10)
+        self.assertEqual(len(self.stub.get_requests('/v1/me')), 1)
+        self.assertEqual(coalescer.coalesced, 9)
+
+    def test_requests_with_a_refreshed_token_are_not_coalesced_with_older_ones(self):
+        self.stub.set_latency(0.3, path='/v1/me')
+        spotify = self._create_spotify()
+        thread = threading.Thread(target=spotify.me)
+        thread.start()
+        time.sleep(0.05)
+        spotify.track('refreshing')
+        self.assertEqual(spotify.me()['id'], 'user')
+        thread.join()
+        self.assertEqual(self.stub.stats['refreshes'], 1)
+        self.assertEqual(self.stub.stats['unauthorized'], 2)
+
+    def test_responses_are_revalidated_with_etag(self):
+        self.stub.add_token('user', access_token='stale')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = ResponseCache(path=os.path.join(directory, 'cache.sqlite'))
+        spotify = self._create_spotify(response_cache=cache)
+        self.assertEqual(spotify.me()['display_name'], 'user')
+        self.assertEqual(spotify.me()['display_name'], 'user')
+        self.assertEqual(self.stub.stats['not_modified'], 1)
+        self.stub.profiles['user'] = {'id': 'user', 'display_name': 'renamed'}
+        self.assertEqual(spotify.me()['display_name'], 'renamed')
+        self.assertEqual((cache.misses, cache.revalidations), (2, 1))
+
+    def test_only_api_requests_get_the_token(self):
+        session = self.spotify.authenticator.session
+        other_host = self.stub.api_site.replace('127.0.0.1', 'localhost')
+        self.assertEqual(session.get('{}/v1/me'.format(other_host)).status_code, 401)
+        self.assertEqual(session.get('{}/v1/me'.format(self.stub.api_site)).status_code, 200)
+        self.assertEqual([request.headers.getheader('Authorization') for request in self.stub.get_requests('/v1/me')],
+                         [None, 'Bearer stale', 'Bearer token-1'])
+
+    def test_middleware_sees_authenticated_requests(self):
+        self.stub.add_token('user', access_token='stale')
+        seen = []
+
+        class Recorder(Middleware):
+            def handle(self, send, method, url, **kwargs):
+                seen.append((method, kwargs['headers']['Authorization']))
+                return send(method, url, **kwargs)
+
+        spotify = self._create_spotify(middleware=[Recorder()])
+        self.assertEqual(spotify.me()['id'], 'user')
+        self.assertEqual(seen, [('GET', 'Bearer stale')])
+
+    def test_metrics_record_requests_and_refreshes(self):
+        metrics = MetricsRegistry()
+        self.stub.inject(503, count=1, path='/v1/me')
+        spotify = self._create_spotify(metrics=metrics, api_retry=RetryPolicy('api', base_delay=0.01, metrics=metrics))
+        self.assertEqual(spotify.me()['id'], 'user')
+        self.assertEqual(metrics.get_counter('api_responses', endpoint='/v1/me', status=401), 1)
+        self.assertEqual(metrics.get_counter('api_responses', endpoint='/v1/me', status=503), 1)
+        self.assertEqual(metrics.get_counter('api_responses', endpoint='/v1/me', status=200), 1)
+        self.assertEqual(metrics.get_counter('token_refreshes', outcome='renewed'), 1)
+        self.assertEqual(metrics.get_counter('retries', policy='api'), 1)
+        self.assertEqual(metrics.get_histogram('api_request_seconds', endpoint='/v1/me', method='GET').count, 3)
+        self.assertGreater(metrics.get_counter('api_received_bytes', endpoint='/v1/me'), 0)
+
+    def test_authentication_and_refreshes_are_traced(self):
+        tracer = CollectingTracer()
+        self._create_spotify('traced', Token('expired', 'Bearer', 3600, 'refresh', 'scope', time.time() - 3600),
+                             tracer=tracer)
+        refresh, restore, authenticate = tracer.spans
+        self.assertEqual([span.name for span in tracer.spans],
+                         ['spotify.token.refresh', 'spotify.token.restore', 'spotify.authenticate'])
+        self.assertEqual(refresh.parent_id, restore.span_id)
+        self.assertEqual(restore.parent_id, authenticate.span_id)
+        self.assertEqual(authenticate.attributes, {'username': 'traced'})
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_stubserver
+----------------------------------
+Tests for `stubserver` module.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+import requests
+
+from spotifylib import StubServer
+
+
+class TestStubServer(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Test set up
+
+        Starts a stub with a registered token.
+        """
+        self.stub = StubServer().start()
+        self.stub.add_token('user', access_token='token')
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = 'Bearer token'
+
+    def tearDown(self):
+        """
+        Test tear down
+
+        Stops the stub.
+        """
+        self.session.close()
+        self.stub.stop()
+
+    def _get(self, path, **kwargs):
+        return self.session.get('{}{}'.format(self.stub.api_site, path), **kwargs)
+
+    def test_unknown_tokens_are_expired(self):
+        response = requests.get('{}/v1/me'.format(self.stub.api_site), headers={'Authorization': 'Bearer other'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['error']['message'], 'The access token expired')
+
+    def test_faults_are_served_in_order(self):
+        self.stub.inject(503, count=1, path='/v1/me')
+        self.stub.throttle(count=1, retry_after=2, path='/v1/')
+        self.assertEqual(self._get('/v1/me').status_code, 503)
+        response = self._get('/v1/me')
+        self.assertEqual((response.status_code, response.headers['Retry-After']), (429, '2'))
+        self.assertEqual(self._get('/v1/me').status_code, 200)
+        self.assertEqual(self.stub.stats['faults'], 2)
+
+    def test_bulk_limits_are_enforced(self):
+        ids = ','.join(str(index) for index in range(21))
+        self.assertEqual(self._get('/v1/albums/', params={'ids': ids}).status_code, 400)
+        self.assertEqual(len(self._get('/v1/tracks/', params={'ids': ids}).json()['tracks']), 21)
+
+    def test_routes_can_be_added(self):
+        self.stub.add_route('GET', r'^/v1/playlists/([^/]+)$',
+                            lambda request, playlist: (200, {'id': playlist, 'owner': request.username}))
+        self.assertEqual(self._get('/v1/playlists/first').json(), {'id': 'first', 'owner': 'user'})
+        self.assertEqual(self._get('/v1/unknown').status_code, 404)
+
+    def test_login_needs_the_csrf_token(self):
+        response = requests.post('{}/api/login'.format(self.stub.accounts_site),
+                                 data={'username': 'user', 'password': 'password', 'csrf_token': 'forged'})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'errorCSRF'}))
+
+    def test_sites_can_be_set_from_the_environment(self):
+        environment = dict(os.environ, SPOTIFYLIB_ACCOUNTS_SITE='http://127.0.0.1:8001/',
+                           SPOTIFYLIB_API_SITE='http://127.0.0.1:8002')
+        output = subprocess.check_output([sys.executable, '-c',
+                                          'from spotifylib import TOKEN_URL, API_URL; print(TOKEN_URL, API_URL)'],
+                                         env=environment)
+        self.assertEqual(output.strip(), "('http://127.0.0.1:8001/api/token', 'http://127.0.0.1:8002/v1/')")
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_tokenstore
+----------------------------------
+Tests for `tokenstore` module.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from requests.cookies import RequestsCookieJar
+from spotifylib import Token, FileTokenStore, MemoryTokenStore, RedisTokenStore
+from tests.fakes import FakeRedisServer
+
+
+def hold_lock(directory, locked, seconds):
+    with FileTokenStore(directory).lock('user'):
+        locked.set()
+        time.sleep(seconds)
+
+
+class TestFileTokenStore(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Test set up
+
+        Creates a store in a temporary directory for every test.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.store = FileTokenStore(self.directory)
+        self.token = Token('access', 'Bearer', 3600, 'refresh', 'scope', time.time())
+
+    def tearDown(self):
+        """
+        Test tear down
+
+        Removes the temporary directory of the store.
+        """
+        shutil.rmtree(self.directory)
+
+    def test_save_and_load(self):
+        self.assertTrue(self.store.save('user', self.token))
+        self.assertEqual(self.store.load('user'), self.token)
+        self.assertEqual(os.listdir(self.directory), ['user.json'])
+
+    def test_load_missing_or_corrupted(self):
+        self.assertIsNone(self.store.load('user'))
+        with open(os.path.join(self.directory, 'user.json'), 'w') as token_file:
+            token_file.write('{"access_token": ')
+        self.assertIsNone(self.store.load('user'))
+
+    def test_delete(self):
+        self.store.save('user', self.token)
+        self.assertTrue(self.store.delete('user'))
+        self.assertFalse(self.store.delete('user'))
+        self.assertIsNone(self.store.load('user'))
+
+    def test_expiry(self):
+        self.assertFalse(self.token.is_expired())
+        self.assertTrue(self.token.is_expired(margin=3600))
+        expired = self.token._replace(issued_at=time.time() - 3601)
+        self.assertTrue(expired.is_expired())
+
+    def _hold_lock_in_process(self, seconds):
+        locked = multiprocessing.Event()
+        process = multiprocessing.Process(target=hold_lock, args=(self.directory, locked, seconds))
+        process.start()
+        self.assertTrue(locked.wait(5))
+        return process
+
+    def test_lock_excludes_other_processes(self):
+        process = self._hold_lock_in_process(0.3)
+        start = time.time()
+        with self.store.lock('user'):
+            self.assertGreaterEqual(time.time() - start, 0.2)
+        process.join()
+
+    def test_lock_gives_up_after_timeout(self):
+        process = self._hold_lock_in_process(1)
+        store = FileTokenStore(self.directory, lock_timeout=0.1)
+        start = time.time()
+        with store.lock('user'):
+            self.assertLess(time.time() - start, 0.5)
+        process.join()
+
+    def test_compare_and_set(self):
+        other = self.token._replace(access_token='other')
+        self.assertTrue(self.store.compare_and_set('user', None, self.token))
+        self.assertFalse(self.store.compare_and_set('user', None, other))
+        self.assertTrue(self.store.compare_and_set('user', self.token, other))
+        self.assertEqual(self.store.load('user'), other)
+
+    def test_compare_and_set_while_holding_the_lock(self):
+        store = FileTokenStore(self.directory, lock_timeout=1)
+        start = time.time()
+        with store.lock('user'):
+            self.assertTrue(store.compare_and_set('user', None, self.token))
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_cookies_are_kept_for_the_owner_only(self):
+        cookies = RequestsCookieJar()
+        cookies.set('sp_dc', 'session', domain='accounts.spotify.com', path='/', rest={'HttpOnly': None})
+        cookies.set('gone', 'value', domain='accounts.spotify.com', path='/', expires=time.time() - 1)
+        self.assertIsNone(self.store.load_cookies('user'))
+        self.assertTrue(self.store.save_cookies('user', cookies))
+        loaded = self.store.load_cookies('user')
+        self.assertEqual(loaded.get_dict(), {'sp_dc': 'session'})
+        self.assertTrue(list(loaded)[0].has_nonstandard_attr('HttpOnly'))
+        self.assertEqual(os.stat(os.path.join(self.directory, 'user.cookies')).st_mode & 0o777, 0o600)
+
+
+class TestMemoryTokenStore(unittest.TestCase):
+
+    def test_compare_and_set(self):
+        store = MemoryTokenStore()
+        token = Token('access', 'Bearer', 3600, 'refresh', 'scope', time.time())
+        self.assertTrue(store.compare_and_set('user', None, token))
+        self.assertFalse(store.compare_and_set('user', None, token._replace(access_token='other')))
+        self.assertEqual(store.load('user'), token)
+        with store.lock('user'):
+            self.assertTrue(store.compare_and_set('user', token, token._replace(access_token='other')))
+        self.assertTrue(store.delete('user'))
+
+    def test_lock_gives_up_after_timeout(self):
+        store = MemoryTokenStore(lock_timeout=0.1)
+        held = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with store.lock('user'):
+                held.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait(5)
+        start = time.time()
+        with store.lock('user'):
+            self.assertLess(time.time() - start, 0.5)
+        release.set()
+        thread.join()
+        with store.lock('user'):
+            pass
+
+
+class TestRedisTokenStore(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Test set up
+
+        Starts a fake Redis server and a store using it.
+        """
+        self.server = FakeRedisServer()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.store = RedisTokenStore(port=self.server.server_address[1], lock_timeout=1)
+        self.token = Token('access', 'Bearer', 3600, 'refresh', 'scope', time.time())
+
+    def tearDown(self):
+        """
+        Test tear down
+
+        Stops the fake server.
+        """
+        self.store.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_save_load_and_delete(self):
+        self.assertIsNone(self.store.load('user'))
+        self.assertTrue(self.store.save('user', self.token))
+        self.assertEqual(self.store.load('user'), self.token)
+        self.assertIn('spotifylib:token:user', self.server.data)
+        self.assertTrue(self.store.delete('user'))
+        self.assertFalse(self.store.delete('user'))
+
+    def test_compare_and_set(self):
+        other = self.token._replace(access_token='other')
+        self.assertTrue(self.store.compare_and_set('user', None, self.token))
+        self.assertFalse(self.store.compare_and_set('user', None, other))
+        self.assertTrue(self.store.compare_and_set('user', self.token, other))
+        self.assertEqual(self.store.load('user'), other)
+
+    def test_interrupted_transaction_is_ended(self):
+        self.server.raw_replies['SET'] = '-ERR injected\r\n'
+        self.assertFalse(self.store.compare_and_set('user', None, self.token))
+        del self.server.raw_replies['SET']
+        other = RedisTokenStore(port=self.server.server_address[1])
+        other.save('user', self.token)
+        other.close()
+        self.assertTrue(self.store.compare_and_set('other', None, self.token))
+        self.assertEqual(self.store.load('other'), self.token)
+
+    def test_connection_is_dropped_on_an_unknown_reply(self):
+        self.store.save('user', self.token)
+        self.server.raw_replies['GET'] = '?garbage\r\n'
+        self.assertIsNone(self.store.load('user'))
+        self.assertEqual(self.store._connections, [])
+        del self.server.raw_replies['GET']
+        self.assertEqual(self.store.load('user'), self.token)
+
+    def test_only_one_compare_and_set_wins(self):
+        self.store.save('user', self.token)
+        results = []
+
+        def replace(index):
+            store = RedisTokenStore(port=self.server.server_address[1])
+            results.append(store.compare_and_set('user', self.token, self.token._replace(access_token=str(index))))
+            store.close()
+
+        threads = [threading.Thread(target=replace, args=(index,)) for index in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+    def test_lock_excludes_other_holders(self):
+        order = []
+
+        def hold():
+            with self.store.lock('user'):
+                order.append('second')
+
+        with self.store.lock('user'):
+            thread = threading.Thread(target=hold)
+            thread.start()
+            time.sleep(0.2)
+            order.append('first')
+        thread.join()
+        self.assertEqual(order, ['first', 'second'])
+        self.assertNotIn('spotifylib:token:user:lock', self.server.data)
+
+    def test_save_and_load_cookies(self):
+        cookies = RequestsCookieJar()
+        cookies.set('sp_dc', 'session', domain='accounts.spotify.com', path='/')
+        self.assertTrue(self.store.save_cookies('user', cookies))
+        self.assertIn('spotifylib:token:user:cookies', self.server.data)
+        self.assertEqual(self.store.load_cookies('user').get_dict(), {'sp_dc': 'session'})
+
+    def test_unreachable_server_is_a_missing_token(self):
+        self.server.shutdown()
+        self.server.server_close()
+        store = RedisTokenStore(port=self.server.server_address[1], lock_timeout=0.1)
+        self.assertIsNone(store.load('user'))
+        self.assertFalse(store.save('user', self.token))
+        with store.lock('user'):
+            pass
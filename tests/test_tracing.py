@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_tracing
+----------------------------------
+Tests for `tracing` module.
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from spotifylib import CollectingTracer, OTLPTracer
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        self.server.requests.append((self.path, json.loads(body)))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Test set up
+
+        Creates a directory for the span files.
+        """
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Test tear down
+
+        Removes the directory of the span files.
+        """
+        shutil.rmtree(self.directory)
+
+    def test_nested_spans_share_the_trace(self):
+        tracer = CollectingTracer()
+        with tracer.span('spotify.authenticate', username='user'):
+            with tracer.span('spotify.login.authorize'):
+                pass
+        child, root = tracer.spans
+        self.assertEqual(child.trace_id, root.trace_id)
+        self.assertEqual(child.parent_id, root.span_id)
+        self.assertIsNone(root.parent_id)
+        self.assertEqual(root.attributes, {'username': 'user'})
+        self.assertIsNone(tracer.current_span)
+
+    def test_errors_are_recorded(self):
+        tracer = CollectingTracer()
+        with self.assertRaises(ValueError):
+            with tracer.span('spotify.token.refresh'):
+                raise ValueError('boom')
+        self.assertEqual(tracer.spans[0].error, "ValueError('boom',)")
+
+    def test_spans_are_written_as_json_lines(self):
+        path = os.path.join(self.directory, 'spans.jsonl')
+        tracer = CollectingTracer(max_spans=1, path=path)
+        for name in ('first', 'second'):
+            with tracer.span(name):
+                pass
+        with open(path) as spans_file:
+            self.assertEqual([json.loads(line)['name'] for line in spans_file], ['first', 'second'])
+        self.assertEqual([span.name for span in tracer.spans], ['second'])
+
+    def test_spans_are_sent_to_the_collector(self):
+        server = HTTPServer(('127.0.0.1', 0), CollectorHandler)
+        server.requests = []
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        tracer = OTLPTracer('http://127.0.0.1:{}/'.format(server.server_address[1]), interval=0.1)
+        with tracer.span('spotify.authenticate', username='user', attempt=1):
+            with tracer.span('spotify.login.token'):
+                pass
+        tracer.stop()
+        server.shutdown()
+        server.server_close()
+        path, body = server.requests[0]
+        self.assertEqual(path, '/v1/traces')
+        resource = body['resourceSpans'][0]
+        self.assertEqual(resource['resource']['attributes'],
+                         [{'key': 'service.name', 'value': {'stringValue': 'spotifylib'}}])
+        child, root = resource['scopeSpans'][0]['spans']
+        self.assertEqual(child['parentSpanId'], root['spanId'])
+        self.assertEqual(len(root['traceId']), 32)
+        self.assertEqual(root['attributes'], [{'key': 'attempt', 'value': {'intValue': '1'}},
+                                              {'key': 'username', 'value': {'stringValue': 'user'}}])
+        self.assertEqual(tracer.dropped, 0)